@@ -0,0 +1,109 @@
+"""
+The annotation formatter as it was before the single-pass rewrite.
+
+Kept only as a baseline for format_benchmark.py to compare against.
+"""
+
+# pylint:skip-file
+import html
+from typing import Any
+
+MAX_TEXT_LENGTH = 2000
+NONE_TEXT = "(None)"
+
+
+def normalize_title(text: str) -> str:
+    text = html.escape(text)
+    return " ".join(text.split())
+
+
+def format_annotation(
+    annotation: dict[str, Any], group_name: str | None = None
+) -> dict[str, Any]:
+    summary = _build_annotation_summary(annotation, group_name)
+    fields = _build_annotation_fields(annotation)
+    return {
+        "type": "section",
+        "text": {"type": "mrkdwn", "text": summary},
+        "fields": fields,
+    }
+
+
+def _get_quote(annotation: dict[str, Any]) -> str:
+    for target in annotation["target"]:
+        for selector in target["selector"]:
+            if exact := selector.get("exact"):
+                return _trim_text(exact)
+    raise ValueError()
+
+
+def _trim_text(text: str) -> str:
+    stub = "..."
+    if len(text) > MAX_TEXT_LENGTH:
+        return text[: MAX_TEXT_LENGTH - len(stub)] + stub
+    return text
+
+
+def _get_text(annotation: dict[str, Any]) -> str:
+    text = annotation.get("text")
+    if not text:
+        text = NONE_TEXT
+    return _trim_text(text)
+
+
+def _build_annotation_summary(
+    annotation: dict[str, Any], group_name: str | None = None
+) -> str:
+    username = html.escape(annotation["user"].split(":")[1].split("@")[0])
+    display_name = html.escape(annotation["user_info"]["display_name"] or "")
+    uri = annotation["uri"]
+
+    try:
+        title = normalize_title(annotation["document"]["title"][0])
+    except Exception:
+        title = None
+    if title:
+        document_link = f"<{uri}|{title}>"
+    else:
+        document_link = uri
+
+    formatted_user = (
+        f"`{username}` ({display_name})" if display_name else f"`{username}`"
+    )
+    formatted_group = f" in `{group_name}`" if group_name else ""
+    return f"{formatted_user} annotated {document_link}{formatted_group}:"
+
+
+def _build_annotation_fields(annotation: dict[str, Any]) -> list[dict[str, Any]]:
+    quote = None
+    try:
+        quote = _get_quote(annotation)
+    except Exception:
+        pass
+    incontext_link = annotation["links"]["incontext"]
+
+    if quote:
+        fields = [
+            {"type": "mrkdwn", "text": "*Quote:*"},
+            {
+                "type": "mrkdwn",
+                "text": f"*Annotation* (<{incontext_link}|in-context link>):",
+            },
+            {"type": "plain_text", "text": quote},
+        ]
+    elif annotation.get("references"):
+        fields = [
+            {
+                "type": "mrkdwn",
+                "text": f"*Reply* (<{incontext_link}|in-context link>):",
+            },
+        ]
+    else:
+        fields = [
+            {
+                "type": "mrkdwn",
+                "text": f"*Page Note* (<{incontext_link}|in-context link>):",
+            },
+        ]
+    fields.append({"type": "plain_text", "text": _get_text(annotation)})
+    return fields
@@ -0,0 +1,59 @@
+"""Synthetic annotations for the benchmarks."""
+
+import random
+from datetime import UTC, datetime, timedelta
+
+from slack_annotations.models import Annotation
+
+WORDS = "the quick brown fox jumps over a lazy dog <b>&amp;</b> annotate".split()
+
+START = datetime(2024, 12, 1, tzinfo=UTC)
+
+
+def make_corpus(size, seed=0, quote_words=30, selectors=3):
+    """
+    Return size annotations in created order.
+
+    A mix of annotations with quotes (quote_words long, the quote in the last
+    of selectors selectors), replies and page notes, with and without titles
+    and display names.
+    """
+    rng = random.Random(seed)
+
+    def sentence(length):
+        return " ".join(rng.choice(WORDS) for _ in range(length))
+
+    corpus = []
+    for i in range(size):
+        uri = f"https://example.com/{i % 1000}"
+        annotation = {
+            "id": f"id_{i}",
+            "created": (START + timedelta(milliseconds=i)).isoformat(),
+            "user": f"acct:user_{i % 500}@hypothes.is",
+            "uri": uri,
+            "text": sentence(rng.randint(0, 60)),
+            "links": {"incontext": f"https://hyp.is/id_{i}/example.com/"},
+            "user_info": {"display_name": rng.choice([None, f"User {i % 500}"])},
+        }
+        if rng.random() < 0.8:
+            annotation["document"] = {"title": [sentence(8)]}
+        kind = rng.random()
+        if kind < 0.6:
+            annotation["target"] = [
+                {
+                    "source": uri,
+                    "selector": [
+                        {"type": "RangeSelector"} for _ in range(selectors - 1)
+                    ]
+                    + [{"type": "TextQuoteSelector", "exact": sentence(quote_words)}],
+                }
+            ]
+        elif kind < 0.8:
+            annotation["references"] = [f"id_{i - 1}"]
+        corpus.append(annotation)
+    return corpus
+
+
+def make_annotations(size, keep_raw=False, **kwargs):
+    """Return make_corpus()'s annotations parsed as Annotation objects."""
+    return [Annotation.from_row(row, keep_raw) for row in make_corpus(size, **kwargs)]
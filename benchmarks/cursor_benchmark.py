@@ -0,0 +1,80 @@
+"""Benchmarks for the cursor, feed state and the annotation archive."""
+
+import itertools
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from corpus import make_annotations
+
+from slack_annotations.archive import Archive
+from slack_annotations.cursor import Cursor
+from slack_annotations.state import JSONFileStore, SQLiteStore
+
+ANNOTATIONS = 100_000
+QUICK_ANNOTATIONS = 10_000
+SAVES = 200
+
+
+def benchmarks(quick=False):
+    """Yield (name, function) pairs for run.py to time."""
+    corpus = make_annotations(QUICK_ANNOTATIONS if quick else ANNOTATIONS)
+
+    def filter_and_advance():
+        cursor = Cursor(corpus[0].created)
+        for annotation in corpus:
+            if cursor.is_new(annotation):
+                cursor.advance(annotation)
+
+    yield f"cursor_filter_and_advance[{len(corpus)}]", filter_and_advance
+
+    # A full ring of seen IDs: the largest state a feed saves.
+    cursor = Cursor(corpus[0].created)
+    for annotation in corpus[:1000]:
+        cursor.advance(annotation)
+    state = cursor.to_dict()
+
+    with tempfile.TemporaryDirectory() as directory:
+        stores = {
+            "json": JSONFileStore(str(Path(directory) / "cache.json")),
+            "sqlite": SQLiteStore(str(Path(directory) / "state.sqlite")),
+        }
+
+        for name, store in stores.items():
+
+            def save_and_load(store=store):
+                for i in range(SAVES):
+                    store.save("feed", state, [f"id_{i}"])
+                    Cursor.from_dict(store.load("feed"))
+
+            yield f"state_save_and_load[{name}, {SAVES}x]", save_and_load
+
+        stores["sqlite"].close()
+
+        raw_corpus = make_annotations(len(corpus), keep_raw=True)
+        paths = (Path(directory) / f"archive_{i}.db" for i in itertools.count())
+
+        def archive_append():
+            archive = Archive(str(next(paths)))
+            for annotation in raw_corpus:
+                archive.append(annotation)
+            archive.close()
+
+        yield f"archive_append[{len(raw_corpus)}]", archive_append
+
+        # Replaying a tenth of the archive.
+        archive = Archive(str(Path(directory) / "archive.db"))
+        for annotation in raw_corpus:
+            archive.append(annotation)
+        archive.flush()
+        window = raw_corpus[len(raw_corpus) // 2 : len(raw_corpus) * 6 // 10]
+        since = datetime.fromisoformat(window[0].created)
+        until = datetime.fromisoformat(window[-1].created)
+
+        def archive_scan():
+            for _ in archive.scan(since, until):
+                pass
+
+        yield f"archive_scan[{len(window)} of {len(raw_corpus)}]", archive_scan
+
+        archive.close()
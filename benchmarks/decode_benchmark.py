@@ -0,0 +1,40 @@
+"""Benchmarks for decoding and parsing pages of search results."""
+
+import json
+
+from corpus import make_corpus
+
+from slack_annotations.models import Annotation
+from slack_annotations.serialization import decode_rows
+
+PAGE_SIZE = 200
+PAGES = 100
+QUICK_PAGES = 10
+
+
+def benchmarks(quick=False):
+    """Yield (name, function) pairs for run.py to time."""
+    pages = QUICK_PAGES if quick else PAGES
+    corpus = make_corpus(PAGE_SIZE * pages)
+    for annotation in corpus:
+        # Fields that the search API returns but slack-annotations doesn't use.
+        annotation.update(
+            updated=annotation["created"],
+            group="__world__",
+            permissions={"read": ["group:__world__"], "admin": [annotation["user"]]},
+            flagged=False,
+            hidden=False,
+        )
+    bodies = [
+        json.dumps({"total": len(corpus), "rows": corpus[i : i + PAGE_SIZE]}).encode()
+        for i in range(0, len(corpus), PAGE_SIZE)
+    ]
+
+    for raw in (True, False):
+
+        def decode(raw=raw):
+            for body in bodies:
+                for row in decode_rows(body, raw):
+                    Annotation.from_row(row, keep_raw=raw)
+
+        yield f"decode_annotations[{'raw' if raw else 'trimmed'}, {pages}x{PAGE_SIZE}]", decode
@@ -0,0 +1,160 @@
+"""
+Benchmarks for paginating through search results.
+
+_fetch_annotations() and afetch_range() are run against a local mock of the Hypothesis search
+API (a real HTTP server on localhost) that adds a fixed latency to every
+response, so the numbers include connection reuse and JSON decoding.
+"""
+
+import asyncio
+import bisect
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+from corpus import make_corpus
+
+from slack_annotations.client import make_async_client, make_client
+from slack_annotations.core import _fetch_annotations, _make_search_params, afetch_range
+from slack_annotations.cursor import Cursor
+
+ANNOTATIONS = 10_000
+QUICK_ANNOTATIONS = 1_000
+LATENCY = 0.005
+
+
+def benchmarks(quick=False):
+    """Yield (name, function) pairs for run.py to time."""
+    corpus = make_corpus(QUICK_ANNOTATIONS if quick else ANNOTATIONS)
+    search_after = Cursor(corpus[0]["created"]).search_after
+
+    with mock_search_api(corpus, LATENCY) as transport:
+        client = make_client(transport=transport)
+
+        for page_size in (50, 200):
+
+            def fetch(page_size=page_size):
+                params = _make_search_params({}, search_after, page_size)
+                for _ in _fetch_annotations(
+                    client, params, {}, cursor=Cursor(corpus[0]["created"])
+                ):
+                    pass
+
+            yield (
+                f"fetch_annotations[{len(corpus)}, page_size={page_size}, "
+                f"{LATENCY * 1000:.0f}ms latency]",
+                fetch,
+            )
+
+        client.close()
+
+        # Backfilling the whole corpus one slice at a time and then many
+        # slices at once.
+        since = datetime.fromisoformat(corpus[0]["created"]) - timedelta(seconds=1)
+        until = datetime.fromisoformat(corpus[-1]["created"])
+        for concurrency in (1, 10):
+
+            def backfill(concurrency=concurrency):
+                async def run():
+                    async with make_async_client(
+                        transport=AsyncLocalTransport(transport.port)
+                    ) as async_client:
+                        async for _ in afetch_range(
+                            async_client, since, until, concurrency=concurrency
+                        ):
+                            pass
+
+                asyncio.run(run())
+
+            yield (
+                f"backfill[{len(corpus)}, concurrency={concurrency}, "
+                f"{LATENCY * 1000:.0f}ms latency]",
+                backfill,
+            )
+
+
+@contextmanager
+def mock_search_api(corpus, latency):
+    """
+    Serve a mock search API for corpus and yield a transport that routes to it.
+
+    The mock supports the params that _fetch_annotations() sends: sort by
+    created ascending, search_after and limit.
+    """
+    created = [annotation["created"] for annotation in corpus]
+    # Encode each annotation once up front so that the server's own JSON
+    # encoding doesn't dominate the numbers.
+    encoded = [json.dumps(annotation) for annotation in corpus]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Send each response as soon as it's written rather than waiting
+            # (Nagle's algorithm) for the client to ACK the headers.
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_GET(self):  # pylint:disable=invalid-name
+            params = parse_qs(urlsplit(self.path).query)
+            start = bisect.bisect_right(created, params["search_after"][0])
+            rows = encoded[start : start + int(params["limit"][0])]
+            body = f'{{"total": {len(corpus)}, "rows": [{", ".join(rows)}]}}'.encode()
+
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # Accept backfill()'s concurrent connections without the kernel
+        # dropping some of them (and the client retrying a second later).
+        request_queue_size = 64
+
+    server = Server(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield LocalTransport(server.server_address[1])
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+class LocalTransport(httpx.HTTPTransport):
+    """A transport that sends every request to a server on localhost."""
+
+    def __init__(self, port):
+        super().__init__()
+        self.port = port
+
+    def handle_request(self, request):
+        request.url = request.url.copy_with(
+            scheme="http", host="127.0.0.1", port=self.port
+        )
+        return super().handle_request(request)
+
+
+class AsyncLocalTransport(httpx.AsyncHTTPTransport):
+    """An async transport that sends every request to a server on localhost."""
+
+    def __init__(self, port):
+        super().__init__()
+        self.port = port
+
+    async def handle_async_request(self, request):
+        request.url = request.url.copy_with(
+            scheme="http", host="127.0.0.1", port=self.port
+        )
+        return await super().handle_async_request(request)
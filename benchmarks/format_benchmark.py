@@ -0,0 +1,99 @@
+"""
+Benchmarks for formatting annotations as Slack messages.
+
+Run on its own this compares the annotation formatter against its
+pre-rewrite version (kept in _legacy_format.py):
+
+    python benchmarks/format_benchmark.py [--annotations N] [--repeat N]
+
+It checks that both produce identical blocks and prints the best time of
+each.
+"""
+
+import argparse
+import time
+from dataclasses import replace
+
+from _legacy_format import format_annotation as legacy_format_annotation
+from corpus import make_annotations, make_corpus
+
+from slack_annotations.format import (
+    Digest,
+    _format_annotation,
+    format_annotations,
+    format_messages,
+)
+from slack_annotations.models import Annotation
+
+SIZES = (10, 1_000, 100_000)
+QUICK_SIZES = (10, 1_000)
+
+
+def benchmarks(quick=False):
+    """Yield (name, function) pairs for run.py to time."""
+    for size in QUICK_SIZES if quick else SIZES:
+        corpus = make_annotations(size)
+        yield f"format_annotations[{size}]", lambda corpus=corpus: format_annotations(
+            corpus
+        )
+
+    # The corpus spreads its annotations over 1,000 documents, so most of
+    # them collapse into digests.
+    size = QUICK_SIZES[-1] if quick else SIZES[-1]
+    corpus = make_annotations(size)
+    yield f"format_annotations[{size}, digest]", lambda: format_annotations(
+        corpus, digest=Digest()
+    )
+
+    # A busy feed: the same 20 documents over and over, so most titles come
+    # from the cache.
+    busy_corpus = [
+        replace(annotation, title=f"Document {i % 20}")
+        for i, annotation in enumerate(corpus)
+    ]
+    yield f"format_annotations[{size}, busy feed]", lambda: format_annotations(
+        busy_corpus
+    )
+
+    # Long quotes and many selectors: the worst case for finding the quote
+    # and for packing messages by size.
+    size = QUICK_SIZES[-1] if quick else 10_000
+    corpus = make_annotations(size, quote_words=300, selectors=10)
+    yield f"format_messages[{size}, long quotes]", lambda: format_messages(corpus)
+
+
+def best_time(format_annotation, corpus, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for annotation in corpus:
+            format_annotation(annotation)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--annotations", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    def format_annotation(row):
+        # The legacy formatter worked on raw API rows so include parsing them.
+        return _format_annotation(Annotation.from_row(row))
+
+    corpus = make_corpus(args.annotations)
+    for annotation in corpus:
+        assert format_annotation(annotation) == legacy_format_annotation(annotation)
+
+    legacy = best_time(legacy_format_annotation, corpus, args.repeat)
+    current = best_time(format_annotation, corpus, args.repeat)
+
+    print(f"Formatting {args.annotations:,} annotations (best of {args.repeat}):")
+    print(f"  legacy:  {legacy:.3f}s ({args.annotations / legacy:,.0f}/s)")
+    print(f"  current: {current:.3f}s ({args.annotations / current:,.0f}/s)")
+    print(f"  speedup: {legacy / current:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Run the benchmarks, record the results and check for regressions.
+
+    python benchmarks/run.py [--quick] [--filter TEXT] [--threshold 0.25]
+                             [--history PATH] [--no-save]
+
+Each benchmark is timed as the best of --repeat runs and compared against
+the median of the same benchmark's last few recorded results: if any is more
+than --threshold slower the command exits with status 1. Otherwise the
+results are appended to a JSON history file: a run with regressions isn't
+recorded, so that a regression never becomes part of the baseline.
+
+Benchmark results only compare meaningfully on the same machine, so the
+history file is local and isn't committed.
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import UTC, datetime
+from pathlib import Path
+
+import cursor_benchmark
+import decode_benchmark
+import fetch_benchmark
+import format_benchmark
+import startup_benchmark
+
+MODULES = (
+    format_benchmark,
+    fetch_benchmark,
+    cursor_benchmark,
+    decode_benchmark,
+    startup_benchmark,
+)
+
+DEFAULT_HISTORY = Path(__file__).parent.parent / ".benchmarks" / "history.json"
+
+# How many of the most recent recorded results a new result is compared to.
+BASELINE_RUNS = 5
+
+# Differences smaller than this many seconds are noise, not regressions.
+MIN_DIFFERENCE = 0.002
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--quick", action="store_true", help="use smaller corpora, for smoke tests"
+    )
+    parser.add_argument("--filter", help="only run benchmarks whose names contain this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="fail if a benchmark is this much slower than its baseline (0.25 = 25%%)",
+    )
+    parser.add_argument("--history", type=Path, default=DEFAULT_HISTORY)
+    parser.add_argument(
+        "--no-save", action="store_true", help="don't record the results"
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.quick, args.filter, args.repeat)
+    history = load_history(args.history)
+    regressions = find_regressions(results, history, args.threshold, args.quick)
+
+    if not args.no_save and not regressions:
+        history.append(
+            {
+                "timestamp": datetime.now(UTC).isoformat(),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "quick": args.quick,
+                "results": results,
+            }
+        )
+        args.history.parent.mkdir(parents=True, exist_ok=True)
+        args.history.write_text(json.dumps(history, indent=2), encoding="utf-8")
+
+    for name, (seconds, baseline) in regressions.items():
+        print(
+            f"REGRESSION: {name} took {seconds:.4f}s, "
+            f"{seconds / baseline - 1:.0%} slower than its baseline of {baseline:.4f}s",
+            file=sys.stderr,
+        )
+    if regressions and not args.no_save:
+        print(f"Not recording the results in {args.history}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def run(quick=False, name_filter=None, repeat=5):
+    """Run the benchmarks and return each one's best time in seconds."""
+    results = {}
+    for module in MODULES:
+        for name, function in module.benchmarks(quick):
+            if name_filter and name_filter not in name:
+                continue
+
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                function()
+                times.append(time.perf_counter() - start)
+            results[name] = min(times)
+            print(f"{name}: {results[name]:.4f}s", flush=True)
+    return results
+
+
+def load_history(path):
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return []
+
+
+def find_regressions(results, history, threshold, quick=False):
+    """
+    Return the results that are more than threshold slower than their baseline.
+
+    A benchmark's baseline is the median of its last BASELINE_RUNS recorded
+    results from runs of the same kind (quick or not). Returns a dict
+    mapping each regressed benchmark's name to (its time, its baseline).
+    """
+    regressions = {}
+    for name, seconds in results.items():
+        previous = [
+            entry["results"][name]
+            for entry in history
+            if entry.get("quick", False) == quick and name in entry["results"]
+        ][-BASELINE_RUNS:]
+        if not previous:
+            continue
+
+        baseline = statistics.median(previous)
+        if seconds > baseline * (1 + threshold) and seconds - baseline > MIN_DIFFERENCE:
+            regressions[name] = (seconds, baseline)
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    sys.exit(main())
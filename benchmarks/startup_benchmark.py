@@ -0,0 +1,23 @@
+"""Benchmarks for the CLI's cold-start time."""
+
+import subprocess
+import sys
+
+RUNS = 10
+QUICK_RUNS = 3
+
+
+def benchmarks(quick=False):
+    """Yield (name, function) pairs for run.py to time."""
+    runs = QUICK_RUNS if quick else RUNS
+
+    def start(argv):
+        command = f"from slack_annotations.cli import cli; cli({argv!r})"
+        for _ in range(runs):
+            # Exits with status 2 for argument errors.
+            subprocess.run(
+                [sys.executable, "-c", command], capture_output=True, check=False
+            )
+
+    for argv in (["--version"], ["--raw"]):
+        yield f"cli_startup[{' '.join(argv)}, {runs}x]", lambda argv=argv: start(argv)
@@ -0,0 +1,4 @@
+.PHONY: bench
+$(call help,make bench,"run the benchmarks and crash if any have regressed")
+bench: python
+	@pyenv exec tox -qe bench -- $(args)
@@ -0,0 +1,144 @@
+from collections.abc import Iterator
+from datetime import UTC, datetime
+
+from . import metrics
+from .models import Annotation
+from .serialization import dumps, loads
+from .sqlite import connect, transaction
+
+# How many annotations an archive buffers before writing them to disk.
+DEFAULT_BATCH_SIZE = 500
+
+
+class Archive:
+    """
+    An append-only local archive of annotations in a SQLite database.
+
+    Each annotation's full API row is kept, indexed by (group, created, id,
+    uri), so that a time window can be replayed or re-rendered with a local
+    range scan instead of searching the API again, see scan(). Annotations
+    are buffered as they stream past and written batch_size at a time, and
+    an annotation that's already archived is never replaced.
+
+    An archive is also a container of the IDs of the annotations in it, so
+    it can be passed as the skip_ids of core.anotify().
+    """
+
+    def __init__(self, path: str, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.path = path
+        self.batch_size = batch_size
+        self._pending: dict[str, Annotation] = {}
+        self._connection = connect(path)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS annotations (
+                id TEXT PRIMARY KEY,
+                "group" TEXT,
+                created TEXT NOT NULL,
+                uri TEXT NOT NULL,
+                row TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS annotations_group_created
+                ON annotations ("group", created, id, uri);
+            CREATE INDEX IF NOT EXISTS annotations_created
+                ON annotations (created, id);
+            """)
+
+    def append(self, annotation: Annotation) -> None:
+        """
+        Add annotation to the archive.
+
+        The annotation must have been parsed with its full API row (see
+        Annotation.from_row()'s keep_raw). Annotations without an ID are
+        ignored since they can't be told apart.
+        """
+        if annotation.raw is None:
+            raise ValueError("Only annotations with their raw rows can be archived")
+        if not annotation.id:
+            return
+        self._pending[annotation.id] = annotation
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write any buffered annotations to disk."""
+        if not self._pending:
+            return
+
+        with metrics.timer("archive"), transaction(self._connection):
+            self._connection.executemany(
+                'INSERT OR IGNORE INTO annotations (id, "group", created, uri, row)'
+                " VALUES (?, ?, ?, ?, ?)",
+                (
+                    (
+                        annotation.id,
+                        annotation.group,
+                        annotation.created,
+                        annotation.uri,
+                        dumps(annotation.raw),
+                    )
+                    for annotation in self._pending.values()
+                ),
+            )
+        metrics.count("archived_rows", len(self._pending))
+        self._pending.clear()
+
+    def scan(
+        self,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        group: str | None = None,
+    ) -> Iterator[Annotation]:
+        """
+        Yield the archived annotations created after since and up to until.
+
+        Annotations are yielded in created order, with their raw rows. Naive
+        datetimes are taken to be UTC. If group is given only that group's
+        annotations are yielded.
+        """
+        self.flush()
+
+        conditions, params = [], []
+        if group is not None:
+            conditions.append('"group" = ?')
+            params.append(group)
+        if since is not None:
+            conditions.append("created > ?")
+            params.append(_timestamp(since))
+        if until is not None:
+            conditions.append("created <= ?")
+            params.append(_timestamp(until))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        for (row,) in self._connection.execute(
+            f"SELECT row FROM annotations {where} ORDER BY created, id", params
+        ):
+            yield Annotation.from_row(loads(row), keep_raw=True)
+
+    def __contains__(self, id_: object) -> bool:
+        if id_ in self._pending:
+            return True
+        return (
+            self._connection.execute(
+                "SELECT 1 FROM annotations WHERE id = ?", (id_,)
+            ).fetchone()
+            is not None
+        )
+
+    def __len__(self) -> int:
+        self.flush()
+        (count,) = self._connection.execute(
+            "SELECT count(*) FROM annotations"
+        ).fetchone()
+        return count
+
+    def close(self) -> None:
+        """Write any buffered annotations to disk and close the database."""
+        self.flush()
+        self._connection.close()
+
+
+def _timestamp(value: datetime) -> str:
+    """Return value as a UTC timestamp in the search API's format."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+    return value.astimezone(UTC).isoformat(timespec="microseconds")
@@ -1,34 +1,442 @@
 import json
-from argparse import ArgumentParser
-from importlib.metadata import version
+import os
+from argparse import SUPPRESS, Action, ArgumentParser
+from datetime import UTC, datetime
 
-from slack_annotations.core import notify
+from slack_annotations import metrics
+from slack_annotations.core import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_SLICES,
+    MAX_PAGE_SIZE,
+    SEARCH_HOURS,
+    backfill,
+    iter_annotations,
+    iter_backfill,
+    notify,
+)
+from slack_annotations.format import (
+    DEFAULT_DIGEST_SNIPPETS,
+    Digest,
+    format_annotations,
+    iter_messages,
+)
+from slack_annotations.profiling import DEFAULT_TOP, PROFILERS, profile
+from slack_annotations.scheduler import DEFAULT_MAX_INTERVAL, DEFAULT_MIN_INTERVAL
+from slack_annotations.serialization import dumps, loads
 
+# This module is imported on every run so it only imports what every run
+# needs: the serve command's dependencies (asyncio, the Slack client, ...)
+# and importlib.metadata (for --version) are imported when they're used,
+# and core defers importing httpx until a request is actually made.
 
-def cli(argv=None):
+
+class _VersionAction(Action):
+    """Like argparse's "version" action but only looks up the version if used."""
+
+    def __init__(self, option_strings, dest=SUPPRESS, default=SUPPRESS, help=None):
+        super().__init__(option_strings, dest, nargs=0, default=default, help=help)
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        from importlib.metadata import version  # pylint:disable=import-outside-toplevel
+
+        print(version("slack-annotations"))
+        parser.exit()
+
+
+def cli(argv=None):  # pylint:disable=too-many-statements
     parser = ArgumentParser()
     parser.add_argument(
         "-v",
         "--version",
-        action="version",
-        version=version("slack-annotations"),
+        action=_VersionAction,
+        help="show program's version number and exit",
     )
     parser.add_argument("--search-params")
     parser.add_argument("--token")
-    parser.add_argument("--cache-path")
+    parser.add_argument(
+        "--cache-path",
+        help="file to keep state in between runs: JSON, or SQLite if it ends in .sqlite or .db",
+    )
     parser.add_argument("--group-name")
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=MAX_PAGE_SIZE,
+        help=f"number of annotations to request per page (max {MAX_PAGE_SIZE})",
+    )
+    parser.add_argument(
+        "--catch-up-hours",
+        type=float,
+        default=SEARCH_HOURS,
+        help="after downtime, only catch up on annotations from this many hours ago",
+    )
+    parser.add_argument(
+        "--output",
+        choices=["json", "ndjson"],
+        default="json",
+        help="print one Slack message (json) or one line per message as soon as it's ready (ndjson)",
+    )
+    parser.add_argument(
+        "--raw",
+        action="store_true",
+        help="with --output ndjson, print the unformatted annotations instead of Slack messages",
+    )
+    parser.add_argument(
+        "--archive",
+        help="SQLite file to keep a copy of every annotation fetched in, for replay",
+    )
+    parser.add_argument(
+        "--digest-threshold",
+        type=int,
+        help="collapse a document's annotations into one summary when there are more than this many",
+    )
+    parser.add_argument(
+        "--digest-snippets",
+        type=int,
+        default=DEFAULT_DIGEST_SNIPPETS,
+        help="with --digest-threshold, the number of annotations to show in each summary",
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        type=float,
+        help="seconds to wait to connect to the Hypothesis API (default: 5)",
+    )
+    parser.add_argument(
+        "--read-timeout",
+        type=float,
+        help="seconds to wait for the Hypothesis API to respond (default: 30)",
+    )
+    parser.add_argument(
+        "--max-retries",
+        type=int,
+        help="times to retry a request that times out or gets a 429 or 5xx response (default: 3)",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="write a JSON summary of the run's per-stage timings and counters to this file",
+    )
+    parser.add_argument(
+        "--profile",
+        choices=PROFILERS,
+        help="profile the run's CPU time (cProfile) or memory allocations (tracemalloc)",
+    )
+    parser.add_argument(
+        "--profile-path",
+        help="file to write the --profile results to (default: slack-annotations.pstats or slack-annotations.mem.txt)",
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=DEFAULT_TOP,
+        help="with --profile mem, the number of top allocation sites to write",
+    )
+
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser(
+        "serve", help="poll every feed in a config file from one long-running process"
+    )
+    serve_parser.add_argument(
+        "--config", required=True, help="path to a TOML file of feed definitions"
+    )
+    serve_parser.add_argument(
+        "--slack-token-env",
+        default="SLACK_BOT_TOKEN",
+        help="env var holding a Slack bot token, to post feeds with a channel to Slack",
+    )
+    serve_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="serve Prometheus metrics over HTTP on this port",
+    )
+    serve_parser.add_argument(
+        "--metrics-host",
+        default=metrics.DEFAULT_HOST,
+        help="with --metrics-port, the address to serve metrics on (e.g. 0.0.0.0 to allow other machines to scrape them)",
+    )
+    serve_parser.add_argument(
+        "--push-port",
+        type=int,
+        help="accept pushed annotation events over HTTP on this port and deliver them as they arrive",
+    )
+    serve_parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="poll busy feeds more often and quiet ones less often, instead of every feed's fixed interval",
+    )
+    serve_parser.add_argument(
+        "--min-interval",
+        type=float,
+        default=DEFAULT_MIN_INTERVAL,
+        help="with --adaptive, the shortest number of seconds between polls of a feed",
+    )
+    serve_parser.add_argument(
+        "--max-interval",
+        type=float,
+        default=DEFAULT_MAX_INTERVAL,
+        help="with --adaptive, the longest number of seconds between polls of a feed",
+    )
+    serve_parser.add_argument(
+        "--budget",
+        type=float,
+        help="with --adaptive, the most polls per minute of all feeds together",
+    )
+
+    backfill_parser = subparsers.add_parser(
+        "backfill",
+        help="fetch every annotation in a time range, splitting it into slices that are fetched concurrently",
+    )
+    backfill_parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        required=True,
+        help="fetch the annotations created after this ISO 8601 time (UTC if no offset is given)",
+    )
+    backfill_parser.add_argument(
+        "--until",
+        type=datetime.fromisoformat,
+        help="fetch the annotations created up to this ISO 8601 time (default: now)",
+    )
+    backfill_parser.add_argument(
+        "--slices",
+        type=int,
+        default=DEFAULT_SLICES,
+        help="number of time slices to split the range into",
+    )
+    backfill_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="number of slices to fetch at once",
+    )
+
+    replay_parser = subparsers.add_parser(
+        "replay",
+        help="print the annotations in a time range from --archive, without searching the API",
+    )
+    replay_parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        help="replay the annotations created after this ISO 8601 time (UTC if no offset is given)",
+    )
+    replay_parser.add_argument(
+        "--until",
+        type=datetime.fromisoformat,
+        help="replay the annotations created up to this ISO 8601 time",
+    )
+    replay_parser.add_argument(
+        "--group", help="only replay the annotations in the group with this ID"
+    )
 
     args = parser.parse_args(argv)
+    _check_args(parser, args)
+
+    registry = metrics.enable() if args.metrics_file else None
+    try:
+        with profile(args.profile, args.profile_path, args.profile_top):
+            if args.command == "serve":
+                # The profile and metrics are written once the daemon stops.
+                _serve(args)
+                return
+
+            archive = _archive(args)
+            try:
+                if args.command == "backfill":
+                    _backfill(args, archive)
+                elif args.command == "replay":
+                    _replay(args, archive)
+                else:
+                    _run(args, archive)
+            finally:
+                if archive is not None:
+                    archive.close()
+    finally:
+        if registry:
+            with open(args.metrics_file, "w", encoding="utf-8") as metrics_file:
+                json.dump(registry.to_dict(), metrics_file, indent=2)
+            metrics.disable()
+
+
+def _check_args(parser, args):
+    """Exit with a usage error if args is an invalid combination of options."""
+    if args.raw and args.output != "ndjson":
+        parser.error("--raw requires --output ndjson")
+    if args.raw and args.command == "backfill":
+        parser.error("--raw can't be used with backfill")
+    if args.digest_threshold is not None and args.output == "ndjson":
+        parser.error("--digest-threshold requires --output json")
+    if args.command == "replay" and not args.archive:
+        parser.error("replay requires --archive")
+    if args.command == "backfill" and not _is_before(args.since, args.until):
+        parser.error("--since must be before --until (or before now)")
+
+
+def _serve(args):
+    import asyncio  # pylint:disable=import-outside-toplevel
+    import logging  # pylint:disable=import-outside-toplevel
+
+    from slack_annotations.client import (  # pylint:disable=import-outside-toplevel
+        make_timeout,
+    )
+    from slack_annotations.feeds import (  # pylint:disable=import-outside-toplevel
+        load_feeds,
+    )
+    from slack_annotations.serve import serve  # pylint:disable=import-outside-toplevel
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(
+        serve(
+            load_feeds(args.config),
+            slack_token=os.environ.get(args.slack_token_env),
+            metrics_port=args.metrics_port,
+            timeout=make_timeout(args.connect_timeout, args.read_timeout),
+            retry=_retry_policy(args),
+            scheduler=_scheduler(args),
+            push_port=args.push_port,
+            metrics_host=args.metrics_host,
+        )
+    )
+
+
+def _run(args, archive=None):
+    from slack_annotations.client import (  # pylint:disable=import-outside-toplevel
+        make_client,
+        make_timeout,
+    )
 
     if args.search_params:
-        search_params = json.loads(args.search_params)
+        search_params = loads(args.search_params)
     else:
         search_params = None
 
-    annotations = notify(
-        search_params=search_params,
-        token=args.token,
-        cache_path=args.cache_path,
-        group_name=args.group_name,
+    with make_client(
+        timeout=make_timeout(args.connect_timeout, args.read_timeout),
+        retry=_retry_policy(args),
+    ) as client:
+        if args.output == "ndjson":
+            annotations = iter_annotations(
+                search_params=search_params,
+                token=args.token,
+                cache_path=args.cache_path,
+                page_size=args.page_size,
+                client=client,
+                catch_up_hours=args.catch_up_hours,
+                raw=args.raw,
+                archive=archive,
+            )
+            if args.raw:
+                records = (annotation.raw for annotation in annotations)
+            else:
+                records = iter_messages(annotations, args.group_name)
+            for record in records:
+                print(dumps(record), flush=True)
+            return
+
+        annotations = notify(
+            search_params=search_params,
+            token=args.token,
+            cache_path=args.cache_path,
+            group_name=args.group_name,
+            page_size=args.page_size,
+            client=client,
+            catch_up_hours=args.catch_up_hours,
+            digest=_digest(args),
+            archive=archive,
+        )
+    print(dumps(annotations) if annotations else "")
+
+
+def _backfill(args, archive=None):
+    from slack_annotations.client import (  # pylint:disable=import-outside-toplevel
+        make_timeout,
     )
-    print(json.dumps(annotations) if annotations else "")
+
+    if args.search_params:
+        search_params = loads(args.search_params)
+    else:
+        search_params = None
+
+    options = {
+        "since": args.since,
+        "until": args.until,
+        "search_params": search_params,
+        "token": args.token,
+        "cache_path": args.cache_path,
+        "page_size": args.page_size,
+        "slices": args.slices,
+        "concurrency": args.concurrency,
+        "timeout": make_timeout(args.connect_timeout, args.read_timeout),
+        "retry": _retry_policy(args),
+        "archive": archive,
+    }
+    if args.output == "ndjson":
+        for message in iter_messages(iter_backfill(**options), args.group_name):
+            print(dumps(message), flush=True)
+        return
+
+    annotations = backfill(**options, group_name=args.group_name, digest=_digest(args))
+    print(dumps(annotations) if annotations else "")
+
+
+def _replay(args, archive):
+    annotations = archive.scan(args.since, args.until, args.group)
+    if args.output == "ndjson":
+        if args.raw:
+            records = (annotation.raw for annotation in annotations)
+        else:
+            records = iter_messages(annotations, args.group_name)
+        for record in records:
+            print(dumps(record), flush=True)
+        return
+
+    message = format_annotations(annotations, args.group_name, _digest(args))
+    print(dumps(message) if message else "")
+
+
+def _is_before(since, until=None):
+    """Return True if since is before until (default: now), taking naive times to be UTC."""
+    since, until = (
+        value.replace(tzinfo=UTC) if value.tzinfo is None else value
+        for value in (since, until or datetime.now(UTC))
+    )
+    return since < until
+
+
+def _archive(args):
+    from slack_annotations.archive import (  # pylint:disable=import-outside-toplevel
+        Archive,
+    )
+
+    if not args.archive:
+        return None
+    return Archive(args.archive)
+
+
+def _digest(args):
+    if args.digest_threshold is None:
+        return None
+    return Digest(args.digest_threshold, args.digest_snippets)
+
+
+def _scheduler(args):
+    from slack_annotations.scheduler import (  # pylint:disable=import-outside-toplevel
+        AdaptiveScheduler,
+    )
+
+    if not args.adaptive:
+        return None
+    return AdaptiveScheduler(
+        min_interval=args.min_interval,
+        max_interval=args.max_interval,
+        budget=args.budget,
+    )
+
+
+def _retry_policy(args):
+    from slack_annotations.retry import (  # pylint:disable=import-outside-toplevel
+        DEFAULT_RETRY,
+        RetryPolicy,
+    )
+
+    if args.max_retries is None:
+        return DEFAULT_RETRY
+    return RetryPolicy(max_retries=args.max_retries)
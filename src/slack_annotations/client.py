@@ -0,0 +1,77 @@
+import httpx
+
+from .retry import (
+    DEFAULT_RETRY,
+    AsyncRetryTransport,
+    CircuitBreaker,
+    RetryPolicy,
+    RetryTransport,
+)
+
+# How long to wait for the Hypothesis API: 5s to connect and 30s for
+# everything else (a page of 200 annotations can take a while to arrive).
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_TIMEOUT = httpx.Timeout(DEFAULT_READ_TIMEOUT, connect=DEFAULT_CONNECT_TIMEOUT)
+
+# Keep idle connections open long enough to be reused by the next poll of a
+# feed, rather than paying for a new TLS handshake every time.
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=10, max_keepalive_connections=10, keepalive_expiry=120
+)
+
+
+def make_timeout(
+    connect: float | None = None, read: float | None = None
+) -> httpx.Timeout:
+    """Return DEFAULT_TIMEOUT with its connect and/or read timeouts replaced."""
+    return httpx.Timeout(
+        DEFAULT_READ_TIMEOUT if read is None else read,
+        connect=DEFAULT_CONNECT_TIMEOUT if connect is None else connect,
+    )
+
+
+def make_client(  # pylint:disable=too-many-arguments
+    timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+    limits: httpx.Limits = DEFAULT_LIMITS,
+    http2: bool = True,
+    transport: httpx.BaseTransport | None = None,
+    *,
+    retry: RetryPolicy = DEFAULT_RETRY,
+    breaker: CircuitBreaker | None = None,
+) -> httpx.Client:
+    """
+    Return a new pooled client for talking to the Hypothesis API.
+
+    The client keeps connections alive between requests and, with http2,
+    multiplexes concurrent requests over a single connection. Callers own
+    the client's lifecycle: use it as a context manager or call close().
+    Pass a transport to route the client's requests to a stub server.
+
+    Requests that time out, lose their connection or get a 429 or 5xx
+    response are retried according to retry (pass retry.NO_RETRY not to
+    retry). If a breaker is given the client stops sending requests to
+    hosts that keep failing, see retry.CircuitBreaker.
+    """
+    if transport is None:
+        transport = httpx.HTTPTransport(http2=http2, limits=limits)
+    return httpx.Client(
+        timeout=timeout, transport=RetryTransport(transport, retry, breaker)
+    )
+
+
+def make_async_client(  # pylint:disable=too-many-arguments
+    timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+    limits: httpx.Limits = DEFAULT_LIMITS,
+    http2: bool = True,
+    transport: httpx.AsyncBaseTransport | None = None,
+    *,
+    retry: RetryPolicy = DEFAULT_RETRY,
+    breaker: CircuitBreaker | None = None,
+) -> httpx.AsyncClient:
+    """Return a new pooled async client, see make_client()."""
+    if transport is None:
+        transport = httpx.AsyncHTTPTransport(http2=http2, limits=limits)
+    return httpx.AsyncClient(
+        timeout=timeout, transport=AsyncRetryTransport(transport, retry, breaker)
+    )
@@ -1,38 +1,712 @@
-import json
+from collections import deque
+from collections.abc import (
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Container,
+    Iterable,
+    Iterator,
+)
+from contextlib import aclosing
+from dataclasses import dataclass, field
 from datetime import UTC, datetime, timedelta
-from typing import Any
+from http import HTTPStatus
+from itertools import islice
+from typing import TYPE_CHECKING, Any, TypeVar
 
-import httpx
+from . import metrics
+from .cursor import Cursor
+from .format import Digest, format_annotations, make_builder
+from .models import Annotation
+from .planner import PredicateIndex, SharedSearch, plan
+from .serialization import decode_rows
+from .state import DEFAULT_KEY, StateStore, open_store
 
-from .format import format_annotations
+# httpx and asyncio are imported where they're used rather than here: they
+# take longer to import than everything else put together, and importing
+# this module (for example to build the CLI's --help) shouldn't pay for them.
+if TYPE_CHECKING:
+    import httpx
+
+    from .archive import Archive
+    from .feeds import Feed
+    from .retry import CircuitBreaker, RetryPolicy
 
 SEARCH_HOURS = 1
+SEARCH_URL = "https://hypothes.is/api/search"
+
+# The maximum number of annotations that the search API will return per page.
+MAX_PAGE_SIZE = 200
+
+# The default maximum number of searches that notify_many() runs at once.
+DEFAULT_CONCURRENCY = 10
+
+# The default number of time slices that backfill() splits its range into.
+# More slices than DEFAULT_CONCURRENCY so that a busy slice doesn't leave the
+# other connections idle while it finishes.
+DEFAULT_SLICES = 40
+
+_T = TypeVar("_T")
 
 
-def notify(
+def notify(  # pylint:disable=too-many-arguments
     search_params: dict[str, Any] | None = None,
     token: str | None = None,
     cache_path: str | None = None,
     group_name: str | None = None,
+    *,
+    page_size: int = MAX_PAGE_SIZE,
+    client: "httpx.Client | None" = None,
+    catch_up_hours: float | None = SEARCH_HOURS,
+    state: StateStore | None = None,
+    state_key: str = DEFAULT_KEY,
+    digest: Digest | None = None,
+    archive: "Archive | None" = None,
 ) -> dict[str, Any]:
-    search_params = _make_search_params(search_params, cache_path)
+    """
+    Return a Slack message for the annotations posted since the last run.
+
+    Requests are sent with client if one is given, so that many calls can
+    share its pooled connections. Otherwise a client is created just for
+    this call and closed again afterwards.
+
+    If the last run was more than catch_up_hours ago only the annotations
+    from the last catch_up_hours are returned. Pass None to always catch up
+    on every annotation since the last run.
+
+    The last run's cursor is kept under state_key in the state store, which
+    is state if given or else the store at cache_path (see
+    state.open_store()).
+
+    If digest is given bursts of annotations on one document are collapsed
+    into a single section, see format.DigestBuilder.
+
+    If archive is given every annotation's full API row is added to it, see
+    archive.Archive.
+    """
+    with metrics.timer("notify"):
+        return format_annotations(
+            iter_annotations(
+                search_params,
+                token,
+                cache_path,
+                page_size=page_size,
+                client=client,
+                catch_up_hours=catch_up_hours,
+                state=state,
+                state_key=state_key,
+                archive=archive,
+            ),
+            group_name,
+            digest,
+        )
+
+
+def iter_annotations(  # pylint:disable=too-many-arguments
+    search_params: dict[str, Any] | None = None,
+    token: str | None = None,
+    cache_path: str | None = None,
+    *,
+    page_size: int = MAX_PAGE_SIZE,
+    client: "httpx.Client | None" = None,
+    catch_up_hours: float | None = SEARCH_HOURS,
+    state: StateStore | None = None,
+    state_key: str = DEFAULT_KEY,
+    raw: bool = False,
+    archive: "Archive | None" = None,
+) -> Iterator[Annotation]:
+    """
+    Yield the annotations posted since the last run, as they arrive.
+
+    This is notify() without the formatting: each annotation is yielded as
+    soon as its page has been fetched. The cursor is only saved once every
+    annotation has been yielded, so if the caller stops early the next run
+    will start from the same place again.
+
+    If raw is true each annotation keeps its full API row in its raw
+    attribute.
+
+    If archive is given each annotation is added to it as it's yielded. The
+    archive is flushed before the cursor is saved, so every annotation that
+    the cursor has moved past is on disk.
+    """
+    if client is None:
+        from .client import make_client  # pylint:disable=import-outside-toplevel
+
+        with make_client() as new_client:
+            yield from iter_annotations(
+                search_params,
+                token,
+                cache_path,
+                page_size=page_size,
+                client=new_client,
+                catch_up_hours=catch_up_hours,
+                state=state,
+                state_key=state_key,
+                raw=raw,
+                archive=archive,
+            )
+        return
+
+    store = state or open_store(cache_path)
+    search = _Search.load(
+        store, state_key, search_params, token, page_size, catch_up_hours
+    )
+    for annotation in _fetch_annotations(
+        client,
+        search.params,
+        search.headers,
+        search.validators,
+        cursor=search.cursor,
+        raw=raw or archive is not None,
+    ):
+        if archive is not None:
+            archive.append(annotation)
+        yield annotation
+        _record_id(annotation, search.delivered)
+
+    if archive is not None:
+        archive.flush()
+    search.save()
+
+
+async def anotify(  # pylint:disable=too-many-arguments,too-many-locals
+    client: "httpx.AsyncClient",
+    search_params: dict[str, Any] | None = None,
+    token: str | None = None,
+    cache_path: str | None = None,
+    group_name: str | None = None,
+    *,
+    page_size: int = MAX_PAGE_SIZE,
+    catch_up_hours: float | None = SEARCH_HOURS,
+    state: StateStore | None = None,
+    state_key: str = DEFAULT_KEY,
+    arrivals: list[str] | None = None,
+    skip_ids: Container[str] = (),
+    claim: Callable[[str], Awaitable[bool]] | None = None,
+    digest: Digest | None = None,
+    deliver: Callable[[dict[str, Any]], Awaitable[bool]] | None = None,
+) -> dict[str, Any]:
+    """
+    Asynchronous version of notify() that sends its requests with client.
+
+    If arrivals is given the created time of each new annotation is
+    appended to it, see scheduler.AdaptiveScheduler.
+
+    Annotations whose IDs are in skip_ids have already been delivered some
+    other way (see push.PushRouter): they're recorded as delivered and the
+    cursor moves past them but they're left out of the message. If claim
+    is given it's awaited with each new annotation's ID as the annotation
+    is found, and annotations whose claims return False are skipped too.
+
+    If deliver is given it's called with the message before the cursor is
+    saved. If it returns False the message wasn't delivered and the cursor
+    is left where it was, so the same annotations are found again next time.
+    """
+    with metrics.timer("notify"):
+        store = state or open_store(cache_path)
+        search = _Search.load(
+            store, state_key, search_params, token, page_size, catch_up_hours
+        )
+        builder = make_builder(group_name, digest)
+        async for annotation in _afetch_annotations(
+            client,
+            search.params,
+            search.headers,
+            search.validators,
+            cursor=search.cursor,
+        ):
+            _record_id(annotation, search.delivered)
+            if annotation.id in skip_ids or (
+                claim is not None and annotation.id and not await claim(annotation.id)
+            ):
+                metrics.count("skipped_rows")
+                continue
+            builder.add(annotation)
+            if arrivals is not None:
+                arrivals.append(annotation.created)
+        formatted_annotations = builder.build()
+
+        if deliver is not None and not await deliver(formatted_annotations):
+            return formatted_annotations
+
+        search.save()
+        return formatted_annotations
+
+
+async def notify_many(  # pylint:disable=too-many-arguments,too-many-locals
+    feeds: Iterable["Feed"],
+    client: "httpx.AsyncClient | None" = None,
+    *,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    max_connections: int = DEFAULT_CONCURRENCY,
+    timeout: float | None = None,
+    coalesce: bool = False,
+    retry: "RetryPolicy | None" = None,
+    breaker: "CircuitBreaker | None" = None,
+) -> dict[str, dict[str, Any] | BaseException]:
+    """
+    Run the searches of many feeds concurrently and return a result per feed.
+
+    At most `concurrency` searches are in flight at once. If no client is
+    given a pooled one is created that opens at most `max_connections`
+    connections to the API and closed again afterwards. The new client
+    retries failed requests according to `retry` (retry.DEFAULT_RETRY if
+    None) and shares a circuit breaker between all of the feeds (`breaker`,
+    or a new retry.CircuitBreaker), so that once the API is failing the
+    remaining searches fail fast rather than adding to its load.
+
+    If `coalesce` is true feeds that differ only by tag or user share a
+    single search whose annotations are routed to the matching feeds
+    locally (see planner.plan()), so the number of API searches scales with
+    the number of distinct base queries rather than the number of feeds.
+
+    The returned dict maps each feed's name to the feed's formatted message
+    or, if the feed failed or took longer than `timeout` seconds, to the
+    exception that it raised. One search failing never affects the others.
+    """
+    import asyncio  # pylint:disable=import-outside-toplevel
+
+    import httpx  # pylint:disable=import-outside-toplevel
+
+    from .client import make_async_client  # pylint:disable=import-outside-toplevel
+    from .retry import (  # pylint:disable=import-outside-toplevel
+        DEFAULT_RETRY,
+        CircuitBreaker,
+    )
+
+    feeds = list(feeds)
+
+    if client is None:
+        async with make_async_client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            retry=retry or DEFAULT_RETRY,
+            breaker=breaker or CircuitBreaker(),
+        ) as new_client:
+            return await notify_many(
+                feeds,
+                new_client,
+                concurrency=concurrency,
+                timeout=timeout,
+                coalesce=coalesce,
+            )
+
+    if coalesce:
+        searches = plan(feeds)
+    else:
+        searches = [
+            SharedSearch(feed.search_params, feed.token, [feed]) for feed in feeds
+        ]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_search(search: SharedSearch) -> dict[str, dict[str, Any]]:
+        async with semaphore:
+            return await asyncio.wait_for(_anotify_shared(client, search), timeout)
+
+    results: dict[str, dict[str, Any] | BaseException] = {}
+    for search, result in zip(
+        searches,
+        await asyncio.gather(
+            *(run_search(search) for search in searches), return_exceptions=True
+        ),
+    ):
+        if isinstance(result, BaseException):
+            results.update((feed.name, result) for feed in search.feeds)
+        else:
+            results.update(result)
+
+    return {feed.name: results[feed.name] for feed in feeds}
+
+
+async def _anotify_shared(  # pylint:disable=too-many-locals
+    client: "httpx.AsyncClient", search: SharedSearch
+) -> dict[str, dict[str, Any]]:
+    """Run one search and return a formatted message for each of its feeds."""
+    if len(search.feeds) == 1:
+        feed = search.feeds[0]
+        return {
+            feed.name: await anotify(
+                client,
+                search_params=feed.search_params,
+                token=feed.token,
+                cache_path=feed.cache_path,
+                group_name=feed.group_name,
+                page_size=feed.page_size,
+                catch_up_hours=feed.catch_up_hours,
+                state_key=feed.name,
+                digest=feed.digest,
+            )
+        }
+
+    # Search from the oldest of the feeds' cursors and skip annotations
+    # that a feed with a newer cursor has already seen.
+    stores = {feed.name: open_store(feed.cache_path) for feed in search.feeds}
+    saved_states = {
+        feed.name: stores[feed.name].load(feed.name) for feed in search.feeds
+    }
+    cursors = {
+        feed.name: _get_cursor(saved_states[feed.name], feed.catch_up_hours)
+        for feed in search.feeds
+    }
+    scan_cursor = min(cursors.values(), key=lambda cursor: cursor.search_after).copy()
+    search_params = _make_search_params(
+        search.search_params,
+        scan_cursor.search_after,
+        max(feed.page_size for feed in search.feeds),
+    )
+    headers = _make_headers(search.token)
+
+    index = PredicateIndex(search.feeds)
+    builders = {
+        feed.name: make_builder(feed.group_name, feed.digest) for feed in search.feeds
+    }
+    delivered: dict[str, list[str]] = {feed.name: [] for feed in search.feeds}
+    async for annotation in _afetch_annotations(
+        client, search_params, headers, cursor=scan_cursor
+    ):
+        matches = {feed.name for feed in index.match(annotation)}
+        # Every feed's cursor advances past every annotation scanned, whether
+        # or not the annotation matched the feed's filters.
+        for name, cursor in cursors.items():
+            if cursor.is_new(annotation):
+                cursor.advance(annotation)
+                if name in matches:
+                    builders[name].add(annotation)
+                    _record_id(annotation, delivered[name])
+
+    for feed in search.feeds:
+        _maybe_update_state(
+            stores[feed.name],
+            feed.name,
+            saved_states[feed.name],
+            cursors[feed.name],
+            delivered=delivered[feed.name],
+        )
+
+    return {name: builder.build() for name, builder in builders.items()}
+
+
+def backfill(  # pylint:disable=too-many-arguments,too-many-positional-arguments
+    since: datetime,
+    until: datetime | None = None,
+    search_params: dict[str, Any] | None = None,
+    token: str | None = None,
+    cache_path: str | None = None,
+    group_name: str | None = None,
+    *,
+    page_size: int = MAX_PAGE_SIZE,
+    slices: int = DEFAULT_SLICES,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: "httpx.Timeout | None" = None,
+    retry: "RetryPolicy | None" = None,
+    state: StateStore | None = None,
+    state_key: str = DEFAULT_KEY,
+    digest: Digest | None = None,
+    archive: "Archive | None" = None,
+) -> dict[str, Any]:
+    """
+    Return a Slack message for the annotations created between since and until.
+
+    See iter_backfill().
+    """
+    with metrics.timer("backfill"):
+        return format_annotations(
+            iter_backfill(
+                since,
+                until,
+                search_params,
+                token,
+                cache_path,
+                page_size=page_size,
+                slices=slices,
+                concurrency=concurrency,
+                timeout=timeout,
+                retry=retry,
+                state=state,
+                state_key=state_key,
+                archive=archive,
+            ),
+            group_name,
+            digest,
+        )
+
+
+def iter_backfill(  # pylint:disable=too-many-arguments,too-many-locals
+    since: datetime,
+    until: datetime | None = None,
+    search_params: dict[str, Any] | None = None,
+    token: str | None = None,
+    cache_path: str | None = None,
+    *,
+    page_size: int = MAX_PAGE_SIZE,
+    slices: int = DEFAULT_SLICES,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: "httpx.Timeout | None" = None,
+    retry: "RetryPolicy | None" = None,
+    state: StateStore | None = None,
+    state_key: str = DEFAULT_KEY,
+    archive: "Archive | None" = None,
+) -> Iterator[Annotation]:
+    """
+    Yield every annotation created between since and until, in created order.
+
+    This is for catching up after a long outage or seeding a new channel:
+    the range is split into time slices that are fetched concurrently (see
+    afetch_range()) over a new pooled client that opens at most concurrency
+    connections and retries according to retry (retry.DEFAULT_RETRY if
+    None). until defaults to now and naive datetimes are taken to be UTC.
+    Annotations are yielded slice by slice as they arrive, so at most
+    concurrency slices are held in memory rather than the whole range.
+
+    Afterwards the saved cursor under state_key is moved forward past the
+    last annotation, so that the next run carries on from there, but only
+    if the range started at or before the cursor: otherwise the next run
+    would skip the annotations between the cursor and since.
+
+    If archive is given every annotation is added to it, see
+    iter_annotations().
+    """
+    import httpx  # pylint:disable=import-outside-toplevel
+
+    from .client import (  # pylint:disable=import-outside-toplevel
+        DEFAULT_TIMEOUT,
+        make_async_client,
+    )
+    from .retry import (  # pylint:disable=import-outside-toplevel
+        DEFAULT_RETRY,
+        CircuitBreaker,
+    )
+
+    since = _utc(since)
+    until = _utc(until) if until else datetime.now(UTC)
+
+    store = state or open_store(cache_path)
+    search = _Search.load(store, state_key, search_params, token, page_size, None)
+    resume = datetime.fromisoformat(search.cursor.created) >= since
+
+    async def fetch() -> AsyncGenerator[list[Annotation], None]:
+        async with make_async_client(
+            timeout=timeout or DEFAULT_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=concurrency, max_keepalive_connections=concurrency
+            ),
+            retry=retry or DEFAULT_RETRY,
+            breaker=CircuitBreaker(),
+        ) as client:
+            async with aclosing(
+                _afetch_slices(
+                    client,
+                    since,
+                    until,
+                    search_params,
+                    token,
+                    page_size=page_size,
+                    slices=slices,
+                    concurrency=concurrency,
+                    raw=archive is not None,
+                )
+            ) as results:
+                async for annotations in results:
+                    yield annotations
+
+    for annotations in _iter_async(fetch()):
+        for annotation in annotations:
+            if archive is not None:
+                archive.append(annotation)
+            yield annotation
+            _record_id(annotation, search.delivered)
+            if resume and search.cursor.is_new(annotation):
+                search.cursor.advance(annotation)
+
+    if archive is not None:
+        archive.flush()
+    if resume:
+        search.save()
+
+
+async def afetch_range(  # pylint:disable=too-many-arguments
+    client: "httpx.AsyncClient",
+    since: datetime,
+    until: datetime,
+    search_params: dict[str, Any] | None = None,
+    token: str | None = None,
+    *,
+    page_size: int = MAX_PAGE_SIZE,
+    slices: int = DEFAULT_SLICES,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    raw: bool = False,
+) -> AsyncGenerator[Annotation, None]:
+    """
+    Yield every annotation created after since and up to until, in created order.
+
+    The range is split into slices (see split_range()) that are each paged
+    through with their own search_after cursor, at most concurrency slices
+    at a time, so the time taken grows with the length of the range divided
+    by the concurrency rather than with the length of the range.
+
+    Slices are yielded in order as soon as each one and every slice before
+    it has been fetched, and a slice is only started when there's room for
+    it, so at most concurrency slices' annotations are held in memory at
+    once however long the range is.
+
+    If raw is true each annotation keeps its full API row.
+    """
+    async with aclosing(
+        _afetch_slices(
+            client,
+            since,
+            until,
+            search_params,
+            token,
+            page_size=page_size,
+            slices=slices,
+            concurrency=concurrency,
+            raw=raw,
+        )
+    ) as results:
+        async for annotations in results:
+            for annotation in annotations:
+                yield annotation
+
+
+async def _afetch_slices(  # pylint:disable=too-many-arguments,too-many-locals
+    client: "httpx.AsyncClient",
+    since: datetime,
+    until: datetime,
+    search_params: dict[str, Any] | None = None,
+    token: str | None = None,
+    *,
+    page_size: int = MAX_PAGE_SIZE,
+    slices: int = DEFAULT_SLICES,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    raw: bool = False,
+) -> AsyncGenerator[list[Annotation], None]:
+    """Yield each slice's annotations in order, see afetch_range()."""
+    import asyncio  # pylint:disable=import-outside-toplevel
+
     headers = _make_headers(token)
 
-    annotations = _fetch_annotations(search_params, headers)
+    async def fetch_slice(start: str, end: str) -> list[Annotation]:
+        with metrics.timer("backfill_slice"):
+            return await _afetch_slice(
+                client, search_params, headers, start, end, page_size, raw
+            )
+
+    # Slices are disjoint and in created order so they can simply be yielded
+    # one after another. A sliding window of at most concurrency tasks keeps
+    # the next slices fetching while the oldest one is being consumed.
+    pending = iter(split_range(since, until, slices))
+    window: deque[asyncio.Task[list[Annotation]]] = deque()
+    try:
+        for start, end in islice(pending, max(concurrency, 1)):
+            window.append(asyncio.create_task(fetch_slice(start, end)))
+        while window:
+            annotations = await window.popleft()
+            for start, end in islice(pending, 1):
+                window.append(asyncio.create_task(fetch_slice(start, end)))
+            yield annotations
+    finally:
+        for task in window:
+            task.cancel()
+        await asyncio.gather(*window, return_exceptions=True)
+
+
+def split_range(
+    since: datetime, until: datetime, slices: int = DEFAULT_SLICES
+) -> list[tuple[str, str]]:
+    """
+    Split the time between since and until into equal (start, end) slices.
+
+    Each slice is a pair of ISO 8601 timestamps in the search API's format.
+    Like the search API's search_after param a slice excludes its start, and
+    it includes its end. Raises ValueError if until isn't after since.
+    """
+    if until <= since:
+        raise ValueError("until must be after since")
+    step = (until - since) / max(slices, 1)
+    bounds = [_utc(since + step * i) for i in range(max(slices, 1))] + [_utc(until)]
+    return [
+        (
+            start.isoformat(timespec="microseconds"),
+            end.isoformat(timespec="microseconds"),
+        )
+        for start, end in zip(bounds, bounds[1:])
+        if start < end
+    ]
 
-    _maybe_update_cache(annotations, cache_path)
-    return format_annotations(annotations, group_name)
+
+async def _afetch_slice(  # pylint:disable=too-many-arguments,too-many-positional-arguments
+    client: "httpx.AsyncClient",
+    search_params: dict[str, Any] | None,
+    headers: dict[str, str],
+    start: str,
+    end: str,
+    page_size: int,
+    raw: bool = False,
+) -> list[Annotation]:
+    """Return the annotations created after start and up to end, in order."""
+    # The search API has no upper bound param: page through from start and
+    # stop at the first annotation created after end.
+    cursor = Cursor(start)
+    params = _make_search_params(search_params, cursor.search_after, page_size)
+    annotations = []
+    async with aclosing(
+        _afetch_annotations(client, params, headers, cursor=cursor, raw=raw)
+    ) as rows:
+        async for annotation in rows:
+            if annotation.created > end:
+                break
+            annotations.append(annotation)
+    metrics.count("backfill_slices")
+    return annotations
+
+
+def _iter_async(results: AsyncGenerator[_T, None]) -> Iterator[_T]:
+    """
+    Yield the items of an async generator from synchronous code.
+
+    The generator is run on its own event loop one item at a time, so the
+    caller can consume (or abandon) each item before the next is produced.
+    """
+    import asyncio  # pylint:disable=import-outside-toplevel
+
+    async def step() -> _T:
+        return await anext(results)
+
+    with asyncio.Runner() as runner:
+        try:
+            while True:
+                try:
+                    yield runner.run(step())
+                except StopAsyncIteration:
+                    return
+        finally:
+            runner.run(results.aclose())
+
+
+def _utc(value: datetime) -> datetime:
+    """Return value in UTC, taking naive datetimes to be UTC already."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value.astimezone(UTC)
 
 
 def _make_search_params(
-    params: dict[str, Any] | None = None, cache_path: str | None = None
+    params: dict[str, Any] | None = None,
+    search_after: str | None = None,
+    page_size: int = MAX_PAGE_SIZE,
 ) -> dict[str, Any]:
     # Deliberately override any given sort or order param as these specific
     # values are needed for the algorithm below to work.
     default_params = {
         "sort": "created",
         "order": "asc",
-        "search_after": _get_search_after(cache_path),
+        "search_after": search_after or _get_cursor().search_after,
+        "limit": page_size,
     }
     if params:
         default_params.update(params)
@@ -43,37 +717,275 @@ def _make_headers(token: str | None = None) -> dict[str, str]:
     return {"Authorization": f"Bearer {token}"} if token else {}
 
 
-def _get_search_after(cache_path: str | None = None) -> str:
-    """Return the search_after value from the cache file or the default."""
-    default = (datetime.now(UTC) - timedelta(hours=SEARCH_HOURS)).isoformat()
+def _get_cursor(
+    state: dict[str, Any] | None = None, catch_up_hours: float | None = SEARCH_HOURS
+) -> Cursor:
+    """
+    Return the cursor from a feed's saved state or the default.
 
-    if not cache_path:
-        return default
+    Without a saved cursor searches start SEARCH_HOURS ago. A saved cursor
+    older than catch_up_hours is moved forward to catch_up_hours ago.
+    """
+    now = datetime.now(UTC)
 
-    try:
-        with open(cache_path, "r", encoding="utf-8") as f:
-            return max(default, json.load(f)["search_after"])
-    except FileNotFoundError:
-        return default
+    if not state or "search_after" not in state:
+        return Cursor((now - timedelta(hours=SEARCH_HOURS)).isoformat())
 
+    cursor = Cursor.from_dict(state)
+    if catch_up_hours is not None:
+        oldest = (now - timedelta(hours=catch_up_hours)).isoformat()
+        if cursor.created < oldest:
+            return Cursor(oldest)
 
-def _maybe_update_cache(
-    annotations: list[dict[str, Any]], cache_path: str | None = None
+    return cursor
+
+
+def _get_validators(state: dict[str, Any]) -> dict[str, str | None]:
+    """Return the validators of the last search's response from saved state."""
+    return {"etag": state.get("etag")}
+
+
+@dataclass
+class _Search:  # pylint:disable=too-many-instance-attributes
+    """
+    A search for the annotations posted since a feed's last run.
+
+    This is what iter_annotations(), anotify() and iter_backfill() share:
+    load() builds the search from the feed's saved state and save() saves
+    its moved cursor.
+    """
+
+    store: StateStore
+    key: str
+    saved_state: dict[str, Any]
+    cursor: Cursor
+    validators: dict[str, str | None]
+    params: dict[str, Any]
+    headers: dict[str, str]
+    delivered: list[str] = field(default_factory=list)
+
+    @classmethod
+    def load(  # pylint:disable=too-many-arguments,too-many-positional-arguments
+        cls,
+        store: StateStore,
+        key: str,
+        search_params: dict[str, Any] | None,
+        token: str | None,
+        page_size: int,
+        catch_up_hours: float | None,
+    ) -> "_Search":
+        with metrics.timer("state_load"):
+            saved_state = store.load(key)
+        cursor = _get_cursor(saved_state, catch_up_hours)
+        return cls(
+            store,
+            key,
+            saved_state,
+            cursor,
+            _get_validators(saved_state),
+            _make_search_params(search_params, cursor.search_after, page_size),
+            _make_headers(token),
+        )
+
+    def save(self) -> None:
+        _maybe_update_state(
+            self.store,
+            self.key,
+            self.saved_state,
+            self.cursor,
+            validators=self.validators,
+            delivered=self.delivered,
+        )
+
+
+def _maybe_update_state(  # pylint:disable=too-many-arguments
+    store: StateStore,
+    key: str,
+    state: dict[str, Any],
+    cursor: Cursor | None,
+    *,
+    validators: dict[str, str | None] | None = None,
+    delivered: Iterable[str] = (),
 ) -> None:
-    """Update the cache file with created timestamp of the last annotation."""
-    if not annotations or not cache_path:
+    """
+    Save the cursor to the store if it has moved.
+
+    Also saves the validators (ETag) of the last search's response so that
+    the next search can be a conditional request, and logs the IDs of the
+    annotations delivered by this search. The updates are merged into the
+    key's latest state rather than into state, which was loaded before the
+    search, so that anything saved in the meantime (for example by a
+    push.PushRouter) isn't lost.
+    """
+    values = cursor.to_dict() if cursor and cursor.changed else {}
+    updates = {
+        name: value
+        for name, value in {**values, **(validators or {})}.items()
+        if value and state.get(name) != value
+    }
+    if not updates:
         return
 
-    search_after = annotations[-1]["created"]
-    with open(cache_path, "w", encoding="utf-8") as f:
-        json.dump({"search_after": search_after}, f)
+    with metrics.timer("state_save"):
+        store.save(key, {**store.load(key), **updates}, delivered)
 
 
-def _fetch_annotations(
-    params: dict[str, Any], headers: dict[str, str]
-) -> list[dict[str, Any]]:
-    return (
-        httpx.get("https://hypothes.is/api/search", params=params, headers=headers)
-        .raise_for_status()
-        .json()["rows"]
-    )
+def _record_id(annotation: Annotation, ids: list[str]) -> None:
+    if annotation_id := annotation.id:
+        ids.append(annotation_id)
+
+
+def _fetch_annotations(  # pylint:disable=too-many-arguments
+    client: "httpx.Client",
+    params: dict[str, Any],
+    headers: dict[str, str],
+    validators: dict[str, str | None] | None = None,
+    *,
+    cursor: Cursor,
+    raw: bool = False,
+) -> Iterator[Annotation]:
+    """
+    Yield every annotation matching params, one page at a time.
+
+    Pages are requested lazily: the next page is only fetched once the
+    consumer has exhausted the current one, following the search API's
+    search_after cursor until a short page signals the end of the results.
+
+    If validators are given the first page is requested conditionally: if
+    the API responds 304 Not Modified nothing has changed since the last
+    search and no annotations are yielded. validators is updated in place
+    with the first page's new validators.
+
+    Annotations that cursor has already seen are skipped and it is advanced
+    past each annotation as it is yielded.
+
+    If raw is true each annotation keeps its full API row, see
+    Annotation.from_row().
+    """
+    pages = _Pages(params, headers, validators, cursor=cursor, raw=raw)
+    while not pages.done:
+        with metrics.timer("fetch"):
+            response = client.get(
+                SEARCH_URL, params=pages.params, headers=pages.headers
+            )
+        yield from pages.read(response)
+
+
+async def _afetch_annotations(  # pylint:disable=too-many-arguments
+    client: "httpx.AsyncClient",
+    params: dict[str, Any],
+    headers: dict[str, str],
+    validators: dict[str, str | None] | None = None,
+    *,
+    cursor: Cursor,
+    raw: bool = False,
+) -> AsyncGenerator[Annotation, None]:
+    """Asynchronous version of _fetch_annotations()."""
+    pages = _Pages(params, headers, validators, cursor=cursor, raw=raw)
+    while not pages.done:
+        with metrics.timer("fetch"):
+            response = await client.get(
+                SEARCH_URL, params=pages.params, headers=pages.headers
+            )
+        for annotation in pages.read(response):
+            yield annotation
+
+
+class _Pages:  # pylint:disable=too-many-instance-attributes
+    """
+    The pages of a search, apart from how each page's request is sent.
+
+    _fetch_annotations() and _afetch_annotations() send a request with the
+    current params and headers and pass its response to read(), until done.
+    """
+
+    def __init__(
+        self,
+        params: dict[str, Any],
+        headers: dict[str, str],
+        validators: dict[str, str | None] | None = None,
+        *,
+        cursor: Cursor,
+        raw: bool = False,
+    ) -> None:
+        self.params = dict(params)
+        self.params["limit"] = self._page_size = min(
+            int(params.get("limit", MAX_PAGE_SIZE)), MAX_PAGE_SIZE
+        )
+        # Only the first page is requested conditionally.
+        self.headers = dict(headers)
+        if validators and (etag := validators.get("etag")):
+            self.headers["If-None-Match"] = etag
+        self.done = False
+        self._next_headers = headers
+        self._validators = validators
+        self._cursor = cursor
+        self._raw = raw
+
+    def read(self, response: "httpx.Response") -> list[Annotation]:
+        """Return the new annotations on a page and move on to the next page."""
+        rows = _read_page(response, self._validators, self._raw)
+        new_rows = _new_rows(rows, self._cursor)
+        if _is_last_page(rows, self._page_size):
+            self.done = True
+        else:
+            self.params["search_after"] = _next_search_after(
+                rows, new_rows, self._cursor
+            )
+            self.headers, self._validators = self._next_headers, None
+        return new_rows
+
+
+def _read_page(
+    response: "httpx.Response",
+    validators: dict[str, str | None] | None = None,
+    raw: bool = False,
+) -> list[Annotation]:
+    """Return the rows of a page, recording its validators in validators."""
+    metrics.count("pages")
+    if response.status_code == HTTPStatus.NOT_MODIFIED:
+        metrics.count("not_modified")
+        return []
+
+    response.raise_for_status()
+    with metrics.timer("decode"):
+        rows = [
+            Annotation.from_row(row, keep_raw=raw)
+            for row in decode_rows(response.content, raw)
+        ]
+    metrics.count("bytes", len(response.content))
+    metrics.count("rows", len(rows))
+    if validators is not None:
+        validators["etag"] = response.headers.get("ETag")
+    return rows
+
+
+def _new_rows(rows: list[Annotation], cursor: Cursor) -> list[Annotation]:
+    """Return the rows that cursor hasn't seen, advancing it past them."""
+    new_rows = []
+    for row in rows:
+        if cursor.is_new(row):
+            cursor.advance(row)
+            new_rows.append(row)
+    metrics.count("new_rows", len(new_rows))
+    return new_rows
+
+
+def _next_search_after(
+    rows: list[Annotation], new_rows: list[Annotation], cursor: Cursor
+) -> str:
+    """Return the search_after param for the page after rows."""
+    if new_rows:
+        # Overlap the next page with this one by starting from just before the
+        # cursor so that annotations sharing the last one's created time
+        # aren't skipped. The cursor filters out the repeats.
+        return cursor.search_after
+
+    # A full page of annotations was all repeats (more annotations share one
+    # created time than fit on a page): move strictly past the page to make
+    # progress.
+    return rows[-1].created
+
+
+def _is_last_page(rows: list[Annotation], page_size: int) -> bool:
+    return not rows or len(rows) < page_size
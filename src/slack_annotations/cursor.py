@@ -0,0 +1,79 @@
+from collections import deque
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+from typing import Any
+
+from .models import Annotation
+
+# How many recently seen annotation IDs a cursor remembers.
+SEEN_IDS = 256
+
+
+class Cursor:
+    """
+    The high-water mark of the annotations that a feed has already seen.
+
+    The search API's search_after param is exclusive and only compares the
+    created timestamp, so annotations created in the same microsecond as the
+    last annotation seen would be skipped. A cursor therefore records the
+    (created, id) of the last annotation seen plus a bounded ring of recently
+    seen IDs: searches start just before the last created time and any
+    annotation already in the ring is skipped, giving exactly-once delivery.
+    """
+
+    def __init__(
+        self, created: str, id_: str | None = None, seen_ids: Iterable[str] = ()
+    ) -> None:
+        self.created = created
+        self.id = id_
+        self._seen_ring: deque[str] = deque(seen_ids, maxlen=SEEN_IDS)
+        self._seen = set(self._seen_ring)
+        # Whether the cursor has moved since it was created.
+        self.changed = False
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Cursor":
+        return cls(data["search_after"], data.get("id"), data.get("seen_ids", ()))
+
+    def to_dict(self) -> dict[str, Any]:
+        data: dict[str, Any] = {"search_after": self.created}
+        if self.id:
+            data["id"] = self.id
+            data["seen_ids"] = list(self._seen_ring)
+        return data
+
+    @property
+    def search_after(self) -> str:
+        """Return the search_after param for a search from this cursor."""
+        if not self.id:
+            # An old-style cursor with no ID: annotations created at exactly
+            # self.created have all been seen.
+            return self.created
+        return _just_before(self.created)
+
+    def is_new(self, annotation: Annotation) -> bool:
+        """Return True if annotation hasn't been seen yet."""
+        created = annotation.created
+        if created != self.created:
+            return created > self.created
+        return bool(self.id) and annotation.id not in self._seen
+
+    def copy(self) -> "Cursor":
+        return Cursor(self.created, self.id, self._seen_ring)
+
+    def advance(self, annotation: Annotation) -> None:
+        """Move the cursor forward to annotation."""
+        self.created = annotation.created
+        self.id = annotation.id
+        self.changed = True
+        if not self.id:
+            return
+
+        if len(self._seen_ring) == self._seen_ring.maxlen:
+            self._seen.discard(self._seen_ring[0])
+        self._seen_ring.append(self.id)
+        self._seen.add(self.id)
+
+
+def _just_before(created: str) -> str:
+    return (datetime.fromisoformat(created) - timedelta(microseconds=1)).isoformat()
@@ -0,0 +1,68 @@
+import os
+import tomllib
+from dataclasses import dataclass, field
+from typing import Any
+
+from .core import MAX_PAGE_SIZE, SEARCH_HOURS
+from .format import DEFAULT_DIGEST_SNIPPETS, Digest
+
+# The default number of seconds between polls of a feed.
+DEFAULT_INTERVAL = 60
+
+
+@dataclass(frozen=True)
+class Feed:  # pylint:disable=too-many-instance-attributes
+    """A search query whose new annotations are posted to one Slack channel."""
+
+    name: str
+    search_params: dict[str, Any] = field(default_factory=dict)
+    token: str | None = None
+    group_name: str | None = None
+    cache_path: str | None = None
+    interval: float = DEFAULT_INTERVAL
+    page_size: int = MAX_PAGE_SIZE
+    catch_up_hours: float | None = SEARCH_HOURS
+    # The Slack channel to post to directly, rather than printing messages.
+    channel: str | None = None
+    # Collapse a document's annotations into one section when there are more
+    # than this many of them, see format.DigestBuilder. None never collapses.
+    digest_threshold: int | None = None
+    digest_snippets: int = DEFAULT_DIGEST_SNIPPETS
+
+    @property
+    def digest(self) -> Digest | None:
+        if self.digest_threshold is None:
+            return None
+        return Digest(self.digest_threshold, self.digest_snippets)
+
+
+def load_feeds(path: str) -> list[Feed]:
+    """
+    Return the feeds defined in the TOML config file at path.
+
+    Each feed is a [feeds.<name>] table whose keys are Feed's fields.
+    Keys in an optional top-level [defaults] table apply to every feed
+    and a feed's token can be read from an environment variable by
+    giving the variable's name as token_env instead of a literal token.
+    """
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+
+    defaults = config.get("defaults", {})
+    feeds = []
+    for name, table in config.get("feeds", {}).items():
+        options = {**defaults, **table}
+        if token_env := options.pop("token_env", None):
+            options["token"] = os.environ.get(token_env)
+        if cache_path := options.get("cache_path"):
+            options["cache_path"] = os.path.expanduser(cache_path)
+
+        try:
+            feeds.append(Feed(name=name, **options))
+        except TypeError as err:
+            raise ValueError(f"Invalid feed {name!r} in {path}: {err}") from err
+
+    if not feeds:
+        raise ValueError(f"No feeds defined in {path}")
+
+    return feeds
@@ -1,132 +1,475 @@
 import html
+import json
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from functools import lru_cache
 from typing import Any
 
+from . import metrics
+from .models import Annotation
+
 MAX_TEXT_LENGTH = 2000
 NONE_TEXT = "(None)"
 
+# In digest mode: collapse the annotations of a document into one section when
+# there are more than this many of them, and show this many of them in it.
+DEFAULT_DIGEST_THRESHOLD = 5
+DEFAULT_DIGEST_SNIPPETS = 3
+
+# The most snippets that a digest section can show (Slack's limit on a
+# section's fields), how long each snippet can be and how many users a
+# digest section names.
+MAX_DIGEST_SNIPPETS = 10
+MAX_SNIPPET_LENGTH = 200
+MAX_DIGEST_USERS = 5
+
+# The most normalized titles and formatted users that are cached. Busy feeds
+# repeat the same few documents and users over and over, and a serve process
+# keeps the caches between polls.
+MAX_CACHED_TITLES = 4096
+MAX_CACHED_USERS = 4096
+
+# The most blocks that Slack allows in one message.
+MAX_BLOCKS = 50
+
+# The largest serialized message that format_messages() produces. Slack
+# doesn't document an exact payload limit but rejects messages much larger
+# than this.
+MAX_MESSAGE_BYTES = 16_000
+
+FOOTER_TEXT = "These annotations are posted to Slack by a <https://github.com/hypothesis/slack-annotations/|GitHub Actions workflow>"
+
+# The serialized size of everything in a message apart from its section
+# blocks: the envelope, the summary text (at most this long, including any
+# "(part k of n)") and the footer (including any "Part k of n" element).
+_SUMMARY_BYTES = 100
+_FOOTER_BYTES = len(FOOTER_TEXT) + 200
+
+# Static blocks and fields, built once and shared by every message. They're
+# only ever serialized, never modified.
+_DIVIDER = {"type": "divider"}
+_FOOTER = {"type": "context", "elements": [{"type": "mrkdwn", "text": FOOTER_TEXT}]}
+_QUOTE_LABEL = {"type": "mrkdwn", "text": "*Quote:*"}
+
+_DIVIDER_BYTES = len(json.dumps(_DIVIDER))
+# Blocks are separated by ", " in the serialized list.
+_SEPARATOR_BYTES = 2
+
 
 def normalize_title(text: str) -> str:
     text = html.escape(text)
     return " ".join(text.split())
 
 
+_cached_title = lru_cache(maxsize=MAX_CACHED_TITLES)(normalize_title)
+
+
+@lru_cache(maxsize=MAX_CACHED_USERS)
+def _format_user(user: str, display_name: str | None) -> str:
+    """Return the userid user (with display_name, if any) formatted for Slack."""
+    username = html.escape(user.partition(":")[2].partition("@")[0])
+    if display_name:
+        return f"`{username}` ({html.escape(display_name)})"
+    return f"`{username}`"
+
+
+# The caches whose hits and misses are counted, and their counts so far.
+_CACHES = {"title": _cached_title, "user": _format_user}
+_cache_counts = {name: (0, 0) for name in _CACHES}
+
+
+def clear_caches() -> None:
+    """Empty the title and user caches and reset their counts."""
+    for name, cached in _CACHES.items():
+        cached.cache_clear()
+        _cache_counts[name] = (0, 0)
+
+
+def _count_cache_lookups() -> None:
+    """Add the caches' hits and misses since the last call to the metrics."""
+    for name, cached in _CACHES.items():
+        info = cached.cache_info()
+        hits, misses = _cache_counts[name]
+        metrics.count(f"{name}_cache_hits", info.hits - hits)
+        metrics.count(f"{name}_cache_misses", info.misses - misses)
+        _cache_counts[name] = (info.hits, info.misses)
+
+
 def _format_annotation(
-    annotation: dict[str, Any], group_name: str | None = None
+    annotation: Annotation, group_name: str | None = None
 ) -> dict[str, Any]:
-    summary = _build_annotation_summary(annotation, group_name)
-    fields = _build_annotation_fields(annotation)
+    """
+    Return annotation formatted as a Slack section block.
+
+    This is the hot path when formatting a large backlog so it builds its
+    text with single f-strings and reuses the static field labels rather
+    than building new ones. Titles and users are formatted through bounded
+    LRU caches, since the same few tend to repeat.
+    """
+    user = _format_user(annotation.user, annotation.display_name)
+    title = _cached_title(annotation.title) if annotation.title else None
+    document_link = f"<{annotation.uri}|{title}>" if title else annotation.uri
+    in_group = f" in `{group_name}`" if group_name else ""
+    incontext_link = annotation.incontext_link
+    text = _trim_text(annotation.text or NONE_TEXT)
+
+    if quote := annotation.quote:
+        fields = [
+            _QUOTE_LABEL,
+            {
+                "type": "mrkdwn",
+                "text": f"*Annotation* (<{incontext_link}|in-context link>):",
+            },
+            {"type": "plain_text", "text": _trim_text(quote)},
+            {"type": "plain_text", "text": text},
+        ]
+    else:
+        label = "Reply" if annotation.is_reply else "Page Note"
+        fields = [
+            {
+                "type": "mrkdwn",
+                "text": f"*{label}* (<{incontext_link}|in-context link>):",
+            },
+            {"type": "plain_text", "text": text},
+        ]
+
     return {
         "type": "section",
-        "text": {"type": "mrkdwn", "text": summary},
+        "text": {
+            "type": "mrkdwn",
+            "text": f"{user} annotated {document_link}{in_group}:",
+        },
         "fields": fields,
     }
 
 
-def _get_quote(annotation: dict[str, Any]) -> str:
-    for target in annotation["target"]:
-        for selector in target["selector"]:
-            if exact := selector.get("exact"):
-                return _trim_text(exact)
-    raise ValueError()
+def _format_digest(
+    group: "_DocumentGroup", group_name: str | None, snippets: int
+) -> dict[str, Any]:
+    """Return the annotations of one document collapsed into a section block."""
+    title = _cached_title(group.title) if group.title else None
+    document_link = f"<{group.uri}|{title}>" if title else group.uri
+    in_group = f" in `{group_name}`" if group_name else ""
 
+    users = [
+        f"`{html.escape(username)}` ({count})"
+        for username, count in group.users.most_common(MAX_DIGEST_USERS)
+    ]
+    if others := len(group.users) - len(users):
+        users.append(f"{others} other{'s' if others > 1 else ''}")
+    by_users = (
+        ", ".join(users[:-1]) + " and " + users[-1] if len(users) > 1 else users[0]
+    )
 
-def _trim_text(text: str) -> str:
+    shown = group.annotations[:snippets]
+    more = f" Showing the first {len(shown)}." if group.count > len(shown) else ""
+    return {
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": f"*{group.count} annotations* on {document_link}{in_group} by {by_users}.{more}",
+        },
+        "fields": [_format_snippet(annotation) for annotation in shown],
+    }
+
+
+def _format_snippet(annotation: Annotation) -> dict[str, Any]:
+    """Return the start of annotation's quote or text as a section field."""
+    username = html.escape(annotation.username)
+    snippet = _trim_text(
+        annotation.quote or annotation.text or NONE_TEXT, MAX_SNIPPET_LENGTH
+    )
+    return {
+        "type": "mrkdwn",
+        "text": f"`{username}` (<{annotation.incontext_link}|in-context link>): {html.escape(snippet, quote=False)}",
+    }
+
+
+def _trim_text(text: str, max_length: int = MAX_TEXT_LENGTH) -> str:
     stub = "..."
-    if len(text) > MAX_TEXT_LENGTH:
-        return text[: MAX_TEXT_LENGTH - len(stub)] + stub
+    if len(text) > max_length:
+        return text[: max_length - len(stub)] + stub
     return text
 
 
-def _get_text(annotation: dict[str, Any]) -> str:
-    text = annotation.get("text")
-    if not text:
-        text = NONE_TEXT
-    return _trim_text(text)
+class _Message(dict[str, Any]):
+    """
+    A message built by a MessageBuilder.
+
+    This is an ordinary Slack message that also knows how many annotations
+    each of its section blocks stands for, so that pack_messages() can count
+    a digest section's annotations when it moves the section into another
+    message. The counts aren't part of the message itself, so they're never
+    posted or printed.
+    """
+
+    def __init__(self, counts: list[int], **message: Any) -> None:
+        super().__init__(**message)
+        self.counts = counts
+
+
+class MessageBuilder:
+    """Incrementally build a Slack message from a stream of annotations."""
+
+    def __init__(self, group_name: str | None = None) -> None:
+        self.group_name = group_name
+        self.count = 0
+        self._blocks: list[dict[str, Any]] = []
+
+    def add(self, annotation: Annotation) -> None:
+        with metrics.timer("format"):
+            self._blocks.append(_format_annotation(annotation, self.group_name))
+        self._blocks.append(_DIVIDER)
+        self.count += 1
+
+    def build(self) -> dict[str, Any]:
+        _count_cache_lookups()
+        if not self.count:
+            return {}
+
+        return _Message(
+            [1] * self.count,
+            text=_summary(self.count),
+            blocks=self._blocks + [_FOOTER],
+        )
+
+
+@dataclass(frozen=True)
+class Digest:
+    """
+    When to collapse a burst of annotations on one document, see DigestBuilder.
+
+    A document's annotations are collapsed into one section when there are
+    more than `threshold` of them, showing the first `snippets` of them.
+    """
+
+    threshold: int = DEFAULT_DIGEST_THRESHOLD
+    snippets: int = DEFAULT_DIGEST_SNIPPETS
+
+
+@dataclass
+class _DocumentGroup:
+    """The annotations of one document, in a digest."""
+
+    uri: str
+    title: str | None = None
+    count: int = 0
+    # The number of annotations by each username.
+    users: Counter[str] = field(default_factory=Counter)
+    # The document's first few annotations: enough to give each its own
+    # section if the document isn't collapsed, or to show if it is.
+    annotations: list[Annotation] = field(default_factory=list)
+
+
+class DigestBuilder(MessageBuilder):
+    """
+    A MessageBuilder that collapses bursts of annotations on one document.
+
+    Annotations are grouped by document as they're added, counting each
+    document's annotations by user. When the message is built a document
+    with more than digest.threshold annotations gets a single section
+    saying how many annotations who posted on it and showing a snippet of
+    the first few. Other documents' annotations get a section each, as
+    usual. Either way each document's sections are kept together, in the
+    order in which the documents first appeared.
+
+    Only as many annotations per document as might be shown are kept, so a
+    burst costs memory for its counts, not for its annotations.
+    """
+
+    def __init__(
+        self, group_name: str | None = None, digest: Digest = Digest()
+    ) -> None:
+        super().__init__(group_name)
+        self.digest = digest
+        self._keep = max(digest.threshold, min(digest.snippets, MAX_DIGEST_SNIPPETS))
+        self._groups: dict[str, _DocumentGroup] = {}
+
+    def add(self, annotation: Annotation) -> None:
+        if (group := self._groups.get(annotation.uri)) is None:
+            group = self._groups[annotation.uri] = _DocumentGroup(annotation.uri)
+        group.count += 1
+        group.users[annotation.username] += 1
+        group.title = group.title or annotation.title
+        if len(group.annotations) < self._keep:
+            group.annotations.append(annotation)
+        self.count += 1
+
+    def build(self) -> dict[str, Any]:
+        if not self.count:
+            return {}
+
+        snippets = min(self.digest.snippets, MAX_DIGEST_SNIPPETS)
+        blocks: list[dict[str, Any]] = []
+        counts: list[int] = []
+        with metrics.timer("format"):
+            for group in self._groups.values():
+                if group.count > self.digest.threshold:
+                    metrics.count("digested_rows", group.count)
+                    blocks.append(_format_digest(group, self.group_name, snippets))
+                    blocks.append(_DIVIDER)
+                    counts.append(group.count)
+                    continue
+                for annotation in group.annotations:
+                    blocks.append(_format_annotation(annotation, self.group_name))
+                    blocks.append(_DIVIDER)
+                    counts.append(1)
+        _count_cache_lookups()
+
+        return _Message(counts, text=_summary(self.count), blocks=blocks + [_FOOTER])
+
+
+def make_builder(
+    group_name: str | None = None, digest: Digest | None = None
+) -> MessageBuilder:
+    """Return a MessageBuilder, or a DigestBuilder if digest is given."""
+    if digest is None:
+        return MessageBuilder(group_name)
+    return DigestBuilder(group_name, digest)
 
 
 def format_annotations(
-    annotations: list[dict[str, Any]], group_name: str | None = None
+    annotations: Iterable[Annotation],
+    group_name: str | None = None,
+    digest: Digest | None = None,
 ) -> dict[str, Any]:
-    if not annotations:
-        return {}
+    # Consume annotations in a single pass so that a lazily-fetched stream of
+    # annotations never needs to be held in memory all at once.
+    builder = make_builder(group_name, digest)
+    for annotation in annotations:
+        builder.add(annotation)
+    return builder.build()
+
 
-    summary = (
-        f"{len(annotations)} new annotations"
-        if len(annotations) > 1
-        else "A new annotation was posted"
+def format_messages(
+    annotations: Iterable[Annotation],
+    group_name: str | None = None,
+    max_blocks: int = MAX_BLOCKS,
+    max_bytes: int = MAX_MESSAGE_BYTES,
+) -> list[dict[str, Any]]:
+    """
+    Return annotations formatted as a list of messages within Slack's limits.
+
+    This is format_annotations() for when there might be too many
+    annotations for one message, see pack_messages().
+    """
+    return pack_messages(
+        [format_annotations(annotations, group_name)], max_blocks, max_bytes
     )
-    blocks = []
+
+
+def pack_messages(
+    messages: Iterable[dict[str, Any]],
+    max_blocks: int = MAX_BLOCKS,
+    max_bytes: int = MAX_MESSAGE_BYTES,
+) -> list[dict[str, Any]]:
+    """
+    Return the annotations of messages repacked into as few messages as fit.
+
+    messages are messages from format_annotations(). Their annotations are
+    packed greedily, in order, into messages of at most max_blocks blocks and
+    (approximately, using each block's size as it's added rather than
+    re-serializing the whole message) max_bytes bytes. When there's more
+    than one message each one's summary says which part of how many it is.
+    An annotation too big for a message on its own gets a message to itself.
+    A digest section is moved as one block but counts as all of the
+    annotations that it stands for in the summaries (as long as its message
+    is the one that format_annotations() returned, not a copy of it).
+    """
+    sections = (section for message in messages for section in _sections(message))
+    parts = list(_pack(sections, max_blocks, max_bytes))
+    return [_build_part(part, k, len(parts)) for k, part in enumerate(parts, 1)]
+
+
+def iter_messages(
+    annotations: Iterable[Annotation],
+    group_name: str | None = None,
+    max_blocks: int = MAX_BLOCKS,
+    max_bytes: int = MAX_MESSAGE_BYTES,
+) -> Iterator[dict[str, Any]]:
+    """
+    Yield annotations formatted as messages, each as soon as it's full.
+
+    This is the streaming version of format_messages(): messages are packed
+    the same way but because the total number of messages isn't known until
+    the end they aren't labelled "part k of n".
+    """
+    for part in _pack(_format_each(annotations, group_name), max_blocks, max_bytes):
+        _count_cache_lookups()
+        yield _build_part(part, 1, 1)
+
+
+def _sections(message: dict[str, Any]) -> Iterator[tuple[dict[str, Any], int]]:
+    """Yield message's section blocks, each with its number of annotations."""
+    sections = [
+        block for block in message.get("blocks", ()) if block["type"] == "section"
+    ]
+    counts = getattr(message, "counts", None) or [1] * len(sections)
+    yield from zip(sections, counts)
+
+
+def _format_each(
+    annotations: Iterable[Annotation], group_name: str | None
+) -> Iterator[tuple[dict[str, Any], int]]:
     for annotation in annotations:
-        blocks.append(_format_annotation(annotation, group_name))
-        blocks.append({"type": "divider"})
-    blocks.append(
-        {
-            "type": "context",
-            "elements": [
-                {
-                    "type": "mrkdwn",
-                    "text": "These annotations are posted to Slack by a <https://github.com/hypothesis/slack-annotations/|GitHub Actions workflow>",
-                },
-            ],
-        }
-    )
+        with metrics.timer("format"):
+            section = _format_annotation(annotation, group_name)
+        yield section, 1
 
-    return {"text": summary, "blocks": blocks}
 
+def _pack(
+    sections: Iterable[tuple[dict[str, Any], int]], max_blocks: int, max_bytes: int
+) -> Iterator[list[tuple[dict[str, Any], int]]]:
+    """
+    Yield section blocks packed greedily into lists that fit in a message.
 
-def _build_annotation_summary(
-    annotation: dict[str, Any], group_name: str | None = None
-) -> str:
-    username = html.escape(annotation["user"].split(":")[1].split("@")[0])
-    display_name = html.escape(annotation["user_info"]["display_name"] or "")
-    uri = annotation["uri"]
+    Each section comes with, and is yielded with, the number of annotations
+    that it stands for.
+    """
+    part: list[tuple[dict[str, Any], int]] = []
+    size = _SUMMARY_BYTES + _FOOTER_BYTES
 
-    try:
-        title = normalize_title(annotation["document"]["title"][0])
-    except Exception:  # pylint:disable=broad-exception-caught
-        title = None
-    if title:
-        document_link = f"<{uri}|{title}>"
-    else:
-        document_link = uri
+    for section, count in sections:
+        # Each annotation adds a section and a divider block.
+        section_size = len(json.dumps(section)) + _DIVIDER_BYTES + 2 * _SEPARATOR_BYTES
+        too_many_blocks = 2 * (len(part) + 1) + 1 > max_blocks
+        if part and (too_many_blocks or size + section_size > max_bytes):
+            yield part
+            part, size = [], _SUMMARY_BYTES + _FOOTER_BYTES
 
-    formatted_user = (
-        f"`{username}` ({display_name})" if display_name else f"`{username}`"
-    )
-    formatted_group = f" in `{group_name}`" if group_name else ""
-    return f"{formatted_user} annotated {document_link}{formatted_group}:"
+        part.append((section, count))
+        size += section_size
 
+    if part:
+        yield part
 
-def _build_annotation_fields(annotation: dict[str, Any]) -> list[dict[str, Any]]:
-    quote = None
-    try:
-        quote = _get_quote(annotation)
-    except Exception:  # pylint:disable=broad-exception-caught
-        pass
-    incontext_link = annotation["links"]["incontext"]
 
-    if quote:
-        fields = [
-            {"type": "mrkdwn", "text": "*Quote:*"},
-            {
-                "type": "mrkdwn",
-                "text": f"*Annotation* (<{incontext_link}|in-context link>):",
-            },
-            {"type": "plain_text", "text": quote},
-        ]
-    elif annotation.get("references"):
-        fields = [
-            {
-                "type": "mrkdwn",
-                "text": f"*Reply* (<{incontext_link}|in-context link>):",
-            },
-        ]
-    else:
-        fields = [
-            {
-                "type": "mrkdwn",
-                "text": f"*Page Note* (<{incontext_link}|in-context link>):",
-            },
-        ]
-    fields.append({"type": "plain_text", "text": _get_text(annotation)})
-    return fields
+def _build_part(
+    sections: list[tuple[dict[str, Any], int]], part: int, parts: int
+) -> dict[str, Any]:
+    blocks = []
+    counts = []
+    for section, count in sections:
+        blocks.append(section)
+        blocks.append(_DIVIDER)
+        counts.append(count)
+
+    summary = _summary(sum(counts))
+    if parts == 1:
+        return _Message(counts, text=summary, blocks=blocks + [_FOOTER])
+
+    footer = {
+        "type": "context",
+        "elements": [
+            {"type": "mrkdwn", "text": f"*Part {part} of {parts}*"},
+            *_FOOTER["elements"],
+        ],
+    }
+    return _Message(
+        counts, text=f"{summary} (part {part} of {parts})", blocks=blocks + [footer]
+    )
+
+
+def _summary(count: int) -> str:
+    return f"{count} new annotations" if count > 1 else "A new annotation was posted"
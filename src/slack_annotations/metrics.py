@@ -0,0 +1,168 @@
+import time
+from contextlib import AbstractContextManager, nullcontext
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import asyncio
+
+# The prefix of every exported Prometheus metric's name.
+PREFIX = "slack_annotations"
+
+# The address that serve_metrics() listens on by default: the local machine
+# only. Listening more widely (for example on "0.0.0.0") is opt-in.
+DEFAULT_HOST = "127.0.0.1"
+
+_NULL_TIMER = nullcontext()
+
+
+@dataclass
+class Timing:
+    """The latencies recorded for one stage."""
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+class Registry:
+    """The counters and stage timings collected while metrics are enabled."""
+
+    def __init__(self) -> None:
+        self.counters: dict[str, float] = {}
+        self.timings: dict[str, Timing] = {}
+
+    def count(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def record(self, stage: str, seconds: float) -> None:
+        if (timing := self.timings.get(stage)) is None:
+            timing = self.timings[stage] = Timing()
+        timing.record(seconds)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "timings": {
+                stage: {
+                    "count": timing.count,
+                    "total_seconds": timing.total,
+                    "max_seconds": timing.max,
+                }
+                for stage, timing in sorted(self.timings.items())
+            },
+        }
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            metric = f"{PREFIX}_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {_exact(value)}"]
+        for stage, timing in sorted(self.timings.items()):
+            metric = f"{PREFIX}_{stage}_seconds"
+            lines += [
+                f"# TYPE {metric} summary",
+                f"{metric}_count {timing.count}",
+                f"{metric}_sum {timing.total:.6f}",
+                f"# TYPE {metric}_max gauge",
+                f"{metric}_max {timing.max:.6f}",
+            ]
+        return "\n".join(lines) + "\n"
+
+
+def _exact(value: float) -> str:
+    # Not :g, which rounds to 6 significant digits: 1234567 would be 1.23457e+06.
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class _Timer:
+    """Records the time spent in a with block as a stage's latency."""
+
+    __slots__ = ("registry", "stage", "start")
+
+    def __init__(self, registry: Registry, stage: str) -> None:
+        self.registry = registry
+        self.stage = stage
+        self.start = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *_exc_info: object) -> None:
+        self.registry.record(self.stage, time.perf_counter() - self.start)
+
+
+# Collection is off until enable() is called: until then count() returns
+# immediately and timer() returns a shared no-op context manager, so the
+# instrumentation in the hot paths costs next to nothing.
+_registry: Registry | None = None  # pylint:disable=invalid-name
+
+
+def enable() -> Registry:
+    """Start collecting metrics (if not already) and return the registry."""
+    global _registry  # pylint:disable=global-statement
+    if _registry is None:
+        _registry = Registry()
+    return _registry
+
+
+def disable() -> None:
+    """Stop collecting metrics and discard everything collected."""
+    global _registry  # pylint:disable=global-statement
+    _registry = None
+
+
+def get_registry() -> Registry | None:
+    """Return the registry, or None if metrics aren't enabled."""
+    return _registry
+
+
+def count(name: str, value: float = 1) -> None:
+    """Add value to the counter name."""
+    if _registry is not None:
+        _registry.count(name, value)
+
+
+def timer(stage: str) -> AbstractContextManager[None]:
+    """Return a context manager that records the latency of a stage."""
+    if _registry is None:
+        return _NULL_TIMER
+    return _Timer(_registry, stage)
+
+
+async def serve_metrics(host: str = DEFAULT_HOST, port: int = 9090) -> "asyncio.Server":
+    """
+    Start serving the metrics in Prometheus's text format over HTTP.
+
+    Every request gets the current metrics, whatever its path. Returns the
+    server, which the caller should close.
+    """
+    import asyncio  # pylint:disable=import-outside-toplevel
+
+    registry = enable()
+
+    async def handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            # Read (and ignore) the request line and headers.
+            while (await reader.readline()).strip():
+                pass
+            body = registry.to_prometheus().encode()
+            writer.write(
+                b"HTTP/1.1 200 OK\r\n"
+                b"Content-Type: text/plain; version=0.0.4\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: close\r\n\r\n"
+                + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
@@ -0,0 +1,66 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass(slots=True)
+class Annotation:  # pylint:disable=too-many-instance-attributes
+    """
+    The parts of an annotation that slack-annotations uses.
+
+    Annotations are parsed from search API rows as soon as each page is
+    decoded and the rest of the row is dropped, so a large backlog (or a
+    long-running serve process) only ever holds these few fields per
+    annotation rather than the API's full nested dicts.
+    """
+
+    id: str | None
+    created: str
+    # The userid: "acct:<username>@<authority>".
+    user: str
+    uri: str
+    incontext_link: str
+    group: str | None = None
+    display_name: str | None = None
+    # The document's first title, not yet normalized.
+    title: str | None = None
+    # The first exact quote in the annotation's selectors, not yet trimmed.
+    quote: str | None = None
+    text: str | None = None
+    is_reply: bool = False
+    tags: tuple[str, ...] = ()
+    # The full API row, only kept if from_row() is asked to keep it.
+    raw: dict[str, Any] | None = field(default=None, compare=False, repr=False)
+
+    @classmethod
+    def from_row(cls, row: dict[str, Any], keep_raw: bool = False) -> "Annotation":
+        """Return a search API row parsed as an Annotation."""
+        document = row.get("document")
+        titles = document.get("title") if document else None
+        return cls(
+            id=row.get("id"),
+            created=row["created"],
+            user=row["user"],
+            uri=row["uri"],
+            incontext_link=row["links"]["incontext"],
+            group=row.get("group"),
+            display_name=(row.get("user_info") or {}).get("display_name"),
+            title=titles[0] if titles else None,
+            quote=_get_quote(row),
+            text=row.get("text"),
+            is_reply=bool(row.get("references")),
+            tags=tuple(row.get("tags") or ()),
+            raw=row if keep_raw else None,
+        )
+
+    @property
+    def username(self) -> str:
+        return self.user.partition(":")[2].partition("@")[0]
+
+
+def _get_quote(row: dict[str, Any]) -> str | None:
+    """Return row's quote, or None if it doesn't have one."""
+    for target in row.get("target") or ():
+        for selector in target.get("selector") or ():
+            if exact := selector.get("exact"):
+                return exact
+    return None
@@ -0,0 +1,137 @@
+import json
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any
+
+from .models import Annotation
+
+if TYPE_CHECKING:
+    from .feeds import Feed
+
+# Search params that can be evaluated locally against each annotation, mapped
+# to the annotation field that they filter on. Feeds whose search params only
+# differ in these can share a single, broader search.
+#
+# group is deliberately not one of them: dropping it from a search would widen
+# the scan to every public annotation. Nor are uri and url: the API matches
+# them against every URI of the annotated document, after normalizing them,
+# which can't be done locally.
+LOCAL_FILTERS = {
+    "tag": "tag",
+    "tags": "tag",
+    "user": "user",
+}
+
+# An annotation must have *all* of a feed's tags but needs to match only *one*
+# of a feed's users.
+MATCH_ALL_FIELDS = {"tag"}
+
+
+@dataclass
+class SharedSearch:
+    """A single API search whose results are routed to one or more feeds."""
+
+    search_params: dict[str, Any]
+    token: str | None
+    feeds: list["Feed"] = field(default_factory=list)
+
+
+def plan(feeds: Iterable["Feed"]) -> list[SharedSearch]:
+    """
+    Group feeds into as few API searches as possible.
+
+    Feeds that use the same token and whose search params are the same once
+    any LOCAL_FILTERS are removed share one SharedSearch for those common
+    params, as long as some params remain: a search without any would scan
+    every public annotation, so feeds that only filter by LOCAL_FILTERS are
+    never coalesced. A feed that shares its search with no others keeps its
+    own, unmodified search params.
+    """
+    searches: dict[tuple[str, str | None, str | None], SharedSearch] = {}
+    for feed in feeds:
+        base_params = {
+            key: value
+            for key, value in feed.search_params.items()
+            if key not in LOCAL_FILTERS
+        }
+        key = (
+            json.dumps(base_params, sort_keys=True),
+            feed.token,
+            # A feed with no base params gets a search of its own.
+            None if base_params else feed.name,
+        )
+        searches.setdefault(key, SharedSearch(base_params, feed.token)).feeds.append(
+            feed
+        )
+
+    for search in searches.values():
+        if len(search.feeds) == 1:
+            search.search_params = search.feeds[0].search_params
+
+    return list(searches.values())
+
+
+class PredicateIndex:
+    """
+    Route annotations to the feeds whose local filters they match.
+
+    Rather than testing every feed's filters against every annotation, the
+    index maps each filter value to the feeds that filter on it, so matching
+    an annotation costs one dict lookup per value in the annotation.
+    """
+
+    def __init__(self, feeds: Iterable["Feed"]) -> None:
+        self._feeds = list(feeds)
+        # {field: {value: {feed_index, ...}}}
+        self._index: dict[str, dict[str, set[int]]] = defaultdict(
+            lambda: defaultdict(set)
+        )
+        # {field: {feed_index: number_of_values_the_annotation_must_match}}
+        self._required: dict[str, dict[int, int]] = defaultdict(dict)
+
+        for i, feed in enumerate(self._feeds):
+            for field_name, values in _feed_filters(feed).items():
+                for value in values:
+                    self._index[field_name][value].add(i)
+                self._required[field_name][i] = (
+                    len(values) if field_name in MATCH_ALL_FIELDS else 1
+                )
+
+    def match(self, annotation: Annotation) -> list["Feed"]:
+        """Return the feeds whose local filters match annotation."""
+        matches = set(range(len(self._feeds)))
+
+        for field_name, required in self._required.items():
+            hits = Counter(
+                i
+                for value in _annotation_values(annotation, field_name)
+                for i in self._index[field_name].get(value, ())
+            )
+            matches -= {i for i, count in required.items() if hits[i] < count}
+
+        return [self._feeds[i] for i in sorted(matches)]
+
+
+def _feed_filters(feed: "Feed") -> dict[str, set[str]]:
+    filters: dict[str, set[str]] = defaultdict(set)
+    for param, value in feed.search_params.items():
+        if field_name := LOCAL_FILTERS.get(param):
+            filters[field_name].update(
+                _normalize(item)
+                for item in ([value] if isinstance(value, str) else value)
+            )
+    return filters
+
+
+def _annotation_values(annotation: Annotation, field_name: str) -> set[str]:
+    if field_name == "tag":
+        return {_normalize(tag) for tag in annotation.tags}
+    # Feeds may filter on either a full userid ("acct:username@authority") or
+    # just a username.
+    return {_normalize(annotation.user), _normalize(annotation.username)}
+
+
+def _normalize(value: str) -> str:
+    # Like the API, match tags and users case-insensitively.
+    return value.lower()
@@ -0,0 +1,107 @@
+import sys
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TextIO
+
+PROFILERS = ("cpu", "mem")
+
+# Where each profiler writes its results if not given a path.
+DEFAULT_PATHS = {"cpu": "slack-annotations.pstats", "mem": "slack-annotations.mem.txt"}
+
+# How many functions or allocation sites to list.
+DEFAULT_TOP = 25
+
+# How many of the top entries to repeat in the summary on stderr.
+SUMMARY_TOP = 5
+
+
+@contextmanager
+def profile(
+    profiler: str | None,
+    path: str | None = None,
+    top: int = DEFAULT_TOP,
+    summary: TextIO | None = None,
+) -> Iterator[None]:
+    """
+    Profile the body of the with statement.
+
+    profiler is "cpu" (cProfile: the stats are dumped to path, for pstats or
+    snakeviz) or "mem" (tracemalloc: the top allocation sites are written to
+    path as text), or None to not profile at all. Either way a short summary
+    is written to summary (default: stderr).
+    """
+    if profiler is None:
+        yield
+        return
+
+    if profiler not in PROFILERS:
+        raise ValueError(f"Unknown profiler: {profiler!r}")
+
+    path = path or DEFAULT_PATHS[profiler]
+    summary = summary or sys.stderr
+
+    if profiler == "cpu":
+        with _profile_cpu(path, top, summary):
+            yield
+    else:
+        with _profile_mem(path, top, summary):
+            yield
+
+
+@contextmanager
+def _profile_cpu(path: str, top: int, summary: TextIO) -> Iterator[None]:
+    import cProfile  # pylint:disable=import-outside-toplevel
+    import pstats  # pylint:disable=import-outside-toplevel
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        stats = pstats.Stats(profiler, stream=summary)
+        print(
+            f"CPU profile written to {path},"
+            f" top {min(top, SUMMARY_TOP)} functions by cumulative time:",
+            file=summary,
+        )
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(min(top, SUMMARY_TOP))
+
+
+@contextmanager
+def _profile_mem(path: str, top: int, summary: TextIO) -> Iterator[None]:
+    import tracemalloc  # pylint:disable=import-outside-toplevel
+
+    already_tracing = tracemalloc.is_tracing()
+    if not already_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        yield
+    finally:
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        current, peak = tracemalloc.get_traced_memory()
+        if not already_tracing:
+            tracemalloc.stop()
+
+        statistics = snapshot.statistics("lineno")[:top]
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(f"current={current} peak={peak}\n")
+            for statistic in statistics:
+                file.write(f"{statistic}\n")
+
+        print(
+            f"Memory profile written to {path}: peak {_mib(peak)},"
+            f" still allocated {_mib(current)}, top {min(top, SUMMARY_TOP)}"
+            " allocation sites:",
+            file=summary,
+        )
+        for statistic in statistics[:SUMMARY_TOP]:
+            print(f"  {statistic}", file=summary)
+
+
+def _mib(size: int) -> str:
+    return f"{size / 2**20:.1f} MiB"
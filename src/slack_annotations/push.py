@@ -0,0 +1,267 @@
+import asyncio
+import logging
+from collections import deque
+from collections.abc import Awaitable, Callable, Iterable, Iterator
+from typing import Any
+
+from . import metrics
+from .feeds import Feed
+from .models import Annotation
+from .planner import LOCAL_FILTERS, PredicateIndex
+from .serialization import DECODE_ERRORS, loads
+from .state import StateStore
+
+logger = logging.getLogger(__name__)
+
+# How many pushed annotation IDs are remembered per feed, so that the
+# reconciliation polls don't deliver them a second time.
+PUSHED_IDS = 10_000
+
+# How many of a feed's most recently pushed annotation IDs are saved in its
+# state, so that they're still skipped after a restart. Only the annotations
+# pushed since the feed's last poll need to be, which is far fewer.
+SAVED_PUSHED_IDS = 1000
+
+# The largest request body that the push server accepts.
+MAX_BODY_SIZE = 10 * 1024 * 1024
+
+# The search params that pushed annotations can be matched against locally.
+PUSH_FILTERS = {*LOCAL_FILTERS, "group"}
+
+
+class RecentIds:
+    """
+    A bounded set of the most recently delivered annotation IDs.
+
+    An ID can also be claimed while its annotation is being delivered, see
+    claim(), so that a feed's pushes and polls never both deliver the same
+    annotation, and never both skip one that the other failed to deliver.
+    """
+
+    def __init__(self, maxlen: int = PUSHED_IDS) -> None:
+        self._ring: deque[str] = deque(maxlen=maxlen)
+        self._ids: set[str] = set()
+        self._claims: dict[str, asyncio.Event] = {}
+
+    def add(self, id_: str) -> None:
+        if id_ in self._ids:
+            return
+        if len(self._ring) == self._ring.maxlen:
+            self._ids.discard(self._ring[0])
+        self._ring.append(id_)
+        self._ids.add(id_)
+
+    def claim(self, id_: str) -> bool:
+        """
+        Claim id_ for delivery, or return False if it's delivered or claimed.
+
+        Every successful claim must be settled, see settle().
+        """
+        if id_ in self._ids or id_ in self._claims:
+            return False
+        self._claims[id_] = asyncio.Event()
+        return True
+
+    def settle(self, ids: Iterable[str], delivered: bool) -> None:
+        """Release the claims on ids, adding them if they were delivered."""
+        for id_ in ids:
+            if delivered:
+                self.add(id_)
+            self._claims.pop(id_).set()
+
+    async def wait(self, id_: str) -> None:
+        """Wait until id_ isn't claimed."""
+        while (event := self._claims.get(id_)) is not None:
+            await event.wait()
+
+    def __contains__(self, id_: object) -> bool:
+        return id_ in self._ids
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ring)
+
+    def __len__(self) -> int:
+        return len(self._ring)
+
+
+class PushRouter:
+    """
+    Route pushed annotations to the feeds that they belong to.
+
+    Only feeds whose search params can all be checked locally (a group and
+    LOCAL_FILTERS) can receive pushed annotations: the others, for example
+    feeds that search by uri or wildcard_uri, are left to their polls. The
+    ID of each annotation is claimed in the feed's pushed_ids() while it's
+    being delivered and remembered once it has been, so that the feed's
+    polls can skip it. If a feed's polls claim the IDs of the annotations
+    that they deliver too then pushes of those annotations are skipped in
+    turn. A push that fails releases its claims, leaving the annotations to
+    the feed's next poll.
+
+    If stores are given (a state store per feed name) the most recently
+    pushed IDs are saved in each feed's state after every delivery and
+    loaded again by the next router, so that a restart doesn't deliver
+    them again.
+    """
+
+    def __init__(
+        self,
+        feeds: Iterable[Feed],
+        deliver: Callable[[Feed, list[Annotation]], Awaitable[bool]],
+        stores: dict[str, StateStore] | None = None,
+    ) -> None:
+        self.feeds = [feed for feed in feeds if accepts_push(feed)]
+        self._deliver = deliver
+        self._index = PredicateIndex(self.feeds)
+        self._stores = stores or {}
+        self._pushed = {feed.name: RecentIds() for feed in self.feeds}
+        for feed in self.feeds:
+            if store := self._stores.get(feed.name):
+                for id_ in store.load(feed.name).get("pushed_ids", ()):
+                    self._pushed[feed.name].add(id_)
+
+    def pushed_ids(self, feed: Feed) -> RecentIds | None:
+        """Return the IDs of the annotations pushed to feed, if it takes pushes."""
+        return self._pushed.get(feed.name)
+
+    async def route(self, annotations: Iterable[Annotation]) -> None:
+        """Deliver annotations to every feed that they match."""
+        routed: dict[str, list[Annotation]] = {}
+        feeds = {feed.name: feed for feed in self.feeds}
+        for annotation in annotations:
+            for feed in self._index.match(annotation):
+                if not _group_matches(feed, annotation):
+                    continue
+                # An annotation that a poll is delivering is skipped rather
+                # than waited for: if that poll fails it doesn't save its
+                # cursor, so its next poll will deliver the annotation.
+                if annotation.id and not self._pushed[feed.name].claim(annotation.id):
+                    continue
+                routed.setdefault(feed.name, []).append(annotation)
+
+        for name, feed_annotations in routed.items():
+            metrics.count("pushed_rows", len(feed_annotations))
+            delivered = False
+            try:
+                delivered = await self._deliver(feeds[name], feed_annotations)
+            finally:
+                self._pushed[name].settle(
+                    [annotation.id for annotation in feed_annotations if annotation.id],
+                    delivered,
+                )
+            if delivered:
+                self._save(name)
+
+    def _save(self, name: str) -> None:
+        if store := self._stores.get(name):
+            state = store.load(name)
+            state["pushed_ids"] = list(self._pushed[name])[-SAVED_PUSHED_IDS:]
+            store.save(name, state)
+
+
+def accepts_push(feed: Feed) -> bool:
+    """Return True if pushed annotations can be matched against feed."""
+    return all(param in PUSH_FILTERS for param in feed.search_params)
+
+
+def parse_event(body: bytes) -> list[Annotation]:
+    """
+    Return the new annotations in a pushed event.
+
+    An event is a JSON annotation (as returned by the search API), a list of
+    them, or a message from the Hypothesis realtime (WebSocket) API:
+    {"type": "annotation-notification", "options": {"action": ...},
+    "payload": [...]}, of which only "create" notifications are used.
+
+    Raises ValueError if body isn't a valid event.
+    """
+    try:
+        event = loads(body)
+    except DECODE_ERRORS as err:
+        raise ValueError(f"Invalid JSON: {err}") from err
+
+    rows: Any
+    if isinstance(event, dict) and "type" in event:
+        if (
+            event["type"] != "annotation-notification"
+            or (event.get("options") or {}).get("action") != "create"
+        ):
+            return []
+        rows = event.get("payload") or []
+    elif isinstance(event, dict):
+        rows = [event]
+    else:
+        rows = event
+
+    try:
+        return [Annotation.from_row(row) for row in rows]
+    except (KeyError, TypeError, AttributeError) as err:
+        raise ValueError(f"Invalid annotation: {err!r}") from err
+
+
+async def serve_push(
+    handle: Callable[[list[Annotation]], Awaitable[None]],
+    host: str = "127.0.0.1",
+    port: int = 8080,
+) -> asyncio.Server:
+    """
+    Start accepting pushed annotation events over HTTP.
+
+    Each POST request's body is parsed by parse_event() and its annotations
+    passed to handle() before the response is sent, so a 202 response means
+    that the annotations have been delivered. Returns the server, which the
+    caller should close.
+    """
+
+    async def handle_connection(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            status = await _handle_request(reader, handle)
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Length: 0\r\n"
+                "Connection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle_connection, host, port)
+
+
+async def _handle_request(
+    reader: asyncio.StreamReader,
+    handle: Callable[[list[Annotation]], Awaitable[None]],
+) -> str:
+    """Read one request from reader, handle it and return the response status."""
+    method, _, _ = (await reader.readline()).decode("latin-1").partition(" ")
+    headers = {}
+    while line := (await reader.readline()).strip():
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if method != "POST":
+        return "405 Method Not Allowed"
+
+    try:
+        length = int(headers.get("content-length", ""))
+    except ValueError:
+        return "411 Length Required"
+    if length > MAX_BODY_SIZE:
+        return "413 Content Too Large"
+
+    try:
+        annotations = parse_event(await reader.readexactly(length))
+    except (ValueError, asyncio.IncompleteReadError):
+        logger.warning("Ignoring an invalid pushed event", exc_info=True)
+        return "400 Bad Request"
+
+    with metrics.timer("push"):
+        await handle(annotations)
+    return "202 Accepted"
+
+
+def _group_matches(feed: Feed, annotation: Annotation) -> bool:
+    group = feed.search_params.get("group")
+    return group is None or group == annotation.group
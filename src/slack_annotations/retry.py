@@ -0,0 +1,317 @@
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# The responses worth trying again: rate limiting and server errors that are
+# usually over by the time the next attempt is made.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# Only requests that are safe to repeat are retried.
+RETRY_METHODS = frozenset({"GET", "HEAD"})
+
+# How many times a failed request is retried, and the backoff before each
+# retry: a random delay of up to 0.5s, 1s, 2s, ... capped at 30s.
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 30.0
+
+# How many failures in a row open a host's circuit, and how long it stays
+# open before a single trial request is let through.
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+
+
+class CircuitOpenError(httpx.TransportError):
+    """A request wasn't sent because its host's circuit breaker is open."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    When and how long to wait before retrying a failed request.
+
+    Requests whose method is in `methods` are retried up to `max_retries`
+    times if they raise a transport error (a timeout or a dropped
+    connection) or get a response whose status is in `statuses`. Before
+    each retry the client waits a random time of up to `backoff` seconds,
+    doubling with each attempt up to `max_backoff` ("full jitter") so that
+    many clients that failed together don't all retry together.
+
+    A Retry-After header is honoured instead, unless it asks for a longer
+    wait than `max_backoff`: then the response is returned as it is rather
+    than holding up the caller.
+    """
+
+    max_retries: int = DEFAULT_MAX_RETRIES
+    backoff: float = DEFAULT_BACKOFF
+    max_backoff: float = DEFAULT_MAX_BACKOFF
+    statuses: frozenset[int] = RETRY_STATUSES
+    methods: frozenset[str] = RETRY_METHODS
+    rng: Callable[[], float] = field(default=random.random, compare=False)
+
+    def retry_delay(
+        self,
+        request: httpx.Request,
+        attempt: int,
+        response: httpx.Response | None = None,
+    ) -> float | None:
+        """
+        Return how long to wait before retrying request, or None not to retry.
+
+        attempt is the number of the attempt that just failed, starting at
+        1, and response is its response (None if it raised an error).
+        """
+        if request.method not in self.methods or attempt > self.max_retries:
+            return None
+
+        if response is not None:
+            if response.status_code not in self.statuses:
+                return None
+            if (retry_after := _retry_after(response)) is not None:
+                return retry_after if retry_after <= self.max_backoff else None
+
+        return self.rng() * min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+
+
+# The default policy, and one that never retries.
+DEFAULT_RETRY = RetryPolicy()
+NO_RETRY = RetryPolicy(max_retries=0)
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breakers that stop requests to a host that keeps failing.
+
+    A host's circuit opens after `failure_threshold` failures (transport
+    errors or 5xx responses) in a row. While it's open requests to the host
+    fail straight away with CircuitOpenError instead of adding to its load.
+    After `reset_timeout` seconds a single trial request is let through:
+    if it succeeds the circuit closes again, otherwise it stays open for
+    another `reset_timeout`.
+
+    A long-running process should share one breaker between all of its
+    clients and feeds so that they all back off from a failing host.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+        reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures: dict[str, int] = {}
+        # When each open circuit opened, or last let a trial request through.
+        self._opened: dict[str, float] = {}
+
+    def is_open(self, host: str) -> bool:
+        return host in self._opened
+
+    def allow(self, host: str) -> bool:
+        """Return True if a request to host may be sent now."""
+        if (opened := self._opened.get(host)) is None:
+            return True
+
+        now = self._clock()
+        if now - opened < self.reset_timeout:
+            return False
+
+        # Let this one request through as a trial and hold back any others
+        # until it's done (or, if it never reports back, for another
+        # reset_timeout).
+        self._opened[host] = now
+        return True
+
+    def record_success(self, host: str) -> None:
+        self._failures.pop(host, None)
+        if self._opened.pop(host, None) is not None:
+            logger.info("Circuit for %s closed", host)
+
+    def record_failure(self, host: str) -> None:
+        failures = self._failures[host] = self._failures.get(host, 0) + 1
+        if host in self._opened:
+            self._opened[host] = self._clock()
+        elif failures >= self.failure_threshold:
+            logger.warning("Circuit for %s opened after %d failures", host, failures)
+            metrics.count("circuits_opened")
+            self._opened[host] = self._clock()
+
+
+class RetryTransport(httpx.BaseTransport):
+    """
+    A transport that retries another transport's failed requests.
+
+    See RetryPolicy for which requests are retried and when. If a breaker is
+    given requests to hosts whose circuit is open aren't sent at all, see
+    CircuitBreaker.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.BaseTransport,
+        policy: RetryPolicy = DEFAULT_RETRY,
+        breaker: CircuitBreaker | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.transport = transport
+        self.policy = policy
+        self.breaker = breaker
+        self._sleep = sleep
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            attempt += 1
+            _check_circuit(self.breaker, request)
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError as error:
+                delay = _failed(self.policy, self.breaker, request, attempt, error)
+                if delay is None:
+                    raise
+                self._sleep(delay)
+                continue
+
+            delay = _responded(self.policy, self.breaker, request, attempt, response)
+            if delay is None:
+                return response
+            response.read()
+            response.close()
+            self._sleep(delay)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Asynchronous version of RetryTransport."""
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        policy: RetryPolicy = DEFAULT_RETRY,
+        breaker: CircuitBreaker | None = None,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ) -> None:
+        self.transport = transport
+        self.policy = policy
+        self.breaker = breaker
+        self._sleep = sleep
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            attempt += 1
+            _check_circuit(self.breaker, request)
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as error:
+                delay = _failed(self.policy, self.breaker, request, attempt, error)
+                if delay is None:
+                    raise
+                await self._sleep(delay)
+                continue
+
+            delay = _responded(self.policy, self.breaker, request, attempt, response)
+            if delay is None:
+                return response
+            await response.aread()
+            await response.aclose()
+            await self._sleep(delay)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def _check_circuit(breaker: CircuitBreaker | None, request: httpx.Request) -> None:
+    if breaker is not None and not breaker.allow(request.url.host):
+        metrics.count("circuit_open_errors")
+        raise CircuitOpenError(
+            f"Not sending request to {request.url.host}: its circuit is open",
+            request=request,
+        )
+
+
+def _failed(
+    policy: RetryPolicy,
+    breaker: CircuitBreaker | None,
+    request: httpx.Request,
+    attempt: int,
+    error: httpx.TransportError,
+) -> float | None:
+    """Record a request's error and return how long to wait to retry it."""
+    if breaker is not None:
+        breaker.record_failure(request.url.host)
+    return _log_retry(request, attempt, policy.retry_delay(request, attempt), error)
+
+
+def _responded(
+    policy: RetryPolicy,
+    breaker: CircuitBreaker | None,
+    request: httpx.Request,
+    attempt: int,
+    response: httpx.Response,
+) -> float | None:
+    """Record a request's response and return how long to wait to retry it."""
+    if breaker is not None:
+        if response.is_server_error:
+            breaker.record_failure(request.url.host)
+        else:
+            breaker.record_success(request.url.host)
+    return _log_retry(
+        request,
+        attempt,
+        policy.retry_delay(request, attempt, response),
+        response.status_code,
+    )
+
+
+def _log_retry(
+    request: httpx.Request,
+    attempt: int,
+    delay: float | None,
+    reason: httpx.TransportError | int,
+) -> float | None:
+    if delay is not None:
+        logger.warning(
+            "%s %s failed (attempt %d: %r), retrying in %.2fs",
+            request.method,
+            request.url.copy_with(query=None),
+            attempt,
+            reason,
+            delay,
+        )
+        metrics.count("retries")
+    return delay
+
+
+def _retry_after(response: httpx.Response) -> float | None:
+    """Return how many seconds response's Retry-After header asks for."""
+    if (value := response.headers.get("Retry-After")) is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=UTC)
+    return max(0.0, (date - datetime.now(UTC)).total_seconds())
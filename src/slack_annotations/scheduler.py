@@ -0,0 +1,113 @@
+import logging
+import time
+from collections import deque
+from collections.abc import Callable, Iterable
+from datetime import datetime
+from typing import TYPE_CHECKING
+
+from . import metrics
+
+# The CLI imports this module for its defaults, so TokenBucket (and with it
+# httpx and asyncio) is only imported once a budget is actually used.
+if TYPE_CHECKING:
+    from .feeds import Feed
+    from .slack import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# The shortest and longest times between polls of a feed.
+DEFAULT_MIN_INTERVAL = 10.0
+DEFAULT_MAX_INTERVAL = 3600.0
+
+# How far back a feed's arrival rate is measured.
+DEFAULT_WINDOW = 3600.0
+
+# How much a feed's interval grows after each poll that finds nothing new.
+DEFAULT_BACKOFF = 2.0
+
+
+class AdaptiveScheduler:  # pylint:disable=too-many-instance-attributes
+    """
+    Decides how long to wait before polling each feed again.
+
+    Each feed's interval follows its recent arrival rate: the number of its
+    annotations created in the last `window` seconds, going by the created
+    times of the annotations that its polls found. A feed that gets an
+    annotation a minute is polled about once a minute, but never more often
+    than every `min_interval` seconds. A poll that finds new annotations
+    never lengthens the interval, even if the feed has only just become
+    active or the annotations are all older than the window. After a poll
+    that finds nothing new the feed's interval is multiplied by `backoff`,
+    up to `max_interval`, so quiet feeds are polled less and less often.
+    Until its first poll has been recorded a feed's interval is its
+    configured interval.
+
+    If a budget is given all of the feeds' polls together are limited to
+    that many per minute: acquire() waits for the budget before each poll.
+    """
+
+    def __init__(  # pylint:disable=too-many-arguments
+        self,
+        *,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        max_interval: float = DEFAULT_MAX_INTERVAL,
+        window: float = DEFAULT_WINDOW,
+        backoff: float = DEFAULT_BACKOFF,
+        budget: float | None = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.window = window
+        self.backoff = backoff
+        self._clock = clock
+        self._arrivals: dict[str, deque[float]] = {}
+        self._intervals: dict[str, float] = {}
+        self._bucket: "TokenBucket | None" = None
+        if budget:
+            from .slack import TokenBucket  # pylint:disable=import-outside-toplevel
+
+            self._bucket = TokenBucket(budget / 60)
+
+    async def acquire(self) -> None:
+        """Wait until the budget allows another poll."""
+        if self._bucket is not None:
+            with metrics.timer("budget_wait"):
+                await self._bucket.acquire()
+
+    def interval(self, feed: "Feed") -> float:
+        """Return the current number of seconds between polls of feed."""
+        if (interval := self._intervals.get(feed.name)) is None:
+            return self._clamp(feed.interval)
+        return interval
+
+    def record(self, feed: "Feed", arrivals: Iterable[str] | None) -> float:
+        """
+        Record the result of a poll of feed and return its next interval.
+
+        arrivals are the created times of the new annotations that the
+        poll found, or None if the poll failed: a failed poll says nothing
+        about the feed's activity so it leaves the interval as it was.
+        """
+        interval = self.interval(feed)
+        if arrivals is None:
+            return interval
+
+        recent = self._arrivals.setdefault(feed.name, deque())
+        new = [datetime.fromisoformat(created).timestamp() for created in arrivals]
+        oldest = self._clock() - self.window
+        recent.extend(sorted(created for created in new if created >= oldest))
+        while recent and recent[0] < oldest:
+            recent.popleft()
+
+        if not new:
+            interval *= self.backoff
+        elif recent:
+            interval = min(interval, self.window / len(recent))
+        interval = self._intervals[feed.name] = self._clamp(interval)
+
+        logger.debug("Polling feed %r again in %.0fs", feed.name, interval)
+        return interval
+
+    def _clamp(self, interval: float) -> float:
+        return min(max(interval, self.min_interval), self.max_interval)
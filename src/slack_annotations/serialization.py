@@ -0,0 +1,103 @@
+import json
+from typing import Any, TypedDict
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore[assignment,unused-ignore]
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover
+    msgspec = None  # type: ignore[assignment,unused-ignore]
+
+
+# The fields of a search API row that Annotation.from_row() reads, used as a
+# schema to decode only these fields when msgspec is installed.
+class Selector(TypedDict, total=False):
+    exact: Any
+
+
+class Target(TypedDict, total=False):
+    selector: list[Selector] | None
+
+
+class Document(TypedDict, total=False):
+    title: Any
+
+
+class Links(TypedDict, total=False):
+    incontext: Any
+
+
+class UserInfo(TypedDict, total=False):
+    display_name: Any
+
+
+class Row(TypedDict, total=False):
+    id: Any
+    created: Any
+    user: Any
+    uri: Any
+    group: Any
+    text: Any
+    references: Any
+    tags: Any
+    target: list[Target] | None
+    document: Document | None
+    links: Links | None
+    user_info: UserInfo | None
+
+
+class _SearchResponse(TypedDict):
+    rows: list[Row]
+
+
+# The exceptions that loads() and decode_rows() raise for invalid JSON.
+DECODE_ERRORS: tuple[type[Exception], ...] = (
+    (json.JSONDecodeError,)
+    if msgspec is None
+    else (json.JSONDecodeError, msgspec.DecodeError)
+)
+
+_rows_decoder = msgspec.json.Decoder(_SearchResponse) if msgspec else None
+_encoder = msgspec.json.Encoder() if msgspec else None
+
+
+def loads(data: bytes | str) -> Any:
+    """Decode JSON using the fastest installed backend."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if msgspec is not None:
+        return msgspec.json.decode(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    """
+    Encode obj as compact JSON using the fastest installed backend.
+
+    Every backend produces the same output: no whitespace between items and
+    non-ASCII characters left unescaped.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    if _encoder is not None:
+        return _encoder.encode(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_rows(content: bytes, raw: bool = False) -> list[dict[str, Any]]:
+    """
+    Return the rows of a search API response body.
+
+    With msgspec installed, and unless raw is true, the rows are decoded
+    with Row as their schema: fields that aren't in Row are skipped while
+    parsing rather than decoded and then thrown away by Annotation.from_row(),
+    which is much faster and uses much less memory for pages of annotations
+    with large selectors and document metadata. Otherwise the rows are
+    decoded whole.
+    """
+    if _rows_decoder is not None and not raw:
+        return _rows_decoder.decode(content)["rows"]  # type: ignore[return-value,unused-ignore]
+    return loads(content)["rows"]
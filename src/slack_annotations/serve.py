@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import signal
+import sys
+from functools import partial
+from typing import Any, TextIO
+
+import httpx
+
+from . import metrics
+from .client import DEFAULT_TIMEOUT, make_async_client
+from .core import anotify
+from .feeds import Feed
+from .format import format_annotations
+from .models import Annotation
+from .push import PushRouter, RecentIds, serve_push
+from .retry import DEFAULT_RETRY, CircuitBreaker, CircuitOpenError, RetryPolicy
+from .scheduler import AdaptiveScheduler
+from .serialization import dumps
+from .slack import SlackError, SlackSender
+from .state import StateStore, open_store
+
+logger = logging.getLogger(__name__)
+
+
+async def serve(  # pylint:disable=too-many-arguments,too-many-locals
+    feeds: list[Feed],
+    output: TextIO = sys.stdout,
+    stop: asyncio.Event | None = None,
+    slack_token: str | None = None,
+    metrics_port: int | None = None,
+    *,
+    timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+    retry: RetryPolicy = DEFAULT_RETRY,
+    breaker: CircuitBreaker | None = None,
+    scheduler: AdaptiveScheduler | None = None,
+    push_port: int | None = None,
+    metrics_host: str = metrics.DEFAULT_HOST,
+) -> None:
+    """
+    Poll every feed on its own interval until stop is set.
+
+    All feeds share a single event loop and a single HTTP client, so each
+    poll reuses a kept-alive connection to the API. Each new message is
+    written to output as one line of JSON: {"feed": <name>, "message": ...}.
+    If no stop event is given one is created and set on SIGINT or SIGTERM.
+    Each feed's state store is opened once and kept for the life of serve(),
+    so a feed without a cache_path still remembers its cursor between polls.
+
+    If a Slack token is given the messages of feeds that have a channel are
+    posted straight to Slack instead, see SlackSender.
+
+    If a metrics port is given the per-stage timings and counters are served
+    on it in Prometheus's text format, see metrics.serve_metrics(). They're
+    only served to the local machine unless a wider metrics_host is given.
+
+    Requests to the API use timeout and are retried according to retry. All
+    feeds share one circuit breaker (breaker, or a new one) so that while
+    the API is down polls fail fast instead of every feed retrying against
+    it, see retry.CircuitBreaker.
+
+    If a scheduler is given it decides how often each feed is polled, going
+    by the feed's recent activity, instead of each feed's fixed interval.
+
+    If a push port is given annotations pushed to it are delivered to the
+    matching feeds as soon as they arrive, see push.serve_push(). Polling
+    carries on as a reconciliation pass that catches any annotations that
+    weren't pushed, and skips those that were.
+    """
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+    stores = {feed.name: open_store(feed.cache_path) for feed in feeds}
+
+    metrics_server = None
+    if metrics_port is not None:
+        metrics_server = await metrics.serve_metrics(metrics_host, metrics_port)
+
+    try:
+        async with (
+            make_async_client(
+                timeout=timeout, retry=retry, breaker=breaker or CircuitBreaker()
+            ) as client,
+            make_async_client() as slack_client,
+        ):
+            sender = SlackSender(slack_token, slack_client) if slack_token else None
+
+            async def deliver(feed: Feed, annotations: list[Annotation]) -> bool:
+                message = format_annotations(annotations, feed.group_name, feed.digest)
+                return await _deliver(feed, message, output, sender)
+
+            router = push_server = None
+            if push_port is not None:
+                router = PushRouter(feeds, deliver, stores)
+                push_server = await serve_push(router.route, port=push_port)
+
+            try:
+                await asyncio.gather(
+                    *(
+                        _serve_feed(
+                            client,
+                            feed,
+                            output,
+                            stop,
+                            sender,
+                            scheduler,
+                            router.pushed_ids(feed) if router else None,
+                            state=stores[feed.name],
+                        )
+                        for feed in feeds
+                    )
+                )
+            finally:
+                await _close(push_server)
+    finally:
+        await _close(metrics_server)
+
+
+async def _close(server: asyncio.Server | None) -> None:
+    if server:
+        server.close()
+        await server.wait_closed()
+
+
+async def _serve_feed(  # pylint:disable=too-many-arguments,too-many-positional-arguments
+    client: httpx.AsyncClient,
+    feed: Feed,
+    output: TextIO,
+    stop: asyncio.Event,
+    sender: SlackSender | None,
+    scheduler: AdaptiveScheduler | None = None,
+    pushed: RecentIds | None = None,
+    *,
+    state: StateStore | None = None,
+) -> None:
+    while not stop.is_set():
+        if scheduler:
+            await scheduler.acquire()
+        arrivals = await _poll_feed(client, feed, output, sender, pushed, state=state)
+        interval = scheduler.record(feed, arrivals) if scheduler else feed.interval
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except TimeoutError:
+            pass
+
+
+async def _poll_feed(  # pylint:disable=too-many-arguments
+    client: httpx.AsyncClient,
+    feed: Feed,
+    output: TextIO,
+    sender: SlackSender | None = None,
+    pushed: RecentIds | None = None,
+    *,
+    state: StateStore | None = None,
+) -> list[str] | None:
+    """
+    Poll feed once and write or post its message, if it has one.
+
+    The feed's cursor is kept in state, if given, or else in the store at the
+    feed's cache_path, and is only saved once the message has been
+    delivered. If pushed is given the feed also takes pushes (see
+    push.PushRouter): the ID of each new annotation is claimed in pushed as
+    it's found, so that it isn't pushed while this poll delivers it, and
+    annotations that have already been pushed are skipped. An annotation
+    that's still being pushed is waited for, so that the cursor never moves
+    past it before the push has succeeded.
+    Returns the created times of the feed's new annotations, or None if the
+    poll or the delivery failed.
+    """
+    arrivals: list[str] = []
+    claimed: list[str] = []
+    delivered = False
+
+    async def deliver(message: dict[str, Any]) -> bool:
+        nonlocal delivered
+        delivered = await _deliver(feed, message, output, sender)
+        return delivered
+
+    try:
+        await anotify(
+            client,
+            search_params=feed.search_params,
+            token=feed.token,
+            cache_path=feed.cache_path,
+            group_name=feed.group_name,
+            page_size=feed.page_size,
+            catch_up_hours=feed.catch_up_hours,
+            state=state,
+            state_key=feed.name,
+            arrivals=arrivals,
+            claim=partial(_claim, pushed, claimed) if pushed is not None else None,
+            digest=feed.digest,
+            deliver=deliver,
+        )
+    except CircuitOpenError as error:
+        logger.warning("Not polling feed %r: %s", feed.name, error)
+        return None
+    except Exception:  # pylint:disable=broad-exception-caught
+        # Don't let one failing feed take down the others: whatever went wrong
+        # (an HTTP error, a malformed response, a locked or unwritable state
+        # store...) log the error and try again on the feed's next poll.
+        logger.exception("Polling feed %r failed", feed.name)
+        return None
+    finally:
+        if pushed is not None:
+            pushed.settle(claimed, delivered)
+
+    return arrivals if delivered else None
+
+
+async def _claim(pushed: RecentIds, claimed: list[str], id_: str) -> bool:
+    """Claim id_ for a poll once no push of it is in flight, see _poll_feed()."""
+    await pushed.wait(id_)
+    if not pushed.claim(id_):
+        return False
+    claimed.append(id_)
+    return True
+
+
+async def _deliver(
+    feed: Feed,
+    message: dict[str, Any],
+    output: TextIO,
+    sender: SlackSender | None,
+) -> bool:
+    """
+    Write feed's message to output or post it to Slack, if it has one.
+
+    Returns False if posting the message to Slack failed.
+    """
+    if not message:
+        return True
+
+    if sender and feed.channel:
+        try:
+            await sender.send(feed.channel, [message])
+        except (httpx.HTTPError, SlackError):
+            logger.exception("Posting feed %r to Slack failed", feed.name)
+            return False
+    else:
+        output.write(dumps({"feed": feed.name, "message": message}) + "\n")
+        output.flush()
+    return True
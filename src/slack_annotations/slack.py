@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+import httpx
+
+from . import metrics
+from .format import pack_messages
+
+logger = logging.getLogger(__name__)
+
+POST_MESSAGE_URL = "https://slack.com/api/chat.postMessage"
+
+# Slack allows roughly one message per second per channel, with short bursts.
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 3
+
+# How many times to try posting a message before giving up on 429s and 5xxs.
+DEFAULT_MAX_ATTEMPTS = 5
+
+# How long to wait after a 429 or 5xx response that has no Retry-After header.
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class SlackError(Exception):
+    """Slack rejected a message."""
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter.
+
+    Tokens are added at `rate` per second up to `capacity`, and acquire()
+    waits until a token is available. pause() stops handing out tokens for
+    a while, for example when Slack responds with a Retry-After header.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait for a token and take it."""
+        async with self._lock:
+            while (delay := self._delay()) > 0:
+                await asyncio.sleep(delay)
+            self._tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the next `seconds` seconds."""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+        # Resume with a single token rather than a burst when the pause ends.
+        self._tokens = 1
+        self._updated = self._paused_until
+
+    def _delay(self) -> float:
+        """Refill the bucket and return how long until a token is available."""
+        now = self._clock()
+        if now < self._paused_until:
+            return self._paused_until - now
+
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.rate
+
+
+class SlackSender:
+    """
+    Posts Slack messages straight to chat.postMessage.
+
+    Requests are sent with client, which should be a pooled client shared by
+    every post. Each channel has its own token bucket so a busy channel
+    never holds up a quiet one, and a 429's Retry-After pauses only the
+    channel that it was for. Posts that fail with a 429 or a server error
+    are retried, up to max_attempts times.
+    """
+
+    def __init__(  # pylint:disable=too-many-arguments
+        self,
+        token: str,
+        client: httpx.AsyncClient,
+        *,
+        rate: float = DEFAULT_RATE,
+        burst: float = DEFAULT_BURST,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        url: str = POST_MESSAGE_URL,
+    ) -> None:
+        self.token = token
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.max_attempts = max_attempts
+        self.url = url
+        self._buckets: dict[str, TokenBucket] = {}
+
+    async def send(self, channel: str, messages: Iterable[dict[str, Any]]) -> int:
+        """
+        Post messages to channel, in order, and return the number of posts.
+
+        The messages' annotations are batched into as few posts as Slack's
+        limits allow, see format.pack_messages().
+        """
+        posts = 0
+        for batch in pack_messages(messages):
+            await self._post(channel, batch)
+            posts += 1
+        return posts
+
+    async def send_many(
+        self, deliveries: dict[str, list[dict[str, Any]]]
+    ) -> dict[str, int | BaseException]:
+        """
+        Post each channel's messages to it, all channels concurrently.
+
+        Returns the number of posts made to each channel or, if posting to a
+        channel failed, the exception that it raised.
+        """
+        results = await asyncio.gather(
+            *(self.send(channel, messages) for channel, messages in deliveries.items()),
+            return_exceptions=True,
+        )
+        return dict(zip(deliveries, results))
+
+    async def _post(self, channel: str, message: dict[str, Any]) -> None:
+        bucket = self._bucket(channel)
+        for attempt in range(1, self.max_attempts + 1):
+            with metrics.timer("slack_wait"):
+                await bucket.acquire()
+            with metrics.timer("slack_post"):
+                response = await self.client.post(
+                    self.url,
+                    json={"channel": channel, **message},
+                    headers={"Authorization": f"Bearer {self.token}"},
+                )
+
+            if (
+                response.status_code == httpx.codes.TOO_MANY_REQUESTS
+                or response.is_server_error
+            ):
+                retry_after = _retry_after(response)
+                logger.warning(
+                    "Posting to %s failed with %d (attempt %d), retrying in %ss",
+                    channel,
+                    response.status_code,
+                    attempt,
+                    retry_after,
+                )
+                metrics.count("slack_retries")
+                bucket.pause(retry_after)
+                continue
+
+            body = response.raise_for_status().json()
+            if not body.get("ok"):
+                raise SlackError(f"Posting to {channel} failed: {body.get('error')}")
+            metrics.count("slack_posts")
+            return
+
+        raise SlackError(f"Posting to {channel} failed: still rate limited or down")
+
+    def _bucket(self, channel: str) -> TokenBucket:
+        if channel not in self._buckets:
+            self._buckets[channel] = TokenBucket(self.rate, self.burst)
+        return self._buckets[channel]
+
+
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return DEFAULT_RETRY_AFTER
@@ -0,0 +1,46 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+# sqlite3 is only imported once a database is actually opened.
+if TYPE_CHECKING:
+    from sqlite3 import Connection
+
+# How long to wait for another process's write lock before giving up.
+DEFAULT_TIMEOUT = 30.0
+
+
+def connect(path: str, timeout: float = DEFAULT_TIMEOUT) -> "Connection":
+    """
+    Open the SQLite database at path for sharing between processes.
+
+    The database is put in WAL mode so readers never block a writer, and
+    writes must be made with transaction().
+    """
+    import sqlite3  # pylint:disable=import-outside-toplevel
+
+    # isolation_level=None: transactions are managed explicitly by transaction().
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+@contextmanager
+def transaction(connection: "Connection") -> Iterator[None]:
+    """
+    Run the body of the with statement as a single write transaction.
+
+    The transaction is committed if the body succeeds and rolled back if it
+    raises.
+    """
+    # BEGIN IMMEDIATE takes the write lock up front so that concurrent
+    # writers queue up (for up to the connection's timeout) rather than
+    # failing part way through the transaction.
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
@@ -0,0 +1,180 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import UTC, datetime
+from functools import cache
+from typing import Any
+
+from .serialization import DECODE_ERRORS, dumps, loads
+from .sqlite import connect, transaction
+
+logger = logging.getLogger(__name__)
+
+# The key that state is stored under when a store is used by a single feed.
+DEFAULT_KEY = "default"
+
+# File extensions that open_store() treats as SQLite databases.
+SQLITE_EXTENSIONS = (".sqlite", ".sqlite3", ".db")
+
+
+class StateStore(ABC):
+    """
+    Persistent per-feed state: cursors, seen IDs, validators and deliveries.
+
+    Each feed's state is a small JSON-serializable dict stored under a key
+    (the feed's name). Stores also keep a log of the annotations delivered
+    to each feed, if they support it.
+    """
+
+    @abstractmethod
+    def load(self, key: str) -> dict[str, Any]:
+        """Return key's state, or an empty dict if there is none."""
+
+    @abstractmethod
+    def save(
+        self, key: str, state: dict[str, Any], delivered: Iterable[str] = ()
+    ) -> None:
+        """Replace key's state and log the delivery of the delivered IDs."""
+
+
+class MemoryStore(StateStore):
+    """A store that keeps state in memory for the life of the process."""
+
+    def __init__(self) -> None:
+        self._states: dict[str, dict[str, Any]] = {}
+        self.deliveries: dict[str, list[str]] = defaultdict(list)
+
+    def load(self, key: str) -> dict[str, Any]:
+        return dict(self._states.get(key, {}))
+
+    def save(
+        self, key: str, state: dict[str, Any], delivered: Iterable[str] = ()
+    ) -> None:
+        self._states[key] = dict(state)
+        self.deliveries[key].extend(delivered)
+
+
+class JSONFileStore(StateStore):
+    """
+    A store that keeps a single feed's state in a JSON file.
+
+    This is the original cache file format so the key is ignored. The file is
+    replaced atomically (written to a temporary file and renamed over the
+    original) so a crash mid-write can never leave it corrupt. No delivery log
+    is kept.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self, key: str) -> dict[str, Any]:
+        try:
+            with open(self.path, "rb") as f:
+                return loads(f.read())
+        except FileNotFoundError:
+            return {}
+        except DECODE_ERRORS:
+            logger.warning("Ignoring unreadable state file %s", self.path)
+            return {}
+
+    def save(
+        self, key: str, state: dict[str, Any], delivered: Iterable[str] = ()
+    ) -> None:
+        import tempfile  # pylint:disable=import-outside-toplevel
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile(
+            "w", encoding="utf-8", dir=directory, suffix=".tmp", delete=False
+        ) as f:
+            try:
+                f.write(dumps(state))
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                os.unlink(f.name)
+                raise
+        os.replace(f.name, self.path)
+
+
+class SQLiteStore(StateStore):
+    """
+    A store that keeps many feeds' state and delivery logs in one database.
+
+    The database is opened in WAL mode and every save is a single
+    transaction, so several worker processes can safely share one file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection = connect(path)
+        self._connection.executescript("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS deliveries (
+                key TEXT NOT NULL,
+                annotation_id TEXT NOT NULL,
+                delivered_at TEXT NOT NULL,
+                PRIMARY KEY (key, annotation_id)
+            );
+            """)
+
+    def load(self, key: str) -> dict[str, Any]:
+        row = self._connection.execute(
+            "SELECT value FROM state WHERE key = ?", (key,)
+        ).fetchone()
+        return loads(row[0]) if row else {}
+
+    def save(
+        self, key: str, state: dict[str, Any], delivered: Iterable[str] = ()
+    ) -> None:
+        delivered_at = datetime.now(UTC).isoformat()
+        with transaction(self._connection):
+            self._connection.execute(
+                "INSERT INTO state (key, value) VALUES (?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, dumps(state)),
+            )
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO deliveries (key, annotation_id, delivered_at)"
+                " VALUES (?, ?, ?)",
+                ((key, annotation_id, delivered_at) for annotation_id in delivered),
+            )
+
+    def deliveries(self, key: str) -> list[str]:
+        """Return the IDs of the annotations delivered to key, oldest first."""
+        return [
+            row[0]
+            for row in self._connection.execute(
+                "SELECT annotation_id FROM deliveries WHERE key = ?"
+                " ORDER BY delivered_at, rowid",
+                (key,),
+            )
+        ]
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def open_store(path: str | None = None) -> StateStore:
+    """
+    Return the store for path.
+
+    A path ending in one of SQLITE_EXTENSIONS is a SQLite database that many
+    feeds can share, any other path is a single feed's JSON file, and no
+    path at all means an in-memory store.
+    """
+    if not path:
+        return MemoryStore()
+    if path.endswith(SQLITE_EXTENSIONS):
+        return _open_sqlite_store(path)
+    return JSONFileStore(path)
+
+
+@cache
+def _open_sqlite_store(path: str) -> SQLiteStore:
+    # Share one connection per database between every feed in the process.
+    return SQLiteStore(path)
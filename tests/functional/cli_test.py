@@ -1,4 +1,5 @@
 import json
+import sys
 from datetime import UTC, datetime, timedelta
 from subprocess import run
 
@@ -7,7 +8,7 @@ import pytest
 from freezegun import freeze_time
 
 from src.slack_annotations.cli import cli
-from src.slack_annotations.core import SEARCH_HOURS
+from src.slack_annotations.core import MAX_PAGE_SIZE, SEARCH_HOURS
 
 
 def test_help():
@@ -20,6 +21,31 @@ def test_version():
     run(["slack-annotations", "--version"], check=True)
 
 
+@pytest.mark.parametrize("argv", [["--version"], ["--help"], ["--raw"]])
+def test_startup_doesnt_import_slow_modules(argv):
+    """Test that starting the CLI doesn't import modules it doesn't need yet."""
+    result = run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"from slack_annotations.cli import cli; cli({argv!r})",
+        ],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+
+    imported = {
+        line.rpartition("|")[2].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+    assert "slack_annotations.cli" in imported
+    assert not imported & {"httpx", "asyncio", "sqlite3", "ssl", "cProfile"}
+
+
 @freeze_time("2024-12-01T01:00:00+00:00")
 def test_cli_default(search_annotations, slack_annotations, httpx_mock, capsys):
     """Test the slack-annotations with default options."""
@@ -28,6 +54,7 @@ def test_cli_default(search_annotations, slack_annotations, httpx_mock, capsys):
         "sort": "created",
         "order": "asc",
         "search_after": search_after,
+        "limit": MAX_PAGE_SIZE,
     }
     httpx_mock.add_response(
         url=httpx.URL("https://hypothes.is/api/search", params=params),
@@ -36,7 +63,7 @@ def test_cli_default(search_annotations, slack_annotations, httpx_mock, capsys):
 
     cli([])
 
-    assert capsys.readouterr().out.strip() == json.dumps(slack_annotations)
+    assert json.loads(capsys.readouterr().out) == slack_annotations
 
 
 @freeze_time("2024-12-01T01:00:00+00:00")
@@ -49,6 +76,7 @@ def test_cli_with_search_after_from_cache_file(
         "sort": "created",
         "order": "asc",
         "search_after": search_after,
+        "limit": MAX_PAGE_SIZE,
     }
     httpx_mock.add_response(
         url=httpx.URL("https://hypothes.is/api/search", params=params),
@@ -59,7 +87,7 @@ def test_cli_with_search_after_from_cache_file(
 
     cli(["--cache-path", str(cache_path)])
 
-    assert capsys.readouterr().out.strip() == json.dumps(slack_annotations)
+    assert json.loads(capsys.readouterr().out) == slack_annotations
     assert json.loads(cache_path.read_text()) == {
         "search_after": "2024-12-03T18:40:42.325652+00:00"
     }
@@ -73,6 +101,7 @@ def test_cli_token(search_annotations, slack_annotations, httpx_mock, capsys):
         "sort": "created",
         "order": "asc",
         "search_after": search_after,
+        "limit": MAX_PAGE_SIZE,
     }
     token = "test-token"
     httpx_mock.add_response(
@@ -83,7 +112,30 @@ def test_cli_token(search_annotations, slack_annotations, httpx_mock, capsys):
 
     cli(["--token", token])
 
-    assert capsys.readouterr().out.strip() == json.dumps(slack_annotations)
+    assert json.loads(capsys.readouterr().out) == slack_annotations
+
+
+@freeze_time("2024-12-01T01:00:00+00:00")
+def test_cli_ndjson(search_annotations, slack_annotations, httpx_mock, capsys):
+    """Test the slack-annotations --output ndjson option."""
+    httpx_mock.add_response(content=json.dumps(search_annotations))
+
+    cli(["--output", "ndjson"])
+
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line) for line in lines] == [slack_annotations]
+
+
+@freeze_time("2024-12-01T01:00:00+00:00")
+def test_cli_ndjson_raw(search_annotations, httpx_mock, capsys):
+    """Test the slack-annotations --output ndjson --raw options."""
+    httpx_mock.add_response(content=json.dumps(search_annotations))
+
+    cli(["--output", "ndjson", "--raw"])
+
+    assert [
+        json.loads(line) for line in capsys.readouterr().out.splitlines()
+    ] == search_annotations["rows"]
 
 
 @pytest.fixture
@@ -0,0 +1,75 @@
+import asyncio
+import io
+import json
+import socket
+import time
+from datetime import UTC, datetime
+
+import httpx
+import pytest
+
+from slack_annotations.feeds import Feed
+from slack_annotations.serve import serve
+
+
+@pytest.mark.httpx_mock(should_mock=lambda request: request.url.host != "127.0.0.1")
+def test_pushed_annotations_are_delivered_within_a_second(httpx_mock, tmp_path):
+    """Test that serve delivers a pushed annotation at once, and only once."""
+    row = {
+        "id": "id_1",
+        "created": datetime.now(UTC).isoformat(),
+        "user": "acct:user@hypothes.is",
+        "uri": "https://example.com/",
+        "group": "eng",
+        "links": {"incontext": "https://hyp.is/id_1"},
+    }
+    # The reconciliation polls find nothing at first, and then the pushed
+    # annotation.
+    httpx_mock.add_response(content=json.dumps({"rows": []}))
+    httpx_mock.add_response(content=json.dumps({"rows": [row]}), is_reusable=True)
+    feed = Feed(
+        name="eng",
+        search_params={"group": "eng"},
+        cache_path=str(tmp_path / "eng.json"),
+        interval=0.2,
+    )
+    output = io.StringIO()
+    port = free_port()
+
+    async def run():
+        stop = asyncio.Event()
+        server = asyncio.create_task(serve([feed], output, stop, push_port=port))
+        await asyncio.sleep(0.1)
+
+        start = time.monotonic()
+        async with httpx.AsyncClient() as emitter:
+            response = await emitter.post(
+                f"http://127.0.0.1:{port}/",
+                json={
+                    "type": "annotation-notification",
+                    "options": {"action": "create"},
+                    "payload": [row],
+                },
+            )
+        latency = time.monotonic() - start
+
+        # Give the reconciliation poll a chance to find the pushed annotation.
+        await asyncio.sleep(0.5)
+        stop.set()
+        await server
+        return response, latency
+
+    response, latency = asyncio.run(run())
+
+    assert response.status_code == 202
+    assert latency < 1
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["message"]["text"] == "A new annotation was posted"
+    assert len(httpx_mock.get_requests()) >= 2
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,185 @@
+import json
+import threading
+import time
+from datetime import UTC, datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import pytest
+
+from slack_annotations.client import make_client
+from slack_annotations.core import notify
+from slack_annotations.retry import CircuitBreaker, CircuitOpenError, RetryPolicy
+from slack_annotations.state import MemoryStore
+
+# Retry straight away so that the tests don't have to wait for the backoff.
+RETRY_NOW = RetryPolicy(backoff=0)
+
+
+def test_it_retries_server_errors(fault_server):
+    fault_server.faults = [502, 503]
+
+    with fault_server.client() as client:
+        response = client.get(SEARCH_URL)
+
+    assert response.json() == {"rows": []}
+    assert fault_server.requests == 3
+
+
+def test_it_honours_retry_after(fault_server):
+    fault_server.faults = [(429, "1")]
+
+    start = time.monotonic()
+    with fault_server.client() as client:
+        response = client.get(SEARCH_URL)
+
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 1
+
+
+def test_it_retries_read_timeouts(fault_server):
+    fault_server.faults = ["hang"]
+
+    with fault_server.client(timeout=httpx.Timeout(0.2)) as client:
+        response = client.get(SEARCH_URL)
+
+    assert response.status_code == 200
+    assert fault_server.requests == 2
+
+
+def test_it_retries_dropped_connections(fault_server):
+    fault_server.faults = ["drop", "drop"]
+
+    with fault_server.client() as client:
+        response = client.get(SEARCH_URL)
+
+    assert response.status_code == 200
+    assert fault_server.requests == 3
+
+
+def test_it_gives_up_after_max_retries(fault_server):
+    fault_server.faults = [503] * 10
+
+    with fault_server.client(retry=RetryPolicy(max_retries=2, backoff=0)) as client:
+        response = client.get(SEARCH_URL)
+
+    assert response.status_code == 503
+    assert fault_server.requests == 3
+
+
+def test_the_circuit_breaker_stops_requests_to_a_failing_api(fault_server):
+    fault_server.faults = [503] * 10
+    breaker = CircuitBreaker(failure_threshold=3)
+
+    with fault_server.client(breaker=breaker) as client:
+        for _ in range(5):
+            with pytest.raises(CircuitOpenError):
+                client.get(SEARCH_URL)
+
+    assert fault_server.requests == 3
+
+
+def test_notify_rides_out_faults(fault_server):
+    fault_server.faults = [503, "drop", (429, "0")]
+    fault_server.rows = [
+        {
+            "id": "id_1",
+            "created": datetime.now(UTC).isoformat(),
+            "user": "acct:user@hypothes.is",
+            "uri": "https://example.com/",
+            "links": {"incontext": "https://hyp.is/id_1"},
+        }
+    ]
+
+    with fault_server.client() as client:
+        message = notify(client=client, catch_up_hours=None, state=MemoryStore())
+
+    assert message["text"] == "A new annotation was posted"
+    assert fault_server.requests == 4
+
+
+SEARCH_URL = "https://hypothes.is/api/search"
+
+
+class FaultServer:
+    """
+    A stand-in for the search API that injects faults into its responses.
+
+    Each request takes the next fault from `faults` until there are none
+    left and then gets a page of `rows`. A fault is a status code, a
+    (status code, Retry-After) pair, "hang" (never respond) or "drop"
+    (close the connection without responding).
+    """
+
+    def __init__(self):
+        self.faults = []
+        self.rows = []
+        self.requests = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    def client(self, retry=RETRY_NOW, breaker=None, timeout=httpx.Timeout(5.0)):
+        return make_client(
+            timeout=timeout,
+            transport=LocalTransport(self.httpd.server_address[1]),
+            retry=retry,
+            breaker=breaker,
+        )
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server.requests += 1
+                fault = server.faults.pop(0) if server.faults else None
+
+                if fault in ("hang", "drop"):
+                    if fault == "hang":
+                        time.sleep(0.5)
+                    self.close_connection = True
+                    return
+
+                status, retry_after = (
+                    fault if isinstance(fault, tuple) else (fault, None)
+                )
+                body = json.dumps({"rows": [] if status else server.rows}).encode()
+                self.send_response(status or 200)
+                if retry_after is not None:
+                    self.send_header("Retry-After", retry_after)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *_args):
+                pass
+
+        return Handler
+
+
+class LocalTransport(httpx.HTTPTransport):
+    """A transport that sends a copy of every request to a server on localhost."""
+
+    def __init__(self, port):
+        super().__init__()
+        self.port = port
+
+    def handle_request(self, request):
+        url = request.url.copy_with(scheme="http", host="127.0.0.1", port=self.port)
+        return super().handle_request(
+            httpx.Request(request.method, url, headers=request.headers)
+        )
+
+
+@pytest.fixture
+def fault_server():
+    server = FaultServer()
+    thread = threading.Thread(
+        target=server.httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
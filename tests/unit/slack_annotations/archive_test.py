@@ -0,0 +1,148 @@
+from datetime import UTC, datetime
+
+import pytest
+
+from slack_annotations import metrics
+from slack_annotations.archive import Archive
+from slack_annotations.models import Annotation
+
+
+class TestArchive:
+    def test_it(self, archive):
+        for annotation in ANNOTATIONS:
+            archive.append(annotation)
+
+        assert list(archive.scan()) == ANNOTATIONS
+        assert [annotation.raw for annotation in archive.scan()] == [
+            annotation.raw for annotation in ANNOTATIONS
+        ]
+
+    def test_it_persists_the_annotations(self, tmp_path):
+        path = str(tmp_path / "archive.db")
+        archive = Archive(path)
+        archive.append(ANNOTATIONS[0])
+        archive.close()
+
+        archive = Archive(path)
+        try:
+            assert list(archive.scan()) == ANNOTATIONS[:1]
+        finally:
+            archive.close()
+
+    def test_it_writes_in_batches(self, tmp_path):
+        path = str(tmp_path / "archive.db")
+        archive = Archive(path, batch_size=2)
+        reader = Archive(path)
+
+        try:
+            archive.append(ANNOTATIONS[0])
+            assert not reader
+            archive.append(ANNOTATIONS[1])
+            assert len(reader) == 2
+        finally:
+            archive.close()
+            reader.close()
+
+    def test_it_never_replaces_an_annotation(self, archive):
+        archive.append(ANNOTATIONS[0])
+        archive.flush()
+
+        edited = Annotation.from_row({**ANNOTATIONS[0].raw, "text": "Edited"}, True)
+        archive.append(edited)
+
+        assert [annotation.text for annotation in archive.scan()] == [None]
+        assert len(archive) == 1
+
+    def test_it_ignores_annotations_without_ids(self, archive):
+        archive.append(Annotation.from_row({**ANNOTATIONS[0].raw, "id": None}, True))
+
+        assert not archive
+
+    def test_it_requires_raw_rows(self, archive):
+        with pytest.raises(ValueError):
+            archive.append(Annotation.from_row(ANNOTATIONS[0].raw))
+
+    @pytest.mark.parametrize(
+        "kwargs,expected",
+        [
+            ({"since": datetime(2024, 12, 1, 0, 10, tzinfo=UTC)}, ["id_2", "id_3"]),
+            ({"until": datetime(2024, 12, 1, 0, 20, tzinfo=UTC)}, ["id_1", "id_2"]),
+            # Naive datetimes are UTC.
+            (
+                {
+                    "since": datetime(2024, 12, 1, 0, 15),
+                    "until": datetime(2024, 12, 1, 0, 25),
+                },
+                ["id_2"],
+            ),
+            ({"group": "eng"}, ["id_1", "id_3"]),
+        ],
+    )
+    def test_scan(self, archive, kwargs, expected):
+        for annotation in ANNOTATIONS:
+            archive.append(annotation)
+
+        assert [annotation.id for annotation in archive.scan(**kwargs)] == expected
+
+    def test_a_failed_flush_is_rolled_back(self, archive):
+        # A row that can't be serialized fails the batch part way through.
+        unserializable = Annotation.from_row({**ANNOTATIONS[1].raw, "x": {1}}, True)
+        archive.append(ANNOTATIONS[0])
+        archive.append(unserializable)
+
+        with pytest.raises(TypeError):
+            archive.flush()
+
+        # Nothing from the failed batch was written, and the archive still
+        # works.
+        archive._pending.clear()  # pylint:disable=protected-access
+        assert not archive
+        archive.append(ANNOTATIONS[2])
+        assert [annotation.id for annotation in archive.scan()] == ["id_3"]
+
+    def test_contains(self, archive):
+        archive.append(ANNOTATIONS[0])
+        assert "id_1" in archive
+
+        archive.flush()
+        assert "id_1" in archive
+        assert "id_2" not in archive
+
+    def test_it_counts_archived_rows(self, archive):
+        registry = metrics.enable()
+
+        try:
+            for annotation in ANNOTATIONS:
+                archive.append(annotation)
+            archive.flush()
+        finally:
+            metrics.disable()
+
+        assert registry.counters["archived_rows"] == 3
+
+    @pytest.fixture
+    def archive(self, tmp_path):
+        archive = Archive(str(tmp_path / "archive.db"))
+        yield archive
+        archive.close()
+
+
+def annotation(id_, created, group):
+    return Annotation.from_row(
+        {
+            "id": id_,
+            "created": created,
+            "user": "acct:user@hypothes.is",
+            "uri": "https://example.com/",
+            "group": group,
+            "links": {"incontext": f"https://hyp.is/{id_}"},
+        },
+        keep_raw=True,
+    )
+
+
+ANNOTATIONS = [
+    annotation("id_1", "2024-12-01T00:10:00+00:00", "eng"),
+    annotation("id_2", "2024-12-01T00:20:00+00:00", "__world__"),
+    annotation("id_3", "2024-12-01T00:30:00+00:00", "eng"),
+]
@@ -1,9 +1,25 @@
 import json
+from datetime import UTC, datetime
 from importlib.metadata import version
+from unittest.mock import ANY
 
+import httpx
 import pytest
 
+from slack_annotations import metrics
+from slack_annotations.archive import Archive
 from slack_annotations.cli import cli
+from slack_annotations.client import DEFAULT_TIMEOUT
+from slack_annotations.core import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_SLICES,
+    MAX_PAGE_SIZE,
+    SEARCH_HOURS,
+)
+from slack_annotations.format import DEFAULT_DIGEST_SNIPPETS, Digest
+from slack_annotations.models import Annotation
+from slack_annotations.retry import DEFAULT_RETRY, RetryPolicy
+from slack_annotations.scheduler import AdaptiveScheduler
 
 
 def test_help():
@@ -27,7 +43,15 @@ def test_default(capsys, notify):
     cli([])
 
     notify.assert_called_once_with(
-        search_params=None, token=None, cache_path=None, group_name=None
+        search_params=None,
+        token=None,
+        cache_path=None,
+        group_name=None,
+        page_size=MAX_PAGE_SIZE,
+        client=ANY,
+        catch_up_hours=SEARCH_HOURS,
+        digest=None,
+        archive=None,
     )
     assert capsys.readouterr().out.strip() == json.dumps(notify.return_value)
 
@@ -39,11 +63,478 @@ def test_search_params(capsys, notify):
     cli(["--search-params", json.dumps(search_params)])
 
     notify.assert_called_once_with(
-        search_params=search_params, token=None, cache_path=None, group_name=None
+        search_params=search_params,
+        token=None,
+        cache_path=None,
+        group_name=None,
+        page_size=MAX_PAGE_SIZE,
+        client=ANY,
+        catch_up_hours=SEARCH_HOURS,
+        digest=None,
+        archive=None,
     )
     assert capsys.readouterr().out.strip() == json.dumps(notify.return_value)
 
 
+def test_page_size(notify):
+    notify.return_value = {}
+
+    cli(["--page-size", "50"])
+
+    notify.assert_called_once_with(
+        search_params=None,
+        token=None,
+        cache_path=None,
+        group_name=None,
+        page_size=50,
+        client=ANY,
+        catch_up_hours=SEARCH_HOURS,
+        digest=None,
+        archive=None,
+    )
+
+
+def test_catch_up_hours(notify):
+    notify.return_value = {}
+
+    cli(["--catch-up-hours", "24"])
+
+    assert notify.call_args.kwargs["catch_up_hours"] == 24
+
+
+@pytest.mark.parametrize(
+    "args,expected",
+    [
+        (["--digest-threshold", "5"], Digest(5, DEFAULT_DIGEST_SNIPPETS)),
+        (["--digest-threshold", "5", "--digest-snippets", "2"], Digest(5, 2)),
+        (["--digest-snippets", "2"], None),
+    ],
+)
+def test_digest(notify, args, expected):
+    notify.return_value = {}
+
+    cli(args)
+
+    assert notify.call_args.kwargs["digest"] == expected
+
+
+def test_digest_requires_json():
+    with pytest.raises(SystemExit) as exc_info:
+        cli(["--output", "ndjson", "--digest-threshold", "5"])
+
+    assert exc_info.value.code
+
+
+def test_timeouts_and_retries(notify, make_client):
+    notify.return_value = {}
+
+    cli(["--connect-timeout", "2", "--read-timeout", "10", "--max-retries", "5"])
+
+    make_client.assert_called_once_with(
+        timeout=httpx.Timeout(10, connect=2), retry=RetryPolicy(max_retries=5)
+    )
+    assert (
+        notify.call_args.kwargs["client"]
+        == make_client.return_value.__enter__.return_value
+    )
+
+
+def test_ndjson(capsys, notify, iter_annotations, iter_messages):
+    iter_messages.return_value = iter([{"text": "1"}, {"text": "2"}])
+
+    cli(["--output", "ndjson", "--group-name", "Eng"])
+
+    iter_annotations.assert_called_once_with(
+        search_params=None,
+        token=None,
+        cache_path=None,
+        page_size=MAX_PAGE_SIZE,
+        client=ANY,
+        catch_up_hours=SEARCH_HOURS,
+        raw=False,
+        archive=None,
+    )
+    iter_messages.assert_called_once_with(iter_annotations.return_value, "Eng")
+    assert capsys.readouterr().out == '{"text":"1"}\n{"text":"2"}\n'
+    notify.assert_not_called()
+
+
+def test_ndjson_raw(capsys, iter_annotations, iter_messages):
+    iter_annotations.return_value = iter(
+        [
+            Annotation.from_row(row, keep_raw=True)
+            for row in [ROW, {**ROW, "id": "id_2"}]
+        ]
+    )
+
+    cli(["--output", "ndjson", "--raw"])
+
+    assert iter_annotations.call_args.kwargs["raw"]
+    assert [json.loads(line) for line in capsys.readouterr().out.splitlines()] == [
+        ROW,
+        {**ROW, "id": "id_2"},
+    ]
+    iter_messages.assert_not_called()
+
+
+def test_raw_requires_ndjson():
+    with pytest.raises(SystemExit) as exc_info:
+        cli(["--raw"])
+
+    assert exc_info.value.code
+
+
+def test_metrics_file(tmp_path, notify):
+    metrics_file = tmp_path / "metrics.json"
+
+    def fake_notify(**_kwargs):
+        metrics.count("rows", 3)
+        return {}
+
+    notify.side_effect = fake_notify
+
+    cli(["--metrics-file", str(metrics_file)])
+
+    assert json.loads(metrics_file.read_text()) == {
+        "counters": {"rows": 3},
+        "timings": {},
+    }
+    assert metrics.get_registry() is None
+
+
+def test_profile(tmp_path, capsys, notify):
+    notify.return_value = {}
+    path = tmp_path / "profile.pstats"
+
+    cli(["--profile", "cpu", "--profile-path", str(path)])
+
+    assert path.exists()
+    assert f"CPU profile written to {path}" in capsys.readouterr().err
+
+
+def test_serve(notify, load_feeds, serve, monkeypatch):
+    monkeypatch.delenv("SLACK_BOT_TOKEN", raising=False)
+
+    cli(["serve", "--config", "feeds.toml"])
+
+    load_feeds.assert_called_once_with("feeds.toml")
+    serve.assert_called_once_with(
+        load_feeds.return_value,
+        slack_token=None,
+        metrics_port=None,
+        timeout=DEFAULT_TIMEOUT,
+        retry=DEFAULT_RETRY,
+        scheduler=None,
+        push_port=None,
+        metrics_host="127.0.0.1",
+    )
+    notify.assert_not_called()
+
+
+def test_serve_profile_and_metrics_file(tmp_path, load_feeds, serve):
+    profile_path, metrics_path = tmp_path / "profile.pstats", tmp_path / "m.json"
+
+    cli(
+        [
+            "--profile",
+            "cpu",
+            "--profile-path",
+            str(profile_path),
+            "--metrics-file",
+            str(metrics_path),
+            "serve",
+            "--config",
+            "feeds.toml",
+        ]
+    )
+
+    serve.assert_called_once()
+    assert serve.call_args.args == (load_feeds.return_value,)
+    assert profile_path.exists()
+    assert json.loads(metrics_path.read_text())["counters"] == {}
+    assert metrics.get_registry() is None
+
+
+def test_serve_slack_token(load_feeds, serve, monkeypatch):
+    monkeypatch.setenv("MY_SLACK_TOKEN", "xoxb-test")
+
+    cli(["serve", "--config", "feeds.toml", "--slack-token-env", "MY_SLACK_TOKEN"])
+
+    assert serve.call_args.args == (load_feeds.return_value,)
+    assert serve.call_args.kwargs["slack_token"] == "xoxb-test"
+
+
+def test_serve_metrics_port(load_feeds, serve):
+    cli(["serve", "--config", "feeds.toml", "--metrics-port", "9100"])
+
+    assert serve.call_args.args == (load_feeds.return_value,)
+    assert serve.call_args.kwargs["metrics_port"] == 9100
+
+
+def test_serve_metrics_host(load_feeds, serve):
+    cli(["serve", "--config", "feeds.toml", "--metrics-host", "0.0.0.0"])
+
+    assert serve.call_args.args == (load_feeds.return_value,)
+    assert serve.call_args.kwargs["metrics_host"] == "0.0.0.0"
+
+
+def test_serve_timeouts_and_retries(load_feeds, serve):
+    cli(["--read-timeout", "10", "--max-retries", "0", "serve", "--config", "x.toml"])
+
+    assert serve.call_args.args == (load_feeds.return_value,)
+    assert serve.call_args.kwargs["timeout"] == httpx.Timeout(10, connect=5)
+    assert serve.call_args.kwargs["retry"] == RetryPolicy(max_retries=0)
+
+
+def test_serve_push_port(load_feeds, serve):
+    cli(["serve", "--config", "feeds.toml", "--push-port", "8080"])
+
+    assert serve.call_args.args == (load_feeds.return_value,)
+    assert serve.call_args.kwargs["push_port"] == 8080
+
+
+def test_serve_adaptive(load_feeds, serve):
+    cli(
+        [
+            "serve",
+            "--config",
+            "feeds.toml",
+            "--adaptive",
+            "--min-interval",
+            "5",
+            "--max-interval",
+            "600",
+            "--budget",
+            "30",
+        ]
+    )
+
+    assert serve.call_args.args == (load_feeds.return_value,)
+    scheduler = serve.call_args.kwargs["scheduler"]
+    assert isinstance(scheduler, AdaptiveScheduler)
+    assert scheduler.min_interval == 5
+    assert scheduler.max_interval == 600
+
+
+def test_serve_requires_a_config():
+    with pytest.raises(SystemExit) as exc_info:
+        cli(["serve"])
+
+    assert exc_info.value.code
+
+
+def test_backfill(capsys, backfill, notify):
+    backfill.return_value = {"text": "2 new annotations"}
+
+    cli(
+        [
+            "--group-name",
+            "Eng",
+            "backfill",
+            "--since",
+            "2024-12-01T00:00:00+00:00",
+            "--until",
+            "2024-12-02",
+        ]
+    )
+
+    backfill.assert_called_once_with(
+        since=datetime(2024, 12, 1, tzinfo=UTC),
+        until=datetime(2024, 12, 2),
+        search_params=None,
+        token=None,
+        cache_path=None,
+        page_size=MAX_PAGE_SIZE,
+        slices=DEFAULT_SLICES,
+        concurrency=DEFAULT_CONCURRENCY,
+        timeout=DEFAULT_TIMEOUT,
+        retry=DEFAULT_RETRY,
+        archive=None,
+        group_name="Eng",
+        digest=None,
+    )
+    assert json.loads(capsys.readouterr().out) == backfill.return_value
+    notify.assert_not_called()
+
+
+def test_backfill_slices_and_concurrency(backfill):
+    backfill.return_value = {}
+
+    cli(
+        [
+            "backfill",
+            "--since",
+            "2024-12-01",
+            "--slices",
+            "100",
+            "--concurrency",
+            "20",
+        ]
+    )
+
+    assert backfill.call_args.kwargs["slices"] == 100
+    assert backfill.call_args.kwargs["concurrency"] == 20
+    assert backfill.call_args.kwargs["until"] is None
+
+
+def test_backfill_search_params(backfill):
+    backfill.return_value = {}
+
+    cli(
+        [
+            "--search-params",
+            '{"group": "abc", "tag": "xyz"}',
+            "backfill",
+            "--since",
+            "2024-12-01",
+        ]
+    )
+
+    assert backfill.call_args.kwargs["search_params"] == {"group": "abc", "tag": "xyz"}
+
+
+def test_backfill_ndjson(capsys, iter_backfill, iter_messages):
+    iter_messages.return_value = iter([{"text": "1"}, {"text": "2"}])
+
+    cli(["--output", "ndjson", "backfill", "--since", "2024-12-01"])
+
+    assert iter_backfill.call_args.kwargs["since"] == datetime(2024, 12, 1)
+    iter_messages.assert_called_once_with(iter_backfill.return_value, None)
+    assert capsys.readouterr().out == '{"text":"1"}\n{"text":"2"}\n'
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["backfill"],
+        ["backfill", "--since", "yesterday"],
+        ["--output", "ndjson", "--raw", "backfill", "--since", "2024-12-01"],
+        ["backfill", "--since", "2099-01-01T00:00:00"],
+        ["backfill", "--since", "2024-12-02", "--until", "2024-12-01"],
+        [
+            "backfill",
+            "--since",
+            "2024-12-01T01:00",
+            "--until",
+            "2024-12-01T02:00+02:00",
+        ],
+    ],
+)
+def test_backfill_errors(args):
+    with pytest.raises(SystemExit) as exc_info:
+        cli(args)
+
+    assert exc_info.value.code
+
+
+def test_archive(tmp_path, notify):
+    notify.return_value = {}
+    path = tmp_path / "archive.db"
+
+    cli(["--archive", str(path)])
+
+    archive = notify.call_args.kwargs["archive"]
+    assert isinstance(archive, Archive)
+    assert archive.path == str(path)
+
+
+class TestReplay:
+    def test_it(self, capsys, archive, notify):
+        cli(
+            [
+                "--archive",
+                archive.path,
+                "--group-name",
+                "Eng",
+                "replay",
+                "--since",
+                "2024-12-01T00:15:00+00:00",
+            ]
+        )
+
+        message = json.loads(capsys.readouterr().out)
+        assert message["text"] == "A new annotation was posted"
+        assert "`Eng`" in json.dumps(message)
+        notify.assert_not_called()
+
+    def test_ndjson_raw(self, capsys, archive):
+        cli(["--archive", archive.path, "--output", "ndjson", "--raw", "replay"])
+
+        assert [
+            json.loads(line)["id"] for line in capsys.readouterr().out.splitlines()
+        ] == ["id_1", "id_2"]
+
+    def test_ndjson(self, capsys, archive):
+        cli(["--archive", archive.path, "--output", "ndjson", "replay"])
+
+        (message,) = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        assert message["text"] == "2 new annotations"
+
+    def test_it_requires_an_archive(self):
+        with pytest.raises(SystemExit) as exc_info:
+            cli(["replay"])
+
+        assert exc_info.value.code
+
+    @pytest.fixture
+    def archive(self, tmp_path):
+        archive = Archive(str(tmp_path / "archive.db"))
+        for id_, created in [
+            ("id_1", "2024-12-01T00:10:00+00:00"),
+            ("id_2", "2024-12-01T00:20:00+00:00"),
+        ]:
+            archive.append(
+                Annotation.from_row({**ROW, "id": id_, "created": created}, True)
+            )
+        archive.close()
+        return archive
+
+
+@pytest.fixture
+def backfill(mocker):
+    return mocker.patch("slack_annotations.cli.backfill", autospec=True)
+
+
+@pytest.fixture
+def iter_backfill(mocker):
+    return mocker.patch("slack_annotations.cli.iter_backfill", autospec=True)
+
+
+@pytest.fixture
+def iter_annotations(mocker):
+    return mocker.patch("slack_annotations.cli.iter_annotations", autospec=True)
+
+
+@pytest.fixture
+def iter_messages(mocker):
+    return mocker.patch("slack_annotations.cli.iter_messages", autospec=True)
+
+
+@pytest.fixture
+def make_client(mocker):
+    return mocker.patch("slack_annotations.client.make_client", autospec=True)
+
+
+@pytest.fixture
+def load_feeds(mocker):
+    return mocker.patch("slack_annotations.feeds.load_feeds", autospec=True)
+
+
+@pytest.fixture
+def serve(mocker):
+    return mocker.patch("slack_annotations.serve.serve", autospec=True)
+
+
 @pytest.fixture(autouse=True)
 def notify(mocker):
     return mocker.patch("slack_annotations.cli.notify", autospec=True)
+
+
+ROW = {
+    "id": "id_1",
+    "created": "2024-12-01T00:10:00+00:00",
+    "user": "acct:user@hypothes.is",
+    "uri": "https://example.com/",
+    "links": {"incontext": "https://hyp.is/id_1"},
+    "group": "__world__",
+}
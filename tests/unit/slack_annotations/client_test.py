@@ -0,0 +1,82 @@
+import asyncio
+
+import httpx
+
+from slack_annotations.client import (
+    DEFAULT_TIMEOUT,
+    make_async_client,
+    make_client,
+    make_timeout,
+)
+from slack_annotations.retry import (
+    DEFAULT_RETRY,
+    NO_RETRY,
+    AsyncRetryTransport,
+    CircuitBreaker,
+    RetryPolicy,
+    RetryTransport,
+)
+
+
+class TestMakeTimeout:
+    def test_defaults(self):
+        assert make_timeout() == DEFAULT_TIMEOUT
+
+    def test_it(self):
+        assert make_timeout(connect=1, read=2) == httpx.Timeout(2, connect=1)
+
+
+class TestMakeClient:
+    def test_it(self):
+        with make_client() as client:
+            assert client.timeout == DEFAULT_TIMEOUT
+            # pylint:disable=protected-access
+            assert isinstance(client._transport, RetryTransport)
+            assert isinstance(client._transport.transport, httpx.HTTPTransport)
+            assert client._transport.policy == DEFAULT_RETRY
+            assert client._transport.breaker is None
+
+    def test_transport(self):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, text="ok"))
+
+        with make_client(transport=transport) as client:
+            assert client.get("https://hypothes.is/api/search").text == "ok"
+
+    def test_retry(self):
+        responses = iter([httpx.Response(503), httpx.Response(200, text="ok")])
+        transport = httpx.MockTransport(lambda request: next(responses))
+
+        with make_client(transport=transport, retry=RetryPolicy(backoff=0)) as client:
+            assert client.get("https://hypothes.is/api/search").text == "ok"
+
+    def test_breaker(self):
+        breaker = CircuitBreaker()
+        transport = httpx.MockTransport(lambda request: httpx.Response(200))
+
+        with make_client(
+            transport=transport, retry=NO_RETRY, breaker=breaker
+        ) as client:
+            # pylint:disable=protected-access
+            assert client._transport.breaker is breaker
+            assert client._transport.policy == NO_RETRY
+
+
+class TestMakeAsyncClient:
+    def test_it(self):
+        async def run():
+            async with make_async_client() as client:
+                # pylint:disable=protected-access
+                assert isinstance(client._transport, AsyncRetryTransport)
+                assert isinstance(client._transport.transport, httpx.AsyncHTTPTransport)
+                return client.timeout
+
+        assert asyncio.run(run()) == DEFAULT_TIMEOUT
+
+    def test_transport(self):
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, text="ok"))
+
+        async def run():
+            async with make_async_client(transport=transport) as client:
+                return (await client.get("https://hypothes.is/api/search")).text
+
+        assert asyncio.run(run()) == "ok"
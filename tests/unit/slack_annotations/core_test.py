@@ -1,3 +1,4 @@
+import asyncio
 import json
 from datetime import UTC, datetime, timedelta
 
@@ -5,31 +6,71 @@ import httpx
 import pytest
 from freezegun import freeze_time
 
+from slack_annotations import metrics
+from slack_annotations.archive import Archive
+from slack_annotations.client import make_client
 from slack_annotations.core import (
+    MAX_PAGE_SIZE,
     SEARCH_HOURS,
-    _get_search_after,
+    _get_cursor,
     _make_search_params,
+    afetch_range,
+    anotify,
+    backfill,
+    iter_backfill,
     notify,
+    notify_many,
+    split_range,
 )
+from slack_annotations.feeds import Feed
+from slack_annotations.format import Digest, clear_caches
+from slack_annotations.retry import NO_RETRY
+from slack_annotations.state import DEFAULT_KEY, MemoryStore, SQLiteStore, open_store
 
 
-class TestGetSearchAfter:
+class TestGetCursor:
     @freeze_time("2024-12-01T01:00:00+00:00")
-    def test_without_cache(self):
-        # If there's no cached search_after time it returns one hour before now.
-        assert _get_search_after() == "2024-12-01T00:00:00+00:00"
+    def test_without_state(self):
+        # If there's no saved search_after time it returns one hour before now.
+        assert _get_cursor().search_after == "2024-12-01T00:00:00+00:00"
+        assert _get_cursor({}).search_after == "2024-12-01T00:00:00+00:00"
 
     @freeze_time("2024-12-01T01:00:00+00:00")
-    def test_when_cache_file_doesnt_exist(self):
-        assert _get_search_after("fake_cache.json") == "2024-12-01T00:00:00+00:00"
+    def test_with_state(self):
+        search_after = "2024-12-01T00:30:00+00:00"
+
+        assert _get_cursor({"search_after": search_after}).search_after == search_after
 
     @freeze_time("2024-12-01T01:00:00+00:00")
-    def test_with_cache(self, tmp_path):
-        cache_path = tmp_path / "cache.json"
-        search_after = "2024-12-01T00:30:00+00:00"
-        cache_path.write_text(json.dumps({"search_after": search_after}))
+    def test_with_cursor_id(self):
+        # With a (created, id) cursor the search starts just before the
+        # cursor's created time so that ties aren't skipped.
+        state = {
+            "search_after": "2024-12-01T00:30:00.000005+00:00",
+            "id": "id_1",
+            "seen_ids": ["id_1"],
+        }
+
+        assert _get_cursor(state).search_after == "2024-12-01T00:30:00.000004+00:00"
 
-        assert _get_search_after(str(cache_path)) == search_after
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_with_old_state(self):
+        state = {"search_after": "2024-11-30T00:00:00+00:00"}
+
+        assert _get_cursor(state).search_after == "2024-12-01T00:00:00+00:00"
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_with_old_state_and_longer_catch_up(self):
+        state = {"search_after": "2024-11-30T00:00:00+00:00"}
+
+        assert (
+            _get_cursor(state, catch_up_hours=48).search_after
+            == "2024-11-30T00:00:00+00:00"
+        )
+        assert (
+            _get_cursor(state, catch_up_hours=None).search_after
+            == "2024-11-30T00:00:00+00:00"
+        )
 
 
 class TestNotify:
@@ -40,6 +81,7 @@ class TestNotify:
             "sort": "created",
             "order": "asc",
             "search_after": search_after,
+            "limit": MAX_PAGE_SIZE,
         }
         httpx_mock.add_response(
             url=httpx.URL("https://hypothes.is/api/search", params=params),
@@ -57,6 +99,7 @@ class TestNotify:
             "sort": "created",
             "order": "asc",
             "search_after": search_after,
+            "limit": MAX_PAGE_SIZE,
         }
         httpx_mock.add_response(
             url=httpx.URL("https://hypothes.is/api/search", params=params),
@@ -77,6 +120,7 @@ class TestNotify:
             "sort": "created",
             "order": "asc",
             "search_after": search_after,
+            "limit": MAX_PAGE_SIZE,
         }
         token = "test-token"
         httpx_mock.add_response(
@@ -87,6 +131,752 @@ class TestNotify:
 
         assert notify(token=token) == slack_annotations
 
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_follows_pages(
+        self, search_annotations, slack_annotations, httpx_mock, tmp_path
+    ):
+        rows = search_annotations["rows"]
+        search_after = "2024-12-01T00:30:00+00:00"
+        params = {"sort": "created", "order": "asc", "limit": 1}
+        for page_search_after, page_rows in (
+            (search_after, rows[:1]),
+            (rows[0]["created"], rows[1:]),
+            (rows[1]["created"], []),
+        ):
+            httpx_mock.add_response(
+                url=httpx.URL(
+                    "https://hypothes.is/api/search",
+                    params={**params, "search_after": page_search_after},
+                ),
+                content=json.dumps({"rows": page_rows}),
+            )
+        cache_path = tmp_path / "cache.json"
+        cache_path.write_text(json.dumps({"search_after": search_after}))
+
+        assert notify(cache_path=str(cache_path), page_size=1) == slack_annotations
+        assert json.loads(cache_path.read_text()) == {
+            "search_after": rows[-1]["created"]
+        }
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_with_client(self, search_annotations, slack_annotations):
+        requests = []
+
+        def handler(request):
+            requests.append(request)
+            return httpx.Response(200, json=search_annotations)
+
+        with make_client(transport=httpx.MockTransport(handler)) as client:
+            assert notify(client=client) == slack_annotations
+            assert notify(client=client) == slack_annotations
+            assert not client.is_closed
+
+        assert len(requests) == 2
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_stores_the_etag(self, search_annotations, httpx_mock, tmp_path):
+        httpx_mock.add_response(
+            content=json.dumps(search_annotations), headers={"ETag": '"abc"'}
+        )
+        cache_path = tmp_path / "cache.json"
+
+        notify(cache_path=str(cache_path))
+
+        assert json.loads(cache_path.read_text()) == {
+            "search_after": "2024-12-03T18:40:42.325652+00:00",
+            "etag": '"abc"',
+        }
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_stores_the_etag_when_there_are_no_annotations(
+        self, httpx_mock, tmp_path
+    ):
+        httpx_mock.add_response(
+            content=json.dumps({"rows": []}), headers={"ETag": '"abc"'}
+        )
+        cache_path = tmp_path / "cache.json"
+        search_after = "2024-12-01T00:30:00+00:00"
+        cache_path.write_text(json.dumps({"search_after": search_after}))
+
+        assert not notify(cache_path=str(cache_path))
+        assert json.loads(cache_path.read_text()) == {
+            "search_after": search_after,
+            "etag": '"abc"',
+        }
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_not_modified(self, httpx_mock, tmp_path):
+        httpx_mock.add_response(
+            status_code=304, match_headers={"If-None-Match": '"abc"'}
+        )
+        cache_path = tmp_path / "cache.json"
+        cache = {"search_after": "2024-12-01T00:30:00+00:00", "etag": '"abc"'}
+        cache_path.write_text(json.dumps(cache))
+
+        assert not notify(cache_path=str(cache_path))
+        assert json.loads(cache_path.read_text()) == cache
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_only_the_first_page_is_conditional(
+        self, search_annotations, httpx_mock, tmp_path
+    ):
+        rows = search_annotations["rows"]
+        httpx_mock.add_response(content=json.dumps({"rows": rows[:1]}))
+        httpx_mock.add_response(content=json.dumps({"rows": []}))
+        cache_path = tmp_path / "cache.json"
+        cache_path.write_text(json.dumps({"etag": '"abc"'}))
+
+        notify(cache_path=str(cache_path), page_size=1)
+
+        first_page, second_page = httpx_mock.get_requests()
+        assert first_page.headers["If-None-Match"] == '"abc"'
+        assert "If-None-Match" not in second_page.headers
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_delivers_annotations_with_the_same_created_time_exactly_once(
+        self, httpx_mock, tmp_path
+    ):
+        created = "2024-12-01T00:45:00.000005+00:00"
+        rows = [
+            annotation_row("id_1", created),
+            annotation_row("id_2", created),
+            annotation_row("id_3", created),
+        ]
+        # The first page ends part way through the annotations created at the
+        # same time, so the next page overlaps it.
+        httpx_mock.add_response(content=json.dumps({"rows": rows[:2]}))
+        httpx_mock.add_response(content=json.dumps({"rows": rows[1:]}))
+        httpx_mock.add_response(content=json.dumps({"rows": rows[2:]}))
+        cache_path = tmp_path / "cache.json"
+
+        assert notify(cache_path=str(cache_path), page_size=2)["text"] == (
+            "3 new annotations"
+        )
+        requests = httpx_mock.get_requests()
+        assert [request.url.params["search_after"] for request in requests[1:]] == [
+            "2024-12-01T00:45:00.000004+00:00",
+            "2024-12-01T00:45:00.000004+00:00",
+        ]
+        assert json.loads(cache_path.read_text()) == {
+            "search_after": created,
+            "id": "id_3",
+            "seen_ids": ["id_1", "id_2", "id_3"],
+        }
+
+        # The next run searches from just before the cursor again, but doesn't
+        # deliver the annotations it's already seen.
+        httpx_mock.add_response(content=json.dumps({"rows": rows}))
+
+        assert not notify(cache_path=str(cache_path), page_size=200)
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_moves_past_a_full_page_of_repeats(self, httpx_mock, tmp_path):
+        created = "2024-12-01T00:45:00.000005+00:00"
+        rows = [annotation_row("id_1", created), annotation_row("id_2", created)]
+        httpx_mock.add_response(content=json.dumps({"rows": rows}))
+        httpx_mock.add_response(content=json.dumps({"rows": []}))
+        cache_path = tmp_path / "cache.json"
+        cache_path.write_text(
+            json.dumps(
+                {"search_after": created, "id": "id_2", "seen_ids": ["id_1", "id_2"]}
+            )
+        )
+
+        assert not notify(cache_path=str(cache_path), page_size=2)
+        assert httpx_mock.get_requests()[1].url.params["search_after"] == created
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_stops_after_a_short_page(self, search_annotations, httpx_mock):
+        httpx_mock.add_response(content=json.dumps(search_annotations))
+
+        notify(page_size=3)
+
+        assert len(httpx_mock.get_requests()) == 1
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_caps_the_page_size(self, httpx_mock):
+        httpx_mock.add_response(content=json.dumps({"rows": []}))
+
+        notify(page_size=MAX_PAGE_SIZE + 1)
+
+        assert httpx_mock.get_request().url.params["limit"] == str(MAX_PAGE_SIZE)
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_doesnt_update_the_cache_if_there_are_no_annotations(
+        self, httpx_mock, tmp_path
+    ):
+        httpx_mock.add_response(content=json.dumps({"rows": []}))
+        cache_path = tmp_path / "cache.json"
+
+        assert not notify(cache_path=str(cache_path))
+        assert not cache_path.exists()
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_saves_state_and_deliveries_in_a_store(self, httpx_mock):
+        rows = [
+            annotation_row("id_1", "2024-12-01T00:10:00+00:00"),
+            annotation_row("id_2", "2024-12-01T00:20:00+00:00"),
+        ]
+        httpx_mock.add_response(content=json.dumps({"rows": rows}))
+        store = MemoryStore()
+
+        notify(state=store, state_key="eng")
+
+        assert store.load("eng") == {
+            "search_after": "2024-12-01T00:20:00+00:00",
+            "id": "id_2",
+            "seen_ids": ["id_1", "id_2"],
+        }
+        assert store.deliveries["eng"] == ["id_1", "id_2"]
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_archives_the_annotations(self, httpx_mock, tmp_path):
+        rows = [
+            annotation_row("id_1", "2024-12-01T00:10:00+00:00"),
+            {**annotation_row("id_2", "2024-12-01T00:20:00+00:00"), "extra": 1},
+        ]
+        httpx_mock.add_response(content=json.dumps({"rows": rows}))
+        archive = Archive(str(tmp_path / "archive.db"), batch_size=100)
+
+        try:
+            assert notify(state=MemoryStore(), archive=archive)["text"] == (
+                "2 new annotations"
+            )
+
+            # The archive was flushed at the end of the run.
+            reader = Archive(archive.path)
+            assert [annotation.raw for annotation in reader.scan()] == rows
+            reader.close()
+        finally:
+            archive.close()
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_uses_a_sqlite_cache_path(self, httpx_mock, tmp_path):
+        row = annotation_row("id_1", "2024-12-01T00:10:00+00:00")
+        httpx_mock.add_response(content=json.dumps({"rows": [row]}))
+        cache_path = str(tmp_path / "state.sqlite")
+
+        notify(cache_path=cache_path, state_key="eng")
+
+        store = open_store(cache_path)
+        assert isinstance(store, SQLiteStore)
+        assert store.load("eng")["id"] == "id_1"
+        assert store.deliveries("eng") == ["id_1"]
+        store.close()
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_records_metrics(self, httpx_mock):
+        rows = [
+            annotation_row("id_1", "2024-12-01T00:10:00+00:00"),
+            annotation_row("id_2", "2024-12-01T00:20:00+00:00"),
+        ]
+        content = json.dumps({"rows": rows})
+        httpx_mock.add_response(content=content)
+        clear_caches()
+        registry = metrics.enable()
+
+        try:
+            notify(state=MemoryStore())
+        finally:
+            metrics.disable()
+
+        assert registry.counters == {
+            "bytes": len(content),
+            "new_rows": 2,
+            "pages": 1,
+            "rows": 2,
+            # Both annotations are by the same user and neither has a title.
+            "title_cache_hits": 0,
+            "title_cache_misses": 0,
+            "user_cache_hits": 1,
+            "user_cache_misses": 1,
+        }
+        assert set(registry.timings) == {
+            "decode",
+            "fetch",
+            "format",
+            "notify",
+            "state_load",
+            "state_save",
+        }
+        assert registry.timings["format"].count == 2
+
+
+class TestANotify:
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it(self, search_annotations, slack_annotations, httpx_mock, tmp_path):
+        search_after = "2024-12-01T00:30:00+00:00"
+        params = {
+            "sort": "created",
+            "order": "asc",
+            "search_after": search_after,
+            "limit": MAX_PAGE_SIZE,
+        }
+        token = "test-token"
+        httpx_mock.add_response(
+            url=httpx.URL("https://hypothes.is/api/search", params=params),
+            content=json.dumps(search_annotations),
+            match_headers={"Authorization": f"Bearer {token}"},
+        )
+        cache_path = tmp_path / "cache.json"
+        cache_path.write_text(json.dumps({"search_after": search_after}))
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                return await anotify(client, token=token, cache_path=str(cache_path))
+
+        assert asyncio.run(run()) == slack_annotations
+        assert json.loads(cache_path.read_text()) == {
+            "search_after": "2024-12-03T18:40:42.325652+00:00"
+        }
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_follows_pages(self, search_annotations, httpx_mock):
+        rows = search_annotations["rows"]
+        for page_rows in (rows[:1], rows[1:], []):
+            httpx_mock.add_response(content=json.dumps({"rows": page_rows}))
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                return await anotify(client, page_size=1)
+
+        assert asyncio.run(run())["text"] == "2 new annotations"
+        requests = httpx_mock.get_requests()
+        assert [request.url.params["search_after"] for request in requests[1:]] == [
+            rows[0]["created"],
+            rows[1]["created"],
+        ]
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_records_arrivals(self, search_annotations, httpx_mock):
+        httpx_mock.add_response(content=json.dumps(search_annotations))
+        arrivals = []
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                await anotify(client, state=MemoryStore(), arrivals=arrivals)
+
+        asyncio.run(run())
+
+        assert arrivals == [row["created"] for row in search_annotations["rows"]]
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_skips_skip_ids_and_failed_claims(self, httpx_mock):
+        rows = [
+            annotation_row(f"id_{i}", f"2024-12-01T00:{i}0:00+00:00") for i in (1, 2, 3)
+        ]
+        httpx_mock.add_response(content=json.dumps({"rows": rows}))
+        state = MemoryStore()
+        claims = []
+
+        async def claim(id_):
+            claims.append(id_)
+            return id_ != "id_3"
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                return await anotify(
+                    client, state=state, skip_ids={"id_2"}, claim=claim
+                )
+
+        assert asyncio.run(run())["text"] == "A new annotation was posted"
+        assert claims == ["id_1", "id_3"]
+        assert state.load(DEFAULT_KEY)["search_after"] == rows[2]["created"]
+
+    @pytest.mark.parametrize("delivered", [True, False])
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_saves_the_cursor_only_once_delivered(self, httpx_mock, delivered):
+        rows = [annotation_row("id_1", "2024-12-01T00:10:00+00:00")]
+        httpx_mock.add_response(content=json.dumps({"rows": rows}))
+        state = MemoryStore()
+        messages = []
+
+        async def deliver(message):
+            messages.append(message)
+            return delivered
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                return await anotify(client, state=state, deliver=deliver)
+
+        assert messages == [asyncio.run(run())]
+        assert ("search_after" in state.load(DEFAULT_KEY)) is delivered
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_it_keeps_state_saved_during_the_search(self, httpx_mock):
+        rows = [annotation_row("id_1", "2024-12-01T00:10:00+00:00")]
+        httpx_mock.add_response(content=json.dumps({"rows": rows}))
+        state = MemoryStore()
+
+        async def deliver(_message):
+            # For example a push.PushRouter saving its pushed IDs.
+            state.save(DEFAULT_KEY, {"pushed_ids": ["id_2"]})
+            return True
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                await anotify(client, state=state, deliver=deliver)
+
+        asyncio.run(run())
+
+        saved_state = state.load(DEFAULT_KEY)
+        assert saved_state["pushed_ids"] == ["id_2"]
+        assert saved_state["search_after"] == rows[0]["created"]
+
+
+class TestNotifyMany:
+    def test_it_returns_a_result_per_feed(self, anotify):
+        async def fake_anotify(_client, search_params, **_kwargs):
+            if search_params["group"] == "broken":
+                raise httpx.HTTPError("Test error")
+            return {"text": search_params["group"]}
+
+        anotify.side_effect = fake_anotify
+        feeds = [
+            Feed(name="eng", search_params={"group": "eng"}),
+            Feed(name="broken", search_params={"group": "broken"}),
+            Feed(name="website", search_params={"group": "website"}),
+        ]
+
+        results = asyncio.run(notify_many(feeds))
+
+        assert results["eng"] == {"text": "eng"}
+        assert isinstance(results["broken"], httpx.HTTPError)
+        assert results["website"] == {"text": "website"}
+
+    def test_it_passes_each_feeds_options_to_anotify(self, anotify):
+        anotify.return_value = {}
+        feed = Feed(
+            name="eng",
+            search_params={"group": "eng"},
+            token="test-token",
+            cache_path="eng.json",
+            group_name="Eng",
+            page_size=10,
+            catch_up_hours=None,
+            digest_threshold=3,
+            digest_snippets=2,
+        )
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                await notify_many([feed], client)
+                return client
+
+        client = asyncio.run(run())
+
+        anotify.assert_called_once_with(
+            client,
+            search_params={"group": "eng"},
+            token="test-token",
+            cache_path="eng.json",
+            group_name="Eng",
+            page_size=10,
+            catch_up_hours=None,
+            state_key="eng",
+            digest=Digest(threshold=3, snippets=2),
+        )
+
+    def test_it_limits_concurrency(self, anotify):
+        in_flight = []
+        max_in_flight = 0
+
+        async def fake_anotify(*_args, **_kwargs):
+            nonlocal max_in_flight
+            in_flight.append(None)
+            max_in_flight = max(max_in_flight, len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+            return {}
+
+        anotify.side_effect = fake_anotify
+        feeds = [Feed(name=str(i)) for i in range(10)]
+
+        results = asyncio.run(notify_many(feeds, concurrency=3))
+
+        assert len(results) == 10
+        assert max_in_flight == 3
+
+    def test_slow_feeds_time_out_without_blocking_the_others(self, anotify):
+        async def fake_anotify(_client, search_params, **_kwargs):
+            if search_params.get("slow"):
+                await asyncio.sleep(10)
+            return {"text": "done"}
+
+        anotify.side_effect = fake_anotify
+        feeds = [
+            Feed(name="slow", search_params={"slow": True}),
+            Feed(name="fast"),
+        ]
+
+        results = asyncio.run(notify_many(feeds, timeout=0.01))
+
+        assert isinstance(results["slow"], TimeoutError)
+        assert results["fast"] == {"text": "done"}
+
+    @freeze_time("2024-12-01T01:00:00+00:00")
+    def test_coalesce(self, search_annotations, httpx_mock, tmp_path):
+        rows = search_annotations["rows"]
+        rows[1]["tags"] = ["bug"]
+        httpx_mock.add_response(
+            url=httpx.URL(
+                "https://hypothes.is/api/search",
+                params={
+                    "sort": "created",
+                    "order": "asc",
+                    "search_after": "2024-12-01T00:30:00+00:00",
+                    "limit": MAX_PAGE_SIZE,
+                    "group": "eng",
+                },
+            ),
+            content=json.dumps(search_annotations),
+        )
+        # The "bugs" feed has already seen the first annotation.
+        cursors = {
+            "eng": "2024-12-01T00:30:00+00:00",
+            "bugs": "2024-12-02T18:34:42.333087+00:00",
+            "alice": "2024-12-01T00:30:00+00:00",
+        }
+        feeds = []
+        for name, search_params in (
+            ("eng", {"group": "eng"}),
+            ("bugs", {"group": "eng", "tag": "bug"}),
+            ("alice", {"group": "eng", "user": "alice"}),
+        ):
+            cache_path = tmp_path / f"{name}.json"
+            cache_path.write_text(json.dumps({"search_after": cursors[name]}))
+            feeds.append(
+                Feed(name=name, search_params=search_params, cache_path=str(cache_path))
+            )
+
+        results = asyncio.run(notify_many(feeds, coalesce=True))
+
+        assert results["eng"]["text"] == "2 new annotations"
+        assert results["bugs"]["text"] == "A new annotation was posted"
+        assert results["alice"] == {}
+        for name in cursors:
+            assert json.loads((tmp_path / f"{name}.json").read_text()) == {
+                "search_after": rows[1]["created"]
+            }
+
+    def test_coalesce_with_a_failing_search(self, httpx_mock):
+        httpx_mock.add_response(status_code=500)
+        feeds = [
+            Feed(name="eng", search_params={"group": "eng"}),
+            Feed(name="bugs", search_params={"group": "eng", "tag": "bug"}),
+        ]
+
+        results = asyncio.run(notify_many(feeds, coalesce=True, retry=NO_RETRY))
+
+        assert isinstance(results["eng"], httpx.HTTPStatusError)
+        assert results["bugs"] is results["eng"]
+
+    @pytest.fixture
+    def anotify(self, mocker):
+        return mocker.patch("slack_annotations.core.anotify", autospec=True)
+
+
+class TestBackfill:
+    def test_it_returns_the_annotations_in_the_range_in_created_order(self, httpx_mock):
+        # An annotation every 10 minutes, including on the slices' boundaries.
+        rows = [
+            annotation_row(f"id_{i}", (SINCE + timedelta(minutes=10 * i)).isoformat())
+            for i in range(30)
+        ]
+        httpx_mock.add_callback(search_api(rows), is_reusable=True)
+
+        annotations = list(backfill_hours(4, page_size=2, slices=4))
+
+        # The range excludes since and includes until.
+        assert [annotation.id for annotation in annotations] == [
+            f"id_{i}" for i in range(1, 25)
+        ]
+        search_afters = {
+            request.url.params["search_after"] for request in httpx_mock.get_requests()
+        }
+        assert {
+            "2024-12-01T00:00:00.000000+00:00",
+            "2024-12-01T01:00:00.000000+00:00",
+            "2024-12-01T02:00:00.000000+00:00",
+            "2024-12-01T03:00:00.000000+00:00",
+        } <= search_afters
+
+    def test_it_fetches_slices_concurrently(self, httpx_mock):
+        in_flight = []
+        max_in_flight = []
+
+        async def callback(_request):
+            in_flight.append(None)
+            max_in_flight.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+            return httpx.Response(200, json={"rows": []})
+
+        httpx_mock.add_callback(callback, is_reusable=True)
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                return [
+                    annotation
+                    async for annotation in afetch_range(
+                        client,
+                        SINCE,
+                        SINCE + timedelta(hours=1),
+                        slices=6,
+                        concurrency=3,
+                    )
+                ]
+
+        assert not asyncio.run(run())
+        assert len(httpx_mock.get_requests()) == 6
+        assert max(max_in_flight) == 3
+
+    def test_afetch_range(self, httpx_mock):
+        rows = [
+            annotation_row(f"id_{i}", f"2024-12-01T00:{i}0:00+00:00") for i in (1, 4)
+        ]
+        httpx_mock.add_callback(search_api(rows), is_reusable=True)
+
+        async def run():
+            async with httpx.AsyncClient() as client:
+                annotations = afetch_range(client, SINCE, SINCE + timedelta(hours=1))
+                return [annotation.id async for annotation in annotations]
+
+        assert asyncio.run(run()) == ["id_1", "id_4"]
+
+    def test_it_yields_each_slice_before_fetching_the_rest(self, httpx_mock):
+        rows = [
+            annotation_row(f"id_{i}", f"2024-12-01T0{i}:30:00+00:00") for i in range(4)
+        ]
+        httpx_mock.add_callback(search_api(rows), is_reusable=True)
+        annotations = backfill_hours(4, slices=4, concurrency=1)
+
+        assert next(annotations).id == "id_0"
+        # Only the first slice and the one after it have been started.
+        assert len(httpx_mock.get_requests()) <= 2
+        annotations.close()
+
+    def test_it_sends_the_search_params_and_token(self, httpx_mock):
+        httpx_mock.add_response(content=json.dumps({"rows": []}))
+
+        list(
+            backfill_hours(
+                1, search_params={"group": "abc"}, token="test-token", slices=1
+            )
+        )
+
+        request = httpx_mock.get_request()
+        assert request.url.params["group"] == "abc"
+        assert request.headers["Authorization"] == "Bearer test-token"
+
+    @pytest.mark.parametrize(
+        "search_after,expected",
+        [
+            # The range covers the cursor so the cursor moves past it.
+            ("2024-12-01T00:05:00+00:00", "2024-12-01T00:20:00+00:00"),
+            # The range starts after the cursor so the cursor is left alone, so
+            # that the next run doesn't skip the annotations in between.
+            ("2024-11-30T00:00:00+00:00", "2024-11-30T00:00:00+00:00"),
+            # The cursor is already past the range.
+            ("2024-12-02T00:00:00+00:00", "2024-12-02T00:00:00+00:00"),
+        ],
+    )
+    def test_it_moves_the_cursor_forward(self, httpx_mock, search_after, expected):
+        rows = [
+            annotation_row("id_1", "2024-12-01T00:10:00+00:00"),
+            annotation_row("id_2", "2024-12-01T00:20:00+00:00"),
+        ]
+        httpx_mock.add_callback(search_api(rows), is_reusable=True)
+        state = MemoryStore()
+        state.save(DEFAULT_KEY, {"search_after": search_after})
+
+        list(backfill_hours(1, slices=2, state=state))
+
+        assert state.load(DEFAULT_KEY)["search_after"] == expected
+
+    def test_backfill(self, httpx_mock):
+        rows = [
+            annotation_row("id_1", "2024-12-01T00:10:00+00:00"),
+            annotation_row("id_2", "2024-12-01T00:20:00+00:00"),
+        ]
+        httpx_mock.add_callback(search_api(rows), is_reusable=True)
+
+        message = backfill(
+            SINCE.replace(tzinfo=None),
+            SINCE + timedelta(hours=1),
+            group_name="Eng",
+            state=MemoryStore(),
+        )
+
+        assert message["text"] == "2 new annotations"
+
+    def test_it_archives_the_annotations(self, httpx_mock, tmp_path):
+        rows = [
+            annotation_row("id_1", "2024-12-01T00:10:00+00:00"),
+            annotation_row("id_2", "2024-12-01T00:40:00+00:00"),
+        ]
+        httpx_mock.add_callback(search_api(rows), is_reusable=True)
+        archive = Archive(str(tmp_path / "archive.db"))
+
+        try:
+            list(backfill_hours(1, slices=2, archive=archive))
+
+            assert [annotation.raw for annotation in archive.scan()] == rows
+        finally:
+            archive.close()
+
+    def test_it_raises_if_a_slice_fails(self, httpx_mock):
+        httpx_mock.add_response(status_code=500, is_reusable=True)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            list(backfill_hours(1, slices=2, retry=NO_RETRY))
+
+
+class TestSplitRange:
+    def test_it(self):
+        assert split_range(SINCE, SINCE + timedelta(hours=1), slices=3) == [
+            ("2024-12-01T00:00:00.000000+00:00", "2024-12-01T00:20:00.000000+00:00"),
+            ("2024-12-01T00:20:00.000000+00:00", "2024-12-01T00:40:00.000000+00:00"),
+            ("2024-12-01T00:40:00.000000+00:00", "2024-12-01T01:00:00.000000+00:00"),
+        ]
+
+    def test_it_converts_to_utc(self):
+        since = datetime.fromisoformat("2024-12-01T01:00:00+01:00")
+
+        assert split_range(since, since + timedelta(hours=1), slices=1) == [
+            ("2024-12-01T00:00:00.000000+00:00", "2024-12-01T01:00:00.000000+00:00")
+        ]
+
+    def test_it_drops_empty_slices(self):
+        until = SINCE + timedelta(microseconds=2)
+
+        assert split_range(SINCE, until, slices=10) == [
+            ("2024-12-01T00:00:00.000000+00:00", "2024-12-01T00:00:00.000002+00:00")
+        ]
+
+    def test_until_must_be_after_since(self):
+        with pytest.raises(ValueError):
+            split_range(SINCE, SINCE)
+
+
+SINCE = datetime(2024, 12, 1, tzinfo=UTC)
+
+
+def search_api(rows):
+    """Return an httpx_mock callback that searches rows like the search API."""
+
+    def callback(request):
+        params = request.url.params
+        page = [
+            row
+            for row in rows
+            if datetime.fromisoformat(row["created"])
+            > datetime.fromisoformat(params["search_after"])
+        ][: int(params["limit"])]
+        return httpx.Response(200, json={"rows": page})
+
+    return callback
+
 
 @freeze_time("2024-12-01T01:00:00+00:00")
 def test_make_search_params():
@@ -100,6 +890,17 @@ def test_make_search_params():
     }
 
 
+def annotation_row(id_, created):
+    return {
+        "id": id_,
+        "created": created,
+        "user": "acct:test_user_1@hypothes.is",
+        "uri": "https://example.com/",
+        "links": {"incontext": f"https://hyp.is/{id_}/example.com/"},
+        "user_info": {"display_name": None},
+    }
+
+
 @pytest.fixture
 def slack_annotations():
     return {
@@ -191,3 +992,8 @@ def search_annotations():
             },
         ]
     }
+
+
+def backfill_hours(hours, **kwargs):
+    kwargs.setdefault("state", MemoryStore())
+    return iter_backfill(SINCE, SINCE + timedelta(hours=hours), **kwargs)
@@ -0,0 +1,82 @@
+import pytest
+
+from slack_annotations.cursor import SEEN_IDS, Cursor
+from slack_annotations.models import Annotation
+
+CREATED = "2024-12-01T00:30:00.000005+00:00"
+
+
+def make_annotation(created, id_):
+    return Annotation(
+        id=id_,
+        created=created,
+        user="acct:user@hypothes.is",
+        uri="https://example.com/",
+        incontext_link=f"https://hyp.is/{id_}",
+    )
+
+
+class TestCursor:
+    def test_search_after(self):
+        assert (
+            Cursor(CREATED, "id_1").search_after == "2024-12-01T00:30:00.000004+00:00"
+        )
+
+    def test_search_after_without_an_id(self):
+        assert Cursor(CREATED).search_after == CREATED
+
+    @pytest.mark.parametrize(
+        "annotation,is_new",
+        [
+            (make_annotation("2024-12-01T00:29:00+00:00", "id_0"), False),
+            (make_annotation(CREATED, "id_1"), False),
+            (make_annotation(CREATED, "id_2"), True),
+            (make_annotation("2024-12-01T00:31:00+00:00", "id_3"), True),
+        ],
+    )
+    def test_is_new(self, annotation, is_new):
+        assert Cursor(CREATED, "id_1", ["id_1"]).is_new(annotation) == is_new
+
+    def test_is_new_without_an_id(self):
+        # Cursors written before IDs were recorded have seen every annotation
+        # created at exactly their created time.
+        assert not Cursor(CREATED).is_new(make_annotation(CREATED, "id_1"))
+
+    def test_advance(self):
+        cursor = Cursor(CREATED)
+
+        cursor.advance(make_annotation(CREATED, "id_1"))
+
+        assert cursor.changed
+        assert cursor.to_dict() == {
+            "search_after": CREATED,
+            "id": "id_1",
+            "seen_ids": ["id_1"],
+        }
+        assert not cursor.is_new(make_annotation(CREATED, "id_1"))
+
+    def test_advance_forgets_the_oldest_ids(self):
+        cursor = Cursor(CREATED, "id_0", ["id_0"])
+
+        for i in range(1, SEEN_IDS + 1):
+            cursor.advance(make_annotation(CREATED, f"id_{i}"))
+
+        assert cursor.is_new(make_annotation(CREATED, "id_0"))
+        assert not cursor.is_new(make_annotation(CREATED, "id_1"))
+        assert len(cursor.to_dict()["seen_ids"]) == SEEN_IDS
+
+    def test_round_trip(self):
+        cursor = Cursor(CREATED, "id_2", ["id_1", "id_2"])
+
+        assert Cursor.from_dict(cursor.to_dict()).to_dict() == cursor.to_dict()
+
+    def test_to_dict_without_an_id(self):
+        assert Cursor(CREATED).to_dict() == {"search_after": CREATED}
+
+    def test_copy(self):
+        cursor = Cursor(CREATED, "id_1", ["id_1"])
+
+        copy = cursor.copy()
+        copy.advance(make_annotation(CREATED, "id_2"))
+
+        assert cursor.is_new(make_annotation(CREATED, "id_2"))
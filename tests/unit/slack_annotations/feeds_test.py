@@ -0,0 +1,110 @@
+import os
+
+import pytest
+
+from slack_annotations.core import MAX_PAGE_SIZE
+from slack_annotations.feeds import DEFAULT_INTERVAL, Feed, load_feeds
+from slack_annotations.format import Digest
+
+
+class TestLoadFeeds:
+    def test_it(self, tmp_path):
+        config = write_config(
+            tmp_path,
+            """
+            [feeds.eng]
+            search_params = {group = "abc123"}
+            token = "test-token"
+            group_name = "Hypothesis Eng"
+            cache_path = "/tmp/eng.json"
+            interval = 30
+            page_size = 50
+
+            [feeds.website]
+            search_params = {uri = "https://web.hypothes.is/"}
+            """,
+        )
+
+        assert load_feeds(config) == [
+            Feed(
+                name="eng",
+                search_params={"group": "abc123"},
+                token="test-token",
+                group_name="Hypothesis Eng",
+                cache_path="/tmp/eng.json",
+                interval=30,
+                page_size=50,
+            ),
+            Feed(
+                name="website",
+                search_params={"uri": "https://web.hypothes.is/"},
+                interval=DEFAULT_INTERVAL,
+                page_size=MAX_PAGE_SIZE,
+            ),
+        ]
+
+    def test_defaults(self, tmp_path):
+        config = write_config(
+            tmp_path,
+            """
+            [defaults]
+            interval = 10
+            token = "default-token"
+
+            [feeds.eng]
+            token = "eng-token"
+
+            [feeds.website]
+            """,
+        )
+
+        assert load_feeds(config) == [
+            Feed(name="eng", token="eng-token", interval=10),
+            Feed(name="website", token="default-token", interval=10),
+        ]
+
+    def test_digest(self, tmp_path):
+        config = write_config(
+            tmp_path,
+            """
+            [feeds.eng]
+            digest_threshold = 5
+            digest_snippets = 2
+
+            [feeds.website]
+            """,
+        )
+
+        feeds = load_feeds(config)
+
+        assert feeds[0].digest == Digest(threshold=5, snippets=2)
+        assert feeds[1].digest is None
+
+    def test_token_env(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("TEST_TOKEN", "env-token")
+        config = write_config(tmp_path, '[feeds.eng]\ntoken_env = "TEST_TOKEN"')
+
+        assert load_feeds(config)[0].token == "env-token"
+
+    def test_it_expands_the_cache_path(self, tmp_path):
+        config = write_config(tmp_path, '[feeds.eng]\ncache_path = "~/eng.json"')
+
+        assert load_feeds(config)[0].cache_path == os.path.expanduser("~/eng.json")
+
+    def test_unknown_option(self, tmp_path):
+        config = write_config(tmp_path, '[feeds.eng]\ncolour = "blue"')
+
+        with pytest.raises(ValueError, match="Invalid feed 'eng'"):
+            load_feeds(config)
+
+    def test_no_feeds(self, tmp_path):
+        config = write_config(tmp_path, "")
+
+        with pytest.raises(ValueError, match="No feeds defined"):
+            load_feeds(config)
+
+
+def write_config(tmp_path, text):
+    path = tmp_path / "feeds.toml"
+    path.write_text("\n".join(line.strip() for line in text.splitlines()))
+    return str(path)
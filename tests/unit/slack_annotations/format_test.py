@@ -1,33 +1,26 @@
-import pytest
+import json
+from dataclasses import replace
 
+from slack_annotations import metrics
 from slack_annotations.format import (
+    MAX_CACHED_TITLES,
+    MAX_DIGEST_SNIPPETS,
+    MAX_MESSAGE_BYTES,
     MAX_TEXT_LENGTH,
+    Digest,
+    DigestBuilder,
+    _cached_title,
     _format_annotation,
-    _get_quote,
     _trim_text,
+    clear_caches,
     format_annotations,
+    format_messages,
+    iter_messages,
+    make_builder,
     normalize_title,
+    pack_messages,
 )
-
-
-class TestGetQuote:
-    def test_without_exact(self):
-        annotation = {"target": [{"selector": []}]}
-
-        with pytest.raises(ValueError):
-            _get_quote(annotation)
-
-    def test_with_exact(self):
-        exact = "test_exact"
-        annotation = {"target": [{"selector": [{"exact": exact}]}]}
-
-        assert _get_quote(annotation) == exact
-
-    def test_with_exact_multiple_selectors(self):
-        exact = "test_exact"
-        annotation = {"target": [{"selector": [{}, {"exact": exact}]}]}
-
-        assert _get_quote(annotation) == exact
+from slack_annotations.models import Annotation
 
 
 class TestNormalizeTitle:
@@ -55,18 +48,18 @@ def test_format_empty_annotations():
 
 class TestFormatAnnotation:
     def test_without_title(self):
-        annotation = {
-            "user": "acct:test_user_1@hypothes.is",
-            "uri": "https://example.com/",
-            "links": {"incontext": "https://hyp.is/test_annotation_id_1/example.com/"},
-            "user_info": {"display_name": "md............................"},
-            "target": [
-                {
-                    "source": "https://web.hypothes.is/blog/step-by-step-guide-to-using-hypothesis-for-collaborative-projects/",
-                    "selector": [{"exact": "Annotated text"}],
-                }
-            ],
-        }
+        annotation = parse(
+            {
+                **ANNOTATION_ROW,
+                "user_info": {"display_name": "md............................"},
+                "target": [
+                    {
+                        "source": "https://web.hypothes.is/blog/step-by-step-guide-to-using-hypothesis-for-collaborative-projects/",
+                        "selector": [{"exact": "Annotated text"}],
+                    }
+                ],
+            }
+        )
 
         assert _format_annotation(annotation) == {
             "type": "section",
@@ -86,13 +79,13 @@ class TestFormatAnnotation:
         }
 
     def test_without_user_info(self):
-        annotation = {
-            "user": "acct:test_user_1@hypothes.is",
-            "uri": "https://example.com/",
-            "links": {"incontext": "https://hyp.is/test_annotation_id_1/example.com/"},
-            "document": {"title": ["Annotation title"]},
-            "user_info": {"display_name": None},
-        }
+        annotation = parse(
+            {
+                **ANNOTATION_ROW,
+                "document": {"title": ["Annotation title"]},
+                "user_info": {"display_name": None},
+            }
+        )
 
         assert _format_annotation(annotation) == {
             "type": "section",
@@ -110,12 +103,12 @@ class TestFormatAnnotation:
         }
 
     def test_page_note(self):
-        annotation = {
-            "user": "acct:test_user_1@hypothes.is",
-            "uri": "https://example.com/",
-            "links": {"incontext": "https://hyp.is/test_annotation_id_1/example.com/"},
-            "user_info": {"display_name": "md............................"},
-        }
+        annotation = parse(
+            {
+                **ANNOTATION_ROW,
+                "user_info": {"display_name": "md............................"},
+            }
+        )
 
         assert _format_annotation(annotation) == {
             "type": "section",
@@ -133,13 +126,13 @@ class TestFormatAnnotation:
         }
 
     def test_reply(self):
-        annotation = {
-            "user": "acct:test_user_1@hypothes.is",
-            "uri": "https://example.com/",
-            "links": {"incontext": "https://hyp.is/test_annotation_id_1/example.com/"},
-            "user_info": {"display_name": None},
-            "references": ["test_annotation_id_2"],
-        }
+        annotation = parse(
+            {
+                **ANNOTATION_ROW,
+                "user_info": {"display_name": None},
+                "references": ["test_annotation_id_2"],
+            }
+        )
 
         assert _format_annotation(annotation) == {
             "type": "section",
@@ -157,13 +150,13 @@ class TestFormatAnnotation:
         }
 
     def test_newline(self):
-        annotation = {
-            "user": "acct:test_user_1@hypothes.is",
-            "uri": "https://example.com/",
-            "links": {"incontext": "https://hyp.is/test_annotation_id_1/example.com/"},
-            "document": {"title": ["Annotation \n title"]},
-            "user_info": {"display_name": None},
-        }
+        annotation = parse(
+            {
+                **ANNOTATION_ROW,
+                "document": {"title": ["Annotation \n title"]},
+                "user_info": {"display_name": None},
+            }
+        )
 
         assert _format_annotation(annotation) == {
             "type": "section",
@@ -181,12 +174,12 @@ class TestFormatAnnotation:
         }
 
     def test_with_group_name(self):
-        annotation = {
-            "user": "acct:test_user_1@hypothes.is",
-            "uri": "https://example.com/",
-            "links": {"incontext": "https://hyp.is/test_annotation_id_1/example.com/"},
-            "user_info": {"display_name": None},
-        }
+        annotation = parse(
+            {
+                **ANNOTATION_ROW,
+                "user_info": {"display_name": None},
+            }
+        )
 
         assert _format_annotation(annotation, group_name="Test group") == {
             "type": "section",
@@ -202,3 +195,344 @@ class TestFormatAnnotation:
                 {"type": "plain_text", "text": "(None)"},
             ],
         }
+
+
+class TestFormatMessages:
+    def test_it_returns_one_message_when_everything_fits(self):
+        annotations = [make_annotation(i) for i in range(3)]
+
+        assert format_messages(annotations) == [format_annotations(annotations)]
+
+    def test_it_splits_by_block_count(self):
+        messages = format_messages(make_annotation(i) for i in range(50))
+
+        assert [len(message["blocks"]) for message in messages] == [49, 49, 5]
+        assert [message["text"] for message in messages] == [
+            "24 new annotations (part 1 of 3)",
+            "24 new annotations (part 2 of 3)",
+            "2 new annotations (part 3 of 3)",
+        ]
+        assert messages[0]["blocks"][-1]["elements"][0] == {
+            "type": "mrkdwn",
+            "text": "*Part 1 of 3*",
+        }
+
+    def test_it_splits_by_size(self):
+        annotations = [
+            make_annotation(i, text="a" * MAX_TEXT_LENGTH) for i in range(20)
+        ]
+
+        messages = format_messages(annotations)
+
+        # Each annotation is about 2.3KB so six fit in a message, a seventh
+        # would go over the limit.
+        assert [len(message["blocks"]) // 2 for message in messages] == [6, 6, 6, 2]
+        for message in messages:
+            assert len(json.dumps(message)) <= MAX_MESSAGE_BYTES
+
+    def test_an_annotation_too_big_for_a_message_gets_its_own(self):
+        messages = format_messages(
+            [make_annotation(i, text="a" * MAX_TEXT_LENGTH) for i in range(2)],
+            max_bytes=100,
+        )
+
+        assert len(messages) == 2
+
+    def test_it_keeps_annotations_in_order(self):
+        messages = format_messages(make_annotation(i) for i in range(30))
+
+        links = [
+            block["fields"][0]["text"]
+            for message in messages
+            for block in message["blocks"]
+            if block["type"] == "section"
+        ]
+        assert links == [
+            f"*Page Note* (<https://hyp.is/id_{i}|in-context link>):" for i in range(30)
+        ]
+
+    def test_without_annotations(self):
+        assert not format_messages([])
+
+
+class TestIterMessages:
+    def test_it_yields_each_message_once_its_full(self):
+        annotations = iter(make_annotation(i) for i in range(30))
+
+        messages = iter_messages(annotations)
+
+        assert len(next(messages)["blocks"]) == 49
+        # The first message was yielded without reading all the annotations.
+        assert len(list(annotations)) < 30
+
+    def test_it_doesnt_label_parts(self):
+        messages = list(iter_messages(make_annotation(i) for i in range(30)))
+
+        assert [message["text"] for message in messages] == [
+            "24 new annotations",
+            "6 new annotations",
+        ]
+        assert messages[-1] == format_annotations(
+            make_annotation(i) for i in range(24, 30)
+        )
+
+
+class TestDigest:
+    def test_it_collapses_bursts_on_one_document(self):
+        annotations = [
+            make_annotation(i, f"Note {i}", uri="https://example.com/a", user=user)
+            for i, user in enumerate(["alice", "bob", "alice", "alice"])
+        ]
+
+        message = format_annotations(annotations, "Eng", Digest(threshold=3))
+
+        assert message["text"] == "4 new annotations"
+        section = message["blocks"][0]
+        assert section["text"]["text"] == (
+            "*4 annotations* on <https://example.com/a|Title a> in `Eng` by "
+            "`alice` (3) and `bob` (1). Showing the first 3."
+        )
+        assert [field["text"] for field in section["fields"]] == [
+            f"`{user}` (<https://hyp.is/id_{i}|in-context link>): Note {i}"
+            for i, user in enumerate(["alice", "bob", "alice"])
+        ]
+        assert [block["type"] for block in message["blocks"]] == [
+            "section",
+            "divider",
+            "context",
+        ]
+
+    def test_documents_under_the_threshold_arent_collapsed(self):
+        annotations = [
+            make_annotation(1, uri="https://example.com/a"),
+            make_annotation(2, uri="https://example.com/b"),
+            make_annotation(3, uri="https://example.com/a"),
+        ]
+
+        message = format_annotations(annotations, digest=Digest(threshold=2))
+
+        # Each document's annotations are kept together.
+        assert message["blocks"][:-1] == [
+            block
+            for annotation in [annotations[0], annotations[2], annotations[1]]
+            for block in (_format_annotation(annotation), {"type": "divider"})
+        ]
+
+    def test_it_collapses_each_busy_document(self):
+        annotations = [
+            make_annotation(i, uri=f"https://example.com/{i % 3}") for i in range(9)
+        ]
+
+        message = format_annotations(annotations, digest=Digest(threshold=2))
+
+        sections = [block for block in message["blocks"] if block["type"] == "section"]
+        assert len(sections) == 3
+        assert all(
+            section["text"]["text"].startswith("*3 annotations*")
+            for section in sections
+        )
+
+    def test_it_names_only_the_top_users(self):
+        annotations = [
+            make_annotation(i, user=f"user_{i}", uri="https://example.com/a")
+            for i in range(8)
+        ]
+
+        message = format_annotations(annotations, digest=Digest(threshold=1))
+
+        assert " and 3 others." in message["blocks"][0]["text"]["text"]
+
+    def test_snippets_are_trimmed_and_escaped(self):
+        annotation = make_annotation(
+            1, '<b>It\'s "a"' + "a" * 500, uri="https://example.com/a"
+        )
+
+        message = format_annotations([annotation] * 2, digest=Digest(threshold=1))
+
+        snippet = message["blocks"][0]["fields"][0]["text"].partition("): ")[2]
+        # Quotes don't need escaping for Slack.
+        assert snippet.startswith('&lt;b&gt;It\'s "a"aaa')
+        assert snippet.endswith("...")
+        assert len(snippet) < 210
+
+    def test_it_shows_at_most_max_digest_snippets(self):
+        annotations = [
+            make_annotation(i, uri="https://example.com/a") for i in range(20)
+        ]
+
+        message = format_annotations(
+            annotations, digest=Digest(threshold=1, snippets=15)
+        )
+
+        assert len(message["blocks"][0]["fields"]) == MAX_DIGEST_SNIPPETS
+
+    def test_it_counts_digested_annotations(self):
+        annotations = [
+            make_annotation(i, uri="https://example.com/a") for i in range(4)
+        ]
+        registry = metrics.enable()
+
+        try:
+            format_annotations(annotations, digest=Digest(threshold=3))
+        finally:
+            metrics.disable()
+
+        assert registry.counters["digested_rows"] == 4
+
+    def test_it_only_keeps_the_annotations_that_it_might_show(self):
+        builder = DigestBuilder(digest=Digest(threshold=2, snippets=3))
+
+        for i in range(100):
+            builder.add(make_annotation(i, uri="https://example.com/a"))
+
+        # pylint:disable=protected-access
+        assert len(builder._groups["https://example.com/a"].annotations) == 3
+
+    def test_without_annotations(self):
+        assert not format_annotations([], digest=Digest())
+
+    def test_packed_digests_keep_their_counts(self):
+        annotations = [
+            make_annotation(i, uri="https://example.com/a") for i in range(30)
+        ] + [make_annotation(30, uri="https://example.com/b")]
+        message = format_annotations(annotations, digest=Digest(threshold=5))
+
+        (packed,) = pack_messages([message])
+
+        assert packed["text"] == message["text"] == "31 new annotations"
+
+    def test_split_digests_keep_their_counts(self):
+        annotations = [
+            make_annotation(i, uri=f"https://example.com/{i % 2}") for i in range(20)
+        ]
+        message = format_annotations(annotations, digest=Digest(threshold=5))
+
+        parts = pack_messages([message], max_blocks=3)
+
+        assert [part["text"] for part in parts] == [
+            "10 new annotations (part 1 of 2)",
+            "10 new annotations (part 2 of 2)",
+        ]
+
+    def test_repacked_digests_keep_their_counts(self):
+        annotations = [
+            make_annotation(i, uri=f"https://example.com/{i % 2}") for i in range(20)
+        ]
+        message = format_annotations(annotations, digest=Digest(threshold=5))
+
+        (packed,) = pack_messages(pack_messages([message], max_blocks=3))
+
+        assert packed["text"] == "20 new annotations"
+
+    def test_copied_digests_count_as_one_annotation(self):
+        annotations = [
+            make_annotation(i, uri="https://example.com/a") for i in range(10)
+        ]
+        message = format_annotations(annotations, digest=Digest(threshold=5))
+
+        (packed,) = pack_messages([dict(message)])
+
+        assert packed["text"] == "A new annotation was posted"
+
+
+def test_make_builder():
+    assert not isinstance(make_builder("Eng"), DigestBuilder)
+    assert isinstance(make_builder("Eng", Digest()), DigestBuilder)
+
+
+class TestCaches:
+    def test_titles_and_users_are_cached(self):
+        annotations = [
+            make_annotation(i, uri=f"https://example.com/{i % 2}", user=f"user_{i % 3}")
+            for i in range(12)
+        ]
+        clear_caches()
+        registry = metrics.enable()
+
+        try:
+            format_annotations(annotations)
+        finally:
+            metrics.disable()
+
+        assert registry.counters == {
+            "title_cache_hits": 10,
+            "title_cache_misses": 2,
+            "user_cache_hits": 9,
+            "user_cache_misses": 3,
+        }
+
+    def test_users_are_cached_by_userid_and_display_name(self):
+        clear_caches()
+        annotation = make_annotation(1)
+
+        texts = [
+            _format_annotation(each)["text"]["text"]
+            for each in (
+                annotation,
+                replace(annotation, display_name="Test User"),
+                annotation,
+            )
+        ]
+
+        assert [text.partition(" annotated")[0] for text in texts] == [
+            "`test_user_1`",
+            "`test_user_1` (Test User)",
+            "`test_user_1`",
+        ]
+
+    def test_the_caches_are_bounded(self):
+        clear_caches()
+
+        for i in range(MAX_CACHED_TITLES + 10):
+            format_annotations([make_annotation(i, uri=f"https://example.com/{i}")])
+
+        assert _cached_title.cache_info().currsize == MAX_CACHED_TITLES
+
+    def test_only_new_lookups_are_counted(self):
+        format_annotations([make_annotation(1)])
+        registry = metrics.enable()
+
+        try:
+            format_annotations([make_annotation(1)])
+        finally:
+            metrics.disable()
+
+        assert registry.counters["user_cache_hits"] == 1
+        assert not registry.counters["user_cache_misses"]
+
+
+def test_pack_messages_joins_messages():
+    messages = [
+        format_annotations([make_annotation(1)]),
+        format_annotations([make_annotation(2), make_annotation(3)]),
+    ]
+
+    assert pack_messages(messages) == [
+        format_annotations([make_annotation(i) for i in range(1, 4)])
+    ]
+
+
+def make_annotation(i, text=None, uri="https://example.com/", user="test_user_1"):
+    return Annotation(
+        id=f"id_{i}",
+        created="2024-12-01T00:10:00+00:00",
+        user=f"acct:{user}@hypothes.is",
+        uri=uri,
+        incontext_link=f"https://hyp.is/id_{i}",
+        title=(
+            f"Title {uri.rpartition('/')[2]}" if uri != "https://example.com/" else None
+        ),
+        text=text,
+    )
+
+
+def parse(row):
+    return Annotation.from_row(row)
+
+
+ANNOTATION_ROW = {
+    "created": "2024-12-01T00:10:00+00:00",
+    "user": "acct:test_user_1@hypothes.is",
+    "uri": "https://example.com/",
+    "links": {"incontext": "https://hyp.is/test_annotation_id_1/example.com/"},
+}
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from slack_annotations import metrics
+
+
+class TestRegistry:
+    def test_count(self):
+        registry = metrics.Registry()
+
+        registry.count("rows", 2)
+        registry.count("rows", 3)
+        registry.count("pages")
+
+        assert registry.counters == {"rows": 5, "pages": 1}
+
+    def test_record(self):
+        registry = metrics.Registry()
+
+        registry.record("fetch", 0.5)
+        registry.record("fetch", 1.5)
+
+        assert registry.timings["fetch"] == metrics.Timing(count=2, total=2.0, max=1.5)
+
+    def test_to_dict(self):
+        registry = metrics.Registry()
+        registry.count("rows", 3)
+        registry.record("fetch", 0.25)
+
+        assert registry.to_dict() == {
+            "counters": {"rows": 3},
+            "timings": {
+                "fetch": {"count": 1, "total_seconds": 0.25, "max_seconds": 0.25}
+            },
+        }
+
+    def test_to_prometheus(self):
+        registry = metrics.Registry()
+        registry.count("bytes", 1234567)
+        registry.count("rows", 3)
+        registry.count("weight", 0.1234567)
+        registry.record("fetch", 0.25)
+
+        assert registry.to_prometheus() == (
+            "# TYPE slack_annotations_bytes_total counter\n"
+            "slack_annotations_bytes_total 1234567\n"
+            "# TYPE slack_annotations_rows_total counter\n"
+            "slack_annotations_rows_total 3\n"
+            "# TYPE slack_annotations_weight_total counter\n"
+            "slack_annotations_weight_total 0.1234567\n"
+            "# TYPE slack_annotations_fetch_seconds summary\n"
+            "slack_annotations_fetch_seconds_count 1\n"
+            "slack_annotations_fetch_seconds_sum 0.250000\n"
+            "# TYPE slack_annotations_fetch_seconds_max gauge\n"
+            "slack_annotations_fetch_seconds_max 0.250000\n"
+        )
+
+
+class TestCollection:
+    def test_it_collects_nothing_when_disabled(self):
+        metrics.count("rows")
+        with metrics.timer("fetch"):
+            pass
+
+        assert metrics.get_registry() is None
+
+    def test_it_collects_when_enabled(self):
+        registry = metrics.enable()
+
+        metrics.count("rows", 2)
+        with metrics.timer("fetch"):
+            pass
+
+        assert metrics.get_registry() is registry
+        assert registry.counters == {"rows": 2}
+        assert registry.timings["fetch"].count == 1
+
+    def test_enable_keeps_the_existing_registry(self):
+        assert metrics.enable() is metrics.enable()
+
+    def test_timer_records_stages_that_raise(self):
+        registry = metrics.enable()
+
+        with pytest.raises(ValueError):
+            with metrics.timer("fetch"):
+                raise ValueError()
+
+        assert registry.timings["fetch"].count == 1
+
+
+def test_serve_metrics():
+    async def run():
+        server = await metrics.serve_metrics("127.0.0.1", 0)
+        metrics.count("rows", 3)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = await reader.read()
+            writer.close()
+            await writer.wait_closed()
+        finally:
+            server.close()
+            await server.wait_closed()
+        return response.decode()
+
+    response = asyncio.run(run())
+
+    assert response.startswith("HTTP/1.1 200 OK\r\n")
+    assert response.endswith(
+        "\r\n\r\n# TYPE slack_annotations_rows_total counter\n"
+        "slack_annotations_rows_total 3\n"
+    )
+
+
+@pytest.fixture(autouse=True)
+def disable_metrics():
+    yield
+    metrics.disable()
@@ -0,0 +1,90 @@
+import pytest
+
+from slack_annotations.models import Annotation
+
+
+class TestAnnotation:
+    def test_from_row(self):
+        assert Annotation.from_row(ROW) == Annotation(
+            id="id_1",
+            created="2024-12-01T00:10:00+00:00",
+            user="acct:test_user@hypothes.is",
+            uri="https://example.com/",
+            incontext_link="https://hyp.is/id_1/example.com/",
+            group="__world__",
+            display_name="Test User",
+            title="Document title",
+            quote="Annotated text",
+            text="Annotation text",
+            is_reply=True,
+            tags=("tag_1", "tag_2"),
+        )
+
+    def test_from_row_with_only_the_required_fields(self):
+        row = {
+            "created": "2024-12-01T00:10:00+00:00",
+            "user": "acct:test_user@hypothes.is",
+            "uri": "https://example.com/",
+            "links": {"incontext": "https://hyp.is/id_1/example.com/"},
+            "user_info": None,
+            "document": {},
+        }
+
+        annotation = Annotation.from_row(row)
+
+        assert annotation.id is None
+        assert annotation.group is None
+        assert annotation.display_name is None
+        assert annotation.title is None
+        assert annotation.quote is None
+        assert annotation.text is None
+        assert not annotation.is_reply
+        assert not annotation.tags
+
+    @pytest.mark.parametrize(
+        "target",
+        [[{"selector": []}], [{}], [], None],
+    )
+    def test_from_row_without_a_quote(self, target):
+        assert Annotation.from_row({**ROW, "target": target}).quote is None
+
+    def test_from_row_finds_the_first_quote(self):
+        target = [{"selector": [{}, {"exact": ""}]}, {"selector": [{"exact": "q"}]}]
+
+        assert Annotation.from_row({**ROW, "target": target}).quote == "q"
+
+    def test_from_row_keep_raw(self):
+        assert Annotation.from_row(ROW).raw is None
+        assert Annotation.from_row(ROW, keep_raw=True).raw is ROW
+
+    def test_username(self):
+        assert Annotation.from_row(ROW).username == "test_user"
+
+    def test_it_has_no_instance_dict(self):
+        assert not hasattr(Annotation.from_row(ROW), "__dict__")
+
+
+ROW = {
+    "id": "id_1",
+    "created": "2024-12-01T00:10:00+00:00",
+    "updated": "2024-12-01T00:10:00+00:00",
+    "user": "acct:test_user@hypothes.is",
+    "uri": "https://example.com/",
+    "text": "Annotation text",
+    "tags": ["tag_1", "tag_2"],
+    "references": ["id_0"],
+    "group": "__world__",
+    "permissions": {"read": ["group:__world__"]},
+    "target": [
+        {
+            "source": "https://example.com/",
+            "selector": [
+                {"type": "TextPositionSelector", "start": 0, "end": 14},
+                {"type": "TextQuoteSelector", "exact": "Annotated text"},
+            ],
+        }
+    ],
+    "document": {"title": ["Document title"]},
+    "links": {"incontext": "https://hyp.is/id_1/example.com/"},
+    "user_info": {"display_name": "Test User"},
+}
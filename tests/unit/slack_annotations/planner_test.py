@@ -0,0 +1,94 @@
+import pytest
+
+from slack_annotations.feeds import Feed
+from slack_annotations.models import Annotation
+from slack_annotations.planner import PredicateIndex, SharedSearch, plan
+
+
+def make_annotation(tags=None, user="acct:bob@hypothes.is"):
+    return Annotation(
+        id="id_1",
+        created="2024-12-01T00:10:00+00:00",
+        user=user,
+        uri="https://example.com/a",
+        incontext_link="https://hyp.is/id_1",
+        tags=tuple(tags or ()),
+    )
+
+
+class TestPlan:
+    def test_it_coalesces_feeds_that_differ_only_by_local_filters(self):
+        feeds = [
+            Feed(name="eng", search_params={"group": "abc"}),
+            Feed(name="eng-bugs", search_params={"group": "abc", "tag": "bug"}),
+            Feed(name="eng-alice", search_params={"group": "abc", "user": "alice"}),
+            Feed(name="other", search_params={"group": "xyz", "tag": "bug"}),
+        ]
+
+        assert plan(feeds) == [
+            SharedSearch({"group": "abc"}, None, feeds[:3]),
+            SharedSearch({"group": "xyz", "tag": "bug"}, None, feeds[3:]),
+        ]
+
+    def test_it_doesnt_coalesce_feeds_with_different_tokens(self):
+        feeds = [
+            Feed(name="a", search_params={"group": "abc", "tag": "a"}, token="a"),
+            Feed(name="b", search_params={"group": "abc", "tag": "b"}, token="b"),
+        ]
+
+        assert plan(feeds) == [
+            SharedSearch({"group": "abc", "tag": "a"}, "a", feeds[:1]),
+            SharedSearch({"group": "abc", "tag": "b"}, "b", feeds[1:]),
+        ]
+
+    def test_it_doesnt_coalesce_feeds_that_only_have_local_filters(self):
+        # Sharing a search for {} would scan every public annotation.
+        feeds = [
+            Feed(name="bugs", search_params={"tag": "bug"}),
+            Feed(name="alice", search_params={"user": "alice"}),
+        ]
+
+        assert plan(feeds) == [
+            SharedSearch({"tag": "bug"}, None, feeds[:1]),
+            SharedSearch({"user": "alice"}, None, feeds[1:]),
+        ]
+
+    def test_it_doesnt_coalesce_feeds_by_uri(self):
+        feeds = [
+            Feed(name="a", search_params={"group": "abc", "uri": "https://a.com/"}),
+            Feed(name="b", search_params={"group": "abc", "uri": "https://b.com/"}),
+        ]
+
+        assert [search.feeds for search in plan(feeds)] == [feeds[:1], feeds[1:]]
+
+
+class TestPredicateIndex:
+    @pytest.mark.parametrize(
+        "annotation,expected",
+        [
+            (make_annotation(), ["all"]),
+            (make_annotation(tags=["bug"]), ["all", "bug"]),
+            (make_annotation(tags=["bug", "ui"]), ["all", "bug", "bug-and-ui"]),
+            # Tags and users are matched case-insensitively, like the API does.
+            (make_annotation(tags=["Bug"]), ["all", "bug"]),
+            (make_annotation(user="acct:Alice@hypothes.is"), ["all", "alice", "acct"]),
+            (make_annotation(user="acct:alice@hypothes.is"), ["all", "alice", "acct"]),
+            (
+                make_annotation(tags=["bug"], user="acct:alice@hypothes.is"),
+                ["all", "bug", "alice", "acct", "alice-bugs"],
+            ),
+        ],
+    )
+    def test_match(self, annotation, expected):
+        index = PredicateIndex(
+            [
+                Feed(name="all"),
+                Feed(name="bug", search_params={"tag": "bug"}),
+                Feed(name="bug-and-ui", search_params={"tags": ["bug", "ui"]}),
+                Feed(name="alice", search_params={"user": "alice"}),
+                Feed(name="acct", search_params={"user": "acct:alice@hypothes.is"}),
+                Feed(name="alice-bugs", search_params={"user": "alice", "tag": "bug"}),
+            ]
+        )
+
+        assert [feed.name for feed in index.match(annotation)] == expected
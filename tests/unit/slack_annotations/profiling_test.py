@@ -0,0 +1,86 @@
+import io
+import pstats
+import tracemalloc
+from contextlib import ExitStack
+
+import pytest
+
+from slack_annotations.profiling import profile
+
+
+def test_cpu(tmp_path):
+    path = tmp_path / "profile.pstats"
+    summary = io.StringIO()
+
+    with profile("cpu", str(path), summary=summary):
+        sorted(range(1000), key=str)
+
+    stats = pstats.Stats(str(path))
+    assert any(
+        function == "<built-in method builtins.sorted>"
+        for _, _, function in stats.stats
+    )
+    assert summary.getvalue().startswith(f"CPU profile written to {path}")
+
+
+def test_mem(tmp_path):
+    path = tmp_path / "profile.txt"
+    summary = io.StringIO()
+
+    with profile("mem", str(path), top=3, summary=summary):
+        allocated = [str(i) * 100 for i in range(1000)]
+
+    lines = path.read_text().splitlines()
+    assert lines[0].startswith("current=")
+    assert 1 < len(lines) <= 4
+    assert "profiling_test.py" in lines[1]
+    assert summary.getvalue().startswith(f"Memory profile written to {path}: peak ")
+    assert not tracemalloc.is_tracing()
+    del allocated
+
+
+def test_mem_when_already_tracing(tmp_path):
+    tracemalloc.start()
+    try:
+        with profile("mem", str(tmp_path / "profile.txt"), summary=io.StringIO()):
+            pass
+
+        # The caller's tracing is left running.
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_it_writes_the_profile_if_the_body_raises(tmp_path):
+    path = tmp_path / "profile.pstats"
+
+    with pytest.raises(ValueError):
+        with profile("cpu", str(path), summary=io.StringIO()):
+            raise ValueError()
+
+    assert path.exists()
+
+
+def test_it_defaults_the_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    with profile("mem", summary=io.StringIO()):
+        pass
+
+    assert (tmp_path / "slack-annotations.mem.txt").exists()
+
+
+def test_no_profiler(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    summary = io.StringIO()
+
+    with profile(None, summary=summary):
+        pass
+
+    assert not summary.getvalue()
+    assert not list(tmp_path.iterdir())
+
+
+def test_unknown_profiler():
+    with pytest.raises(ValueError, match="Unknown profiler"):
+        ExitStack().enter_context(profile("gpu"))
@@ -0,0 +1,291 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from slack_annotations.feeds import Feed
+from slack_annotations.models import Annotation
+from slack_annotations.push import (
+    MAX_BODY_SIZE,
+    PushRouter,
+    RecentIds,
+    accepts_push,
+    parse_event,
+    serve_push,
+)
+from slack_annotations.state import MemoryStore
+
+
+class TestRecentIds:
+    def test_it(self):
+        ids = RecentIds(maxlen=2)
+
+        ids.add("id_1")
+        ids.add("id_2")
+        ids.add("id_2")
+
+        assert "id_1" in ids
+        assert "id_2" in ids
+        assert len(ids) == 2
+
+    def test_it_forgets_the_oldest_ids(self):
+        ids = RecentIds(maxlen=2)
+
+        for id_ in ("id_1", "id_2", "id_3"):
+            ids.add(id_)
+
+        assert "id_1" not in ids
+        assert "id_3" in ids
+        assert len(ids) == 2
+
+    def test_claim(self):
+        ids = RecentIds()
+        ids.add("id_1")
+
+        assert not ids.claim("id_1")
+        assert ids.claim("id_2")
+        assert not ids.claim("id_2")
+        ids.settle(["id_2"], delivered=False)
+        assert "id_2" not in ids
+        assert ids.claim("id_2")
+        ids.settle(["id_2"], delivered=True)
+        assert list(ids) == ["id_1", "id_2"]
+
+    def test_wait(self):
+        async def run():
+            ids = RecentIds()
+            ids.claim("id_1")
+            waiter = asyncio.create_task(ids.wait("id_1"))
+            await asyncio.sleep(0)
+            assert not waiter.done()
+
+            ids.settle(["id_1"], delivered=False)
+            await waiter
+
+        asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "search_params,expected",
+    [
+        ({}, True),
+        ({"group": "abc", "tag": "bug"}, True),
+        ({"user": "acct:alice@hypothes.is"}, True),
+        ({"group": "abc", "uri": "https://example.com/"}, False),
+        ({"wildcard_uri": "https://example.com/*"}, False),
+        ({"group": "abc", "any": "foo"}, False),
+    ],
+)
+def test_accepts_push(search_params, expected):
+    assert accepts_push(Feed(name="eng", search_params=search_params)) == expected
+
+
+class TestParseEvent:
+    def test_an_annotation(self):
+        assert parse_event(json.dumps(ROW).encode()) == [Annotation.from_row(ROW)]
+
+    def test_a_list_of_annotations(self):
+        body = json.dumps([ROW, {**ROW, "id": "id_2"}]).encode()
+
+        assert [annotation.id for annotation in parse_event(body)] == ["id_1", "id_2"]
+
+    def test_a_realtime_notification(self):
+        event = {
+            "type": "annotation-notification",
+            "options": {"action": "create"},
+            "payload": [ROW],
+        }
+
+        assert parse_event(json.dumps(event).encode()) == [Annotation.from_row(ROW)]
+
+    @pytest.mark.parametrize(
+        "event",
+        [
+            {
+                "type": "annotation-notification",
+                "options": {"action": "delete"},
+                "payload": [{"id": "id_1"}],
+            },
+            {"type": "session-change", "model": {}},
+        ],
+    )
+    def test_other_realtime_messages_are_ignored(self, event):
+        assert not parse_event(json.dumps(event).encode())
+
+    @pytest.mark.parametrize("body", [b"not json", b'{"id": "id_1"}', b"[1, 2]"])
+    def test_invalid_events(self, body):
+        with pytest.raises(ValueError):
+            parse_event(body)
+
+
+class TestPushRouter:
+    def test_it_routes_annotations_to_matching_feeds(self):
+        feeds = [
+            Feed(name="all"),
+            Feed(name="world", search_params={"group": "__world__"}),
+            Feed(name="eng", search_params={"group": "eng"}),
+            Feed(name="bugs", search_params={"tag": "bug"}),
+        ]
+        router, delivered = make_router(feeds)
+
+        asyncio.run(router.route([annotation("id_1"), annotation("id_2", ["bug"])]))
+
+        assert delivered == {
+            "all": [["id_1", "id_2"]],
+            "world": [["id_1", "id_2"]],
+            "bugs": [["id_2"]],
+        }
+
+    def test_it_ignores_feeds_that_dont_accept_pushes(self):
+        feeds = [Feed(name="website", search_params={"wildcard_uri": "https://*"})]
+        router, delivered = make_router(feeds)
+
+        asyncio.run(router.route([annotation("id_1")]))
+
+        assert not delivered
+        assert router.pushed_ids(feeds[0]) is None
+
+    def test_it_delivers_each_annotation_once(self):
+        feed = Feed(name="all")
+        router, delivered = make_router([feed])
+
+        asyncio.run(router.route([annotation("id_1")]))
+        asyncio.run(router.route([annotation("id_1"), annotation("id_2")]))
+
+        assert delivered == {"all": [["id_1"], ["id_2"]]}
+        assert "id_1" in router.pushed_ids(feed)
+
+    def test_it_delivers_annotations_without_ids(self):
+        router, delivered = make_router([Feed(name="all")])
+
+        asyncio.run(router.route([annotation(None)]))
+
+        assert delivered == {"all": [[None]]}
+
+    def test_it_skips_annotations_that_the_feeds_polls_delivered(self):
+        feed = Feed(name="all")
+        router, delivered = make_router([feed])
+        router.pushed_ids(feed).add("id_1")
+
+        asyncio.run(router.route([annotation("id_1")]))
+
+        assert not delivered
+
+    def test_it_forgets_annotations_that_it_failed_to_deliver(self):
+        feed = Feed(name="all")
+        router, delivered = make_router([feed], succeed=False)
+
+        for _ in range(2):
+            asyncio.run(router.route([annotation("id_1"), annotation(None)]))
+
+        # The annotations were left to the feed's poll, or the next push.
+        assert delivered == {"all": [["id_1", None], ["id_1", None]]}
+        assert "id_1" not in router.pushed_ids(feed)
+
+    def test_it_remembers_pushed_ids_across_restarts(self):
+        feed = Feed(name="all")
+        store = MemoryStore()
+        store.save("all", {"search_after": "2024-12-01T00:00:00+00:00"})
+        router, _ = make_router([feed], {"all": store})
+
+        asyncio.run(router.route([annotation("id_1")]))
+        router, delivered = make_router([feed], {"all": store})
+        asyncio.run(router.route([annotation("id_1")]))
+
+        assert not delivered
+        assert store.load("all") == {
+            "search_after": "2024-12-01T00:00:00+00:00",
+            "pushed_ids": ["id_1"],
+        }
+
+
+class TestServePush:
+    def test_it_hands_pushed_annotations_to_handle(self):
+        received = []
+
+        async def handle(annotations):
+            received.extend(annotations)
+
+        response = asyncio.run(push(handle, "POST", json.dumps(ROW)))
+
+        assert response.status_code == 202
+        assert received == [Annotation.from_row(ROW)]
+
+    def test_invalid_events(self):
+        response = asyncio.run(push(None, "POST", "not json"))
+
+        assert response.status_code == 400
+
+    def test_other_methods(self):
+        response = asyncio.run(push(None, "GET"))
+
+        assert response.status_code == 405
+
+    @pytest.mark.parametrize(
+        "request_line,status",
+        [
+            # No Content-Length.
+            (b"POST / HTTP/1.1\r\n\r\n", b"411"),
+            (
+                f"POST / HTTP/1.1\r\nContent-Length: {MAX_BODY_SIZE + 1}\r\n\r\n".encode(),
+                b"413",
+            ),
+        ],
+    )
+    def test_invalid_lengths(self, request_line, status):
+        async def send():
+            server = await serve_push(None, port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(request_line)
+                await writer.drain()
+                response = await reader.read()
+                writer.close()
+                await writer.wait_closed()
+                return response
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        assert asyncio.run(send()).split()[1] == status
+
+
+async def push(handle, method, content=None):
+    server = await serve_push(handle, port=0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        async with httpx.AsyncClient() as client:
+            return await client.request(
+                method, f"http://127.0.0.1:{port}/", content=content
+            )
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def make_router(feeds, stores=None, succeed=True):
+    delivered = {}
+
+    async def deliver(feed, annotations):
+        delivered.setdefault(feed.name, []).append(
+            [annotation.id for annotation in annotations]
+        )
+        return succeed
+
+    return PushRouter(feeds, deliver, stores), delivered
+
+
+def annotation(id_, tags=()):
+    return Annotation.from_row({**ROW, "id": id_, "tags": list(tags)})
+
+
+ROW = {
+    "id": "id_1",
+    "created": "2024-12-01T00:10:00+00:00",
+    "user": "acct:user@hypothes.is",
+    "uri": "https://example.com/",
+    "group": "__world__",
+    "links": {"incontext": "https://hyp.is/id_1"},
+}
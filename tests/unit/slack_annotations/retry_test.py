@@ -0,0 +1,302 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+from email.utils import format_datetime
+
+import httpx
+import pytest
+from freezegun import freeze_time
+
+from slack_annotations import metrics
+from slack_annotations.retry import (
+    AsyncRetryTransport,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    RetryTransport,
+)
+
+URL = "https://hypothes.is/api/search"
+
+
+class TestRetryPolicy:
+    @pytest.mark.parametrize(
+        "attempt,expected", [(1, 0.5), (2, 1.0), (3, 2.0), (4, 4.0), (10, 30.0)]
+    )
+    def test_backoff_doubles_up_to_the_max(self, attempt, expected):
+        policy = RetryPolicy(max_retries=10, rng=lambda: 1.0)
+
+        assert policy.retry_delay(request(), attempt) == expected
+
+    def test_backoff_is_jittered(self):
+        policy = RetryPolicy(rng=lambda: 0.25)
+
+        assert policy.retry_delay(request(), 3) == 0.5
+
+    @pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+    def test_it_retries_retry_statuses(self, status):
+        assert RetryPolicy().retry_delay(request(), 1, response(status)) is not None
+
+    @pytest.mark.parametrize("status", [200, 304, 400, 401, 404, 501])
+    def test_it_doesnt_retry_other_statuses(self, status):
+        assert RetryPolicy().retry_delay(request(), 1, response(status)) is None
+
+    def test_it_doesnt_retry_other_methods(self):
+        assert RetryPolicy().retry_delay(request("POST"), 1, response(503)) is None
+
+    def test_it_gives_up_after_max_retries(self):
+        policy = RetryPolicy(max_retries=2)
+
+        assert policy.retry_delay(request(), 2) is not None
+        assert policy.retry_delay(request(), 3) is None
+
+    def test_it_honours_retry_after_seconds(self):
+        delay = RetryPolicy().retry_delay(request(), 1, response(429, "7"))
+
+        assert delay == 7
+
+    @freeze_time("2024-12-01T00:00:00+00:00")
+    def test_it_honours_retry_after_dates(self):
+        retry_at = format_datetime(datetime.now(UTC) + timedelta(seconds=12))
+
+        delay = RetryPolicy().retry_delay(request(), 1, response(503, retry_at))
+
+        assert delay == 12
+
+    @freeze_time("2024-12-01T00:00:00+00:00")
+    def test_it_takes_retry_after_dates_without_a_timezone_as_utc(self):
+        # "-0000" means "no timezone information", see RFC 5322.
+        retry_at = "Sun, 01 Dec 2024 00:00:12 -0000"
+
+        delay = RetryPolicy().retry_delay(request(), 1, response(503, retry_at))
+
+        assert delay == 12
+
+    def test_it_ignores_invalid_retry_afters(self):
+        policy = RetryPolicy(rng=lambda: 1.0)
+
+        assert policy.retry_delay(request(), 1, response(429, "soon")) == 0.5
+
+    def test_it_doesnt_wait_longer_than_max_backoff(self):
+        policy = RetryPolicy(max_backoff=60)
+
+        assert policy.retry_delay(request(), 1, response(429, "3600")) is None
+
+
+class TestCircuitBreaker:
+    def test_it_opens_after_failure_threshold_failures_in_a_row(self):
+        breaker = CircuitBreaker(failure_threshold=3, clock=FakeClock())
+
+        breaker.record_failure("hypothes.is")
+        breaker.record_failure("hypothes.is")
+        breaker.record_success("hypothes.is")
+        breaker.record_failure("hypothes.is")
+        breaker.record_failure("hypothes.is")
+        assert breaker.allow("hypothes.is")
+
+        breaker.record_failure("hypothes.is")
+        assert breaker.is_open("hypothes.is")
+        assert not breaker.allow("hypothes.is")
+
+    def test_circuits_are_per_host(self):
+        breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+
+        breaker.record_failure("hypothes.is")
+
+        assert not breaker.allow("hypothes.is")
+        assert breaker.allow("slack.com")
+
+    def test_it_lets_one_trial_request_through_after_reset_timeout(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure("hypothes.is")
+
+        clock.now = 29
+        assert not breaker.allow("hypothes.is")
+        clock.now = 30
+        assert breaker.allow("hypothes.is")
+        assert not breaker.allow("hypothes.is")
+
+    def test_a_successful_trial_closes_the_circuit(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure("hypothes.is")
+        clock.now = 30
+        breaker.allow("hypothes.is")
+
+        breaker.record_success("hypothes.is")
+
+        assert not breaker.is_open("hypothes.is")
+        assert breaker.allow("hypothes.is")
+
+    def test_a_failed_trial_keeps_the_circuit_open(self):
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+        breaker.record_failure("hypothes.is")
+        clock.now = 30
+        breaker.allow("hypothes.is")
+
+        clock.now = 35
+        breaker.record_failure("hypothes.is")
+
+        clock.now = 64
+        assert not breaker.allow("hypothes.is")
+        clock.now = 65
+        assert breaker.allow("hypothes.is")
+
+
+class TestRetryTransport:
+    def test_it_retries_until_success(self):
+        server = FakeServer(response(503), response(429, "2"), response(200))
+        sleeps = []
+
+        with client(server, sleep=sleeps.append) as http:
+            assert http.get(URL).status_code == 200
+
+        assert server.requests == 3
+        assert sleeps == [0.5, 2]
+
+    def test_it_retries_transport_errors(self):
+        server = FakeServer(httpx.ReadTimeout("timed out"), response(200))
+
+        with client(server) as http:
+            assert http.get(URL).status_code == 200
+
+        assert server.requests == 2
+
+    def test_it_returns_the_last_response_when_out_of_retries(self):
+        server = FakeServer(*[response(502)] * 3)
+
+        with client(server, RetryPolicy(max_retries=2, backoff=0)) as http:
+            assert http.get(URL).status_code == 502
+
+        assert server.requests == 3
+
+    def test_it_raises_the_last_error_when_out_of_retries(self):
+        server = FakeServer(*[httpx.ConnectError("refused")] * 3)
+
+        with client(server, RetryPolicy(max_retries=2, backoff=0)) as http:
+            with pytest.raises(httpx.ConnectError):
+                http.get(URL)
+
+        assert server.requests == 3
+
+    def test_it_counts_retries(self):
+        server = FakeServer(response(503), response(200))
+        registry = metrics.enable()
+
+        try:
+            with client(server) as http:
+                http.get(URL)
+        finally:
+            metrics.disable()
+
+        assert registry.counters["retries"] == 1
+
+    def test_an_open_circuit_fails_fast(self):
+        server = FakeServer(*[response(503)] * 3)
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+
+        with client(server, breaker=breaker) as http:
+            with pytest.raises(CircuitOpenError):
+                http.get(URL)
+            with pytest.raises(CircuitOpenError):
+                http.get(URL)
+
+        assert server.requests == 2
+
+    def test_transport_errors_open_the_circuit(self):
+        server = FakeServer(*[httpx.ConnectError("refused")] * 3)
+        breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+
+        with client(server, breaker=breaker) as http:
+            with pytest.raises(CircuitOpenError):
+                http.get(URL)
+
+        assert server.requests == 2
+
+
+class TestAsyncRetryTransport:
+    def test_it_retries_until_success(self):
+        server = FakeServer(httpx.ConnectError("refused"), response(500), response(200))
+        sleeps = []
+
+        async def sleep(seconds):
+            sleeps.append(seconds)
+
+        async def run():
+            transport = AsyncRetryTransport(
+                server, RetryPolicy(rng=lambda: 1.0), sleep=sleep
+            )
+            async with httpx.AsyncClient(transport=transport) as http:
+                return await http.get(URL)
+
+        assert asyncio.run(run()).status_code == 200
+        assert sleeps == [0.5, 1.0]
+
+    def test_it_raises_the_last_error_when_out_of_retries(self):
+        server = FakeServer(*[httpx.ReadTimeout("timed out")] * 3)
+
+        async def sleep(_seconds):
+            pass
+
+        async def run():
+            transport = AsyncRetryTransport(
+                server, RetryPolicy(max_retries=2), sleep=sleep
+            )
+            async with httpx.AsyncClient(transport=transport) as http:
+                await http.get(URL)
+
+        with pytest.raises(httpx.ReadTimeout):
+            asyncio.run(run())
+        assert server.requests == 3
+
+    def test_an_open_circuit_fails_fast(self):
+        server = FakeServer(response(503))
+        breaker = CircuitBreaker(failure_threshold=1, clock=FakeClock())
+
+        async def run():
+            transport = AsyncRetryTransport(server, breaker=breaker)
+            async with httpx.AsyncClient(transport=transport) as http:
+                await http.get(URL)
+
+        with pytest.raises(CircuitOpenError):
+            asyncio.run(run())
+        assert server.requests == 1
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeServer(httpx.MockTransport):
+    """A mock transport that returns (or raises) each of outcomes in turn."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = 0
+        super().__init__(self.respond)
+
+    def respond(self, _request):
+        self.requests += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def client(server, policy=None, breaker=None, sleep=lambda _seconds: None):
+    policy = policy or RetryPolicy(rng=lambda: 1.0)
+    return httpx.Client(transport=RetryTransport(server, policy, breaker, sleep))
+
+
+def request(method="GET"):
+    return httpx.Request(method, URL)
+
+
+def response(status, retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after else {}
+    return httpx.Response(status, headers=headers)
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from slack_annotations.feeds import Feed
+from slack_annotations.scheduler import AdaptiveScheduler
+
+NOW = datetime(2024, 12, 1, tzinfo=UTC)
+
+
+class TestAdaptiveScheduler:
+    def test_it_starts_with_the_feeds_interval(self, scheduler):
+        assert scheduler.interval(Feed(name="eng", interval=120)) == 120
+
+    @pytest.mark.parametrize("interval,expected", [(1, 10), (7200, 3600)])
+    def test_the_feeds_interval_is_clamped(self, scheduler, interval, expected):
+        assert scheduler.interval(Feed(name="eng", interval=interval)) == expected
+
+    def test_busy_feeds_are_polled_at_their_arrival_rate(self, scheduler):
+        feed = Feed(name="eng")
+
+        # 60 annotations in the last hour: one a minute.
+        interval = scheduler.record(feed, arrivals(60, every=60))
+
+        assert interval == 60
+        assert scheduler.interval(feed) == 60
+
+    def test_very_busy_feeds_are_polled_every_min_interval(self, scheduler):
+        assert scheduler.record(Feed(name="eng"), arrivals(1000, every=1)) == 10
+
+    def test_quiet_feeds_back_off_exponentially(self, scheduler):
+        feed = Feed(name="eng", interval=60)
+
+        intervals = [scheduler.record(feed, []) for _ in range(8)]
+
+        assert intervals == [120, 240, 480, 960, 1920, 3600, 3600, 3600]
+
+    def test_a_new_annotation_ends_the_backoff(self, scheduler):
+        feed = Feed(name="eng", interval=600)
+        scheduler.record(feed, arrivals(6, every=600))
+        for _ in range(3):
+            scheduler.record(feed, [])
+
+        interval = scheduler.record(feed, arrivals(1))
+
+        # 7 annotations in the last hour.
+        assert interval == pytest.approx(3600 / 7)
+
+    def test_a_newly_active_feed_is_polled_no_less_often(self, scheduler):
+        feed = Feed(name="eng", interval=60)
+
+        # One annotation in the last hour, but the feed was polled every minute.
+        interval = scheduler.record(feed, arrivals(1))
+
+        assert interval == 60
+
+    def test_annotations_older_than_the_window_dont_count(self, scheduler):
+        feed = Feed(name="eng", interval=600)
+        scheduler.record(feed, arrivals(6, every=60))
+
+        interval = scheduler.record(feed, arrivals(10, ago=7200))
+
+        # Only the 6 annotations in the last hour count.
+        assert interval == 600
+
+    def test_annotations_drop_out_of_the_window(self):
+        now = [NOW.timestamp()]
+        scheduler = AdaptiveScheduler(clock=lambda: now[0])
+        feed = Feed(name="eng", interval=600)
+        scheduler.record(feed, arrivals(1))
+        for _ in range(3):
+            scheduler.record(feed, [])
+
+        now[0] += 5400
+        interval = scheduler.record(feed, arrivals(1, ago=-5400))
+
+        # The first annotation is no longer in the last hour.
+        assert interval == 3600
+
+    def test_only_stale_new_annotations_dont_back_off(self, scheduler):
+        feed = Feed(name="eng", interval=60)
+
+        interval = scheduler.record(feed, arrivals(10, ago=7200))
+
+        assert interval == 60
+
+    def test_failed_polls_leave_the_interval_alone(self, scheduler):
+        feed = Feed(name="eng", interval=60)
+
+        assert scheduler.record(feed, None) == 60
+
+    def test_feeds_are_scheduled_independently(self, scheduler):
+        scheduler.record(Feed(name="eng"), arrivals(60, every=60))
+
+        assert scheduler.interval(Feed(name="quiet", interval=300)) == 300
+
+    def test_acquire_without_a_budget_doesnt_wait(self, scheduler):
+        asyncio.run(asyncio.wait_for(scheduler.acquire(), timeout=1))
+
+    def test_acquire_limits_polls_to_the_budget(self):
+        # 600 polls a minute is one every 0.1s.
+        scheduler = AdaptiveScheduler(budget=600)
+
+        async def run():
+            start = time.monotonic()
+            for _ in range(3):
+                await scheduler.acquire()
+            return time.monotonic() - start
+
+        assert asyncio.run(run()) >= 0.19
+
+    @pytest.fixture
+    def scheduler(self):
+        return AdaptiveScheduler(clock=NOW.timestamp)
+
+
+def arrivals(count, every=1, ago=0):
+    """Return the created times of count annotations, the last one ago seconds ago."""
+    last = NOW - timedelta(seconds=ago)
+    return [(last - timedelta(seconds=every * i)).isoformat() for i in range(count)]
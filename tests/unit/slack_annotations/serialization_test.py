@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from slack_annotations import serialization
+from slack_annotations.models import Annotation
+from slack_annotations.serialization import DECODE_ERRORS, decode_rows, dumps, loads
+
+# Every test runs once with each backend.
+pytestmark = pytest.mark.usefixtures("backend")
+
+
+def test_loads():
+    assert loads(b'{"a": [1, "\\u00e9"]}') == {"a": [1, "é"]}
+    assert loads('{"a": null}') == {"a": None}
+
+
+def test_loads_invalid_json():
+    with pytest.raises(DECODE_ERRORS):
+        loads(b"{")
+
+
+def test_dumps():
+    assert dumps({"a": [1, "é"], "b": None}) == '{"a":[1,"é"],"b":null}'
+
+
+class TestDecodeRows:
+    def test_it(self):
+        rows = decode_rows(json.dumps({"rows": [ROW]}).encode())
+
+        # Depending on the backend the rows may have been trimmed to the fields
+        # that Annotation uses.
+        assert [Annotation.from_row(row) for row in rows] == [Annotation.from_row(ROW)]
+
+    def test_raw(self):
+        assert decode_rows(json.dumps({"rows": [ROW]}).encode(), raw=True) == [ROW]
+
+
+@pytest.fixture(params=["orjson", "msgspec", "json"])
+def backend(request, monkeypatch):
+    """Make serialization use only the backend named by the test's param."""
+    orjson = msgspec = None
+    if request.param == "orjson":
+        orjson = pytest.importorskip("orjson")
+    elif request.param == "msgspec":
+        msgspec = pytest.importorskip("msgspec")
+
+    monkeypatch.setattr(serialization, "orjson", orjson)
+    monkeypatch.setattr(serialization, "msgspec", msgspec)
+    monkeypatch.setattr(
+        serialization, "_encoder", msgspec.json.Encoder() if msgspec else None
+    )
+    # pylint:disable=protected-access
+    rows_decoder = (
+        msgspec.json.Decoder(serialization._SearchResponse) if msgspec else None
+    )
+    monkeypatch.setattr(serialization, "_rows_decoder", rows_decoder)
+
+
+ROW = {
+    "id": "id_1",
+    "created": "2024-12-01T00:10:00+00:00",
+    "updated": "2024-12-01T00:10:00+00:00",
+    "user": "acct:user@hypothes.is",
+    "uri": "https://example.com/",
+    "text": "Annotation text",
+    "tags": ["tag"],
+    "group": "__world__",
+    "permissions": {"read": ["group:__world__"]},
+    "target": [
+        {
+            "source": "https://example.com/",
+            "selector": [
+                {"type": "TextPositionSelector", "start": 0, "end": 5},
+                {"type": "TextQuoteSelector", "exact": "Quote", "prefix": ""},
+            ],
+        }
+    ],
+    "document": {"title": ["Title"], "link": [{"href": "https://example.com/"}]},
+    "links": {
+        "html": "https://hypothes.is/a/id_1",
+        "incontext": "https://hyp.is/id_1/example.com/",
+    },
+    "user_info": {"display_name": "User"},
+    "flagged": False,
+}
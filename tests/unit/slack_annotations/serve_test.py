@@ -0,0 +1,414 @@
+import asyncio
+import io
+import json
+import signal
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+from freezegun import freeze_time
+
+from slack_annotations.client import make_async_client
+from slack_annotations.feeds import Feed
+from slack_annotations.models import Annotation
+from slack_annotations.push import PushRouter, RecentIds
+from slack_annotations.retry import CircuitBreaker
+from slack_annotations.scheduler import AdaptiveScheduler
+from slack_annotations.serve import _poll_feed, serve
+from slack_annotations.slack import SlackError, SlackSender
+from slack_annotations.state import MemoryStore
+
+
+class TestServe:
+    def test_it_polls_every_feed_until_stopped(self, _poll_feed):
+        feeds = [Feed(name="eng"), Feed(name="website")]
+        output = io.StringIO()
+
+        async def run():
+            stop = asyncio.Event()
+            polled = []
+
+            async def poll(_client, feed, _output, _sender, _skip_ids, state):
+                assert state is not None
+                polled.append(feed.name)
+                if len(polled) == len(feeds):
+                    stop.set()
+
+            _poll_feed.side_effect = poll
+            await serve(feeds, output, stop)
+            return polled
+
+        assert asyncio.run(run()) == ["eng", "website"]
+        clients = {call.args[0] for call in _poll_feed.call_args_list}
+        assert len(clients) == 1
+
+    @pytest.mark.parametrize("signum", [signal.SIGINT, signal.SIGTERM])
+    def test_it_stops_on_a_signal(self, _poll_feed, signum):
+        async def poll(*_args, **_kwargs):
+            signal.raise_signal(signum)
+
+        _poll_feed.side_effect = poll
+
+        asyncio.run(serve([Feed(name="eng", interval=3600)], io.StringIO()))
+
+        _poll_feed.assert_called_once()
+
+    def test_feeds_share_a_circuit_breaker(self, _poll_feed):
+        breaker = CircuitBreaker()
+
+        async def run():
+            stop = asyncio.Event()
+
+            async def poll(*_args, **_kwargs):
+                stop.set()
+
+            _poll_feed.side_effect = poll
+            await serve([Feed(name="eng")], io.StringIO(), stop, breaker=breaker)
+
+        asyncio.run(run())
+
+        client = _poll_feed.call_args.args[0]
+        # pylint:disable=protected-access
+        assert client._transport.breaker is breaker
+
+    def test_it_polls_again_after_the_interval(self, _poll_feed):
+        async def run():
+            stop = asyncio.Event()
+
+            async def poll(*_args, **_kwargs):
+                if _poll_feed.call_count == 2:
+                    stop.set()
+
+            _poll_feed.side_effect = poll
+            await serve([Feed(name="eng", interval=0)], io.StringIO(), stop)
+
+        asyncio.run(run())
+
+        assert _poll_feed.call_count == 2
+
+    def test_it_polls_on_the_schedulers_intervals(self, _poll_feed, mocker):
+        feed = Feed(name="eng", interval=3600)
+        scheduler = mocker.create_autospec(AdaptiveScheduler, instance=True)
+        scheduler.record.return_value = 0
+
+        async def run():
+            stop = asyncio.Event()
+
+            async def poll(*_args, **_kwargs):
+                if _poll_feed.call_count == 2:
+                    stop.set()
+                return ["2024-12-01T00:00:00+00:00"]
+
+            _poll_feed.side_effect = poll
+            await serve([feed], io.StringIO(), stop, scheduler=scheduler)
+
+        asyncio.run(run())
+
+        assert _poll_feed.call_count == 2
+        assert scheduler.acquire.await_count == 2
+        scheduler.record.assert_called_with(feed, ["2024-12-01T00:00:00+00:00"])
+
+    @freeze_time("2024-12-02T19:00:00+00:00")
+    def test_it_keeps_the_cursor_of_feeds_without_a_cache_path(
+        self, httpx_mock, annotation
+    ):
+        output = io.StringIO()
+
+        async def run():
+            stop = asyncio.Event()
+            polls = []
+
+            def search(request):
+                polls.append(request)
+                if len(polls) == 3:
+                    stop.set()
+                return httpx.Response(200, json={"rows": [annotation]})
+
+            httpx_mock.add_callback(search, is_reusable=True)
+            await serve([Feed(name="eng", interval=0)], output, stop)
+
+        asyncio.run(run())
+
+        assert len(output.getvalue().splitlines()) == 1
+
+    def test_it_delivers_pushed_annotations(self, _poll_feed, mocker, annotation):
+        serve_push = mocker.patch("slack_annotations.serve.serve_push", autospec=True)
+        server = serve_push.return_value = mocker.Mock(
+            spec_set=asyncio.Server, wait_closed=AsyncMock()
+        )
+        feed = Feed(name="eng", interval=3600)
+        output = io.StringIO()
+
+        async def run():
+            stop = asyncio.Event()
+
+            async def poll(_client, _feed, _output, _sender, pushed, **_kwargs):
+                route = serve_push.call_args.args[0]
+                await route([Annotation.from_row({**annotation, "id": "id_1"})])
+                assert "id_1" in pushed
+                stop.set()
+
+            _poll_feed.side_effect = poll
+            await serve([feed], output, stop, push_port=8080)
+
+        asyncio.run(run())
+
+        serve_push.assert_called_once_with(mocker.ANY, port=8080)
+        server.close.assert_called_once_with()
+        record = json.loads(output.getvalue())
+        assert record["feed"] == "eng"
+        assert record["message"]["text"] == "A new annotation was posted"
+
+    def test_it_serves_metrics(self, _poll_feed, mocker):
+        serve_metrics = mocker.patch(
+            "slack_annotations.serve.metrics.serve_metrics", autospec=True
+        )
+        server = serve_metrics.return_value = mocker.Mock(
+            spec_set=asyncio.Server, wait_closed=AsyncMock()
+        )
+
+        async def run():
+            stop = asyncio.Event()
+            stop.set()
+            await serve([Feed(name="eng")], io.StringIO(), stop, metrics_port=9100)
+
+        asyncio.run(run())
+
+        serve_metrics.assert_called_once_with("127.0.0.1", 9100)
+        server.close.assert_called_once_with()
+        server.wait_closed.assert_awaited_once_with()
+
+    @pytest.fixture
+    def _poll_feed(self, mocker):
+        return mocker.patch("slack_annotations.serve._poll_feed", autospec=True)
+
+
+class TestPollFeed:
+    @freeze_time("2024-12-02T19:00:00+00:00")
+    def test_it_writes_new_messages(self, httpx_mock, annotation):
+        httpx_mock.add_response(content=json.dumps({"rows": [annotation]}))
+        output = io.StringIO()
+
+        arrivals = asyncio.run(self.poll(Feed(name="eng", group_name="Eng"), output))
+
+        assert arrivals == [annotation["created"]]
+        record = json.loads(output.getvalue())
+        assert record["feed"] == "eng"
+        assert record["message"]["text"] == "A new annotation was posted"
+        assert "in `Eng`" in record["message"]["blocks"][0]["text"]["text"]
+
+    def test_it_writes_nothing_when_there_are_no_annotations(self, httpx_mock):
+        httpx_mock.add_response(content=json.dumps({"rows": []}))
+        output = io.StringIO()
+
+        arrivals = asyncio.run(self.poll(Feed(name="eng"), output))
+
+        assert arrivals == []
+        assert not output.getvalue()
+
+    @freeze_time("2024-12-02T19:00:00+00:00")
+    def test_it_posts_to_slack(self, httpx_mock, annotation):
+        httpx_mock.add_response(content=json.dumps({"rows": [annotation]}))
+        sender = AsyncMock(spec_set=SlackSender)
+        output = io.StringIO()
+
+        asyncio.run(self.poll(Feed(name="eng", channel="C123"), output, sender))
+
+        sender.send.assert_awaited_once()
+        channel, messages = sender.send.call_args.args
+        assert channel == "C123"
+        assert messages[0]["text"] == "A new annotation was posted"
+        assert not output.getvalue()
+
+    @freeze_time("2024-12-02T19:00:00+00:00")
+    def test_it_logs_slack_errors(self, httpx_mock, annotation, caplog):
+        httpx_mock.add_response(content=json.dumps({"rows": [annotation]}))
+        sender = AsyncMock(spec_set=SlackSender)
+        sender.send.side_effect = SlackError("channel_not_found")
+
+        arrivals = asyncio.run(
+            self.poll(Feed(name="eng", channel="C123"), io.StringIO(), sender)
+        )
+
+        assert arrivals is None
+        assert "Posting feed 'eng' to Slack failed" in caplog.text
+
+    @freeze_time("2024-12-02T19:00:00+00:00")
+    def test_it_delivers_again_after_a_failed_post(self, httpx_mock, annotation):
+        httpx_mock.add_response(
+            content=json.dumps({"rows": [annotation]}), is_reusable=True
+        )
+        sender = AsyncMock(spec_set=SlackSender)
+        sender.send.side_effect = [SlackError("internal_error"), 1, 1]
+        feed = Feed(name="eng", channel="C123")
+        state = MemoryStore()
+
+        for _ in range(3):
+            asyncio.run(self.poll(feed, io.StringIO(), sender, state=state))
+
+        # The annotation was posted again after the failure, and only then
+        # did the cursor move past it.
+        assert sender.send.await_count == 2
+
+    def test_it_logs_errors(self, httpx_mock, caplog):
+        httpx_mock.add_response(status_code=502)
+        output = io.StringIO()
+
+        arrivals = asyncio.run(self.poll(Feed(name="eng"), output))
+
+        assert arrivals is None
+        assert not output.getvalue()
+        assert "Polling feed 'eng' failed" in caplog.text
+
+    @pytest.mark.parametrize(
+        "response",
+        [
+            # A row without "links".
+            {"json": {"rows": [{"created": "2024-12-02T18:34:42.333087+00:00"}]}},
+            # A response that isn't JSON.
+            {"content": b"<html>"},
+        ],
+    )
+    def test_it_logs_unexpected_errors(self, httpx_mock, caplog, response):
+        httpx_mock.add_response(**response)
+
+        arrivals = asyncio.run(self.poll(Feed(name="eng"), io.StringIO()))
+
+        assert arrivals is None
+        assert "Polling feed 'eng' failed" in caplog.text
+
+    @freeze_time("2024-12-02T19:00:00+00:00")
+    def test_it_skips_pushed_annotations_and_records_polled_ones(self, httpx_mock):
+        rows = [
+            {**ROW, "id": "id_1", "created": "2024-12-02T18:10:00+00:00"},
+            {**ROW, "id": "id_2", "created": "2024-12-02T18:20:00+00:00"},
+        ]
+        httpx_mock.add_response(content=json.dumps({"rows": rows}))
+        pushed = RecentIds()
+        pushed.add("id_1")
+        output = io.StringIO()
+
+        async def poll():
+            async with httpx.AsyncClient() as client:
+                return await _poll_feed(client, Feed(name="eng"), output, None, pushed)
+
+        assert asyncio.run(poll()) == [rows[1]["created"]]
+        assert json.loads(output.getvalue())["message"]["text"] == (
+            "A new annotation was posted"
+        )
+        assert list(pushed) == ["id_1", "id_2"]
+
+    def test_it_waits_for_a_push_in_flight_before_moving_past_it(self, httpx_mock):
+        httpx_mock.add_response(content=json.dumps({"rows": [ROW]}))
+        feed, state, output = (
+            Feed(name="eng", catch_up_hours=None),
+            MemoryStore(),
+            io.StringIO(),
+        )
+        state.save("eng", {"search_after": "2024-12-02T18:00:00+00:00"})
+
+        async def run():
+            release = asyncio.Event()
+
+            async def push(_feed, _annotations):
+                await release.wait()
+                return False
+
+            async def release_soon():
+                for _ in range(100):
+                    await asyncio.sleep(0)
+                release.set()
+
+            router = PushRouter([feed], push)
+            routing = asyncio.create_task(router.route([Annotation.from_row(ROW)]))
+            await asyncio.sleep(0)
+            asyncio.create_task(release_soon())
+            async with httpx.AsyncClient() as client:
+                await _poll_feed(
+                    client, feed, output, None, router.pushed_ids(feed), state=state
+                )
+            await routing
+
+        asyncio.run(run())
+
+        # The push failed, so the poll delivered the annotation itself.
+        assert json.loads(output.getvalue())["message"]["text"] == (
+            "A new annotation was posted"
+        )
+        assert state.load("eng")["search_after"] == ROW["created"]
+
+    def test_it_claims_annotations_while_delivering_them(self, httpx_mock):
+        httpx_mock.add_response(content=json.dumps({"rows": [ROW]}))
+        feed, state = (
+            Feed(name="eng", channel="C123", catch_up_hours=None),
+            MemoryStore(),
+        )
+        state.save("eng", {"search_after": "2024-12-02T18:00:00+00:00"})
+        push = AsyncMock(return_value=True)
+
+        async def run():
+            sending, release = asyncio.Event(), asyncio.Event()
+
+            async def send(*_args):
+                sending.set()
+                await release.wait()
+
+            sender = AsyncMock(spec_set=SlackSender)
+            sender.send.side_effect = send
+            router = PushRouter([feed], push)
+            async with httpx.AsyncClient() as client:
+                polling = asyncio.create_task(
+                    _poll_feed(
+                        client,
+                        feed,
+                        io.StringIO(),
+                        sender,
+                        router.pushed_ids(feed),
+                        state=state,
+                    )
+                )
+                await sending.wait()
+                await router.route([Annotation.from_row(ROW)])
+                release.set()
+                await polling
+            return router.pushed_ids(feed)
+
+        # The annotation was pushed while the poll was posting it, so the push
+        # skipped it.
+        assert list(asyncio.run(run())) == [ROW["id"]]
+        push.assert_not_awaited()
+
+    def test_it_skips_polls_while_the_circuit_is_open(self, caplog):
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record_failure("hypothes.is")
+        output = io.StringIO()
+
+        async def poll():
+            async with make_async_client(breaker=breaker) as client:
+                await _poll_feed(client, Feed(name="eng"), output)
+
+        asyncio.run(poll())
+
+        assert not output.getvalue()
+        assert "Not polling feed 'eng'" in caplog.text
+        assert "Traceback" not in caplog.text
+
+    async def poll(self, feed, output, sender=None, state=None):
+        async with httpx.AsyncClient() as client:
+            return await _poll_feed(client, feed, output, sender, state=state)
+
+
+@pytest.fixture
+def annotation():
+    return dict(ROW)
+
+
+ROW = {
+    "id": "test_annotation_id_1",
+    "created": "2024-12-02T18:34:42.333087+00:00",
+    "user": "acct:test_user_1@hypothes.is",
+    "uri": "https://example.com/",
+    "text": "test_user_1 reply",
+    "links": {"incontext": "https://hyp.is/test_annotation_id_1/example.com/"},
+    "user_info": {"display_name": None},
+}
@@ -0,0 +1,217 @@
+import asyncio
+import json
+import time
+from collections import defaultdict
+
+import httpx
+import pytest
+
+from slack_annotations.slack import (
+    DEFAULT_RETRY_AFTER,
+    SlackError,
+    SlackSender,
+    TokenBucket,
+    _retry_after,
+)
+
+
+class TestTokenBucket:
+    def test_it_allows_a_burst_then_limits_the_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+
+        asyncio.run(clock.run(bucket, 5))
+
+        # Three tokens at once, then one every half second.
+        assert clock.acquired == [0, 0, 0, 0.5, 1.0]
+
+    def test_pause(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock)
+
+        bucket.pause(10)
+        asyncio.run(clock.run(bucket, 2))
+
+        assert clock.acquired == [10, 10.5]
+
+
+class TestSlackSender:
+    def test_it_posts_messages(self, fake_slack):
+        messages = [message(2), message(3)]
+
+        posts = asyncio.run(send(fake_slack, {"C1": messages}))
+
+        assert posts == {"C1": 1}
+        (post,) = fake_slack.posts["C1"]
+        assert post["channel"] == "C1"
+        assert post["text"] == "5 new annotations"
+        assert len(post["blocks"]) == 5 * 2 + 1
+        assert fake_slack.tokens == {"Bearer xoxb-test"}
+
+    def test_it_honours_retry_after(self, fake_slack):
+        fake_slack.rate_limited = 2
+
+        posts = asyncio.run(send(fake_slack, {"C1": [message(1)]}))
+
+        assert posts == {"C1": 1}
+        assert fake_slack.rejected == 2
+        # Each retry waited for the Retry-After time.
+        times = fake_slack.request_times["C1"]
+        assert times[1] - times[0] >= FakeSlack.RETRY_AFTER * 0.9
+        assert times[2] - times[1] >= FakeSlack.RETRY_AFTER * 0.9
+
+    def test_it_gives_up_when_still_rate_limited(self, fake_slack):
+        fake_slack.rate_limited = 100
+
+        posts = asyncio.run(send(fake_slack, {"C1": [message(1)]}, max_attempts=2))
+
+        assert isinstance(posts["C1"], SlackError)
+        assert fake_slack.rejected == 2
+
+    def test_it_retries_server_errors(self, fake_slack, monkeypatch):
+        monkeypatch.setattr("slack_annotations.slack.DEFAULT_RETRY_AFTER", 0.01)
+        fake_slack.server_errors = 2
+
+        posts = asyncio.run(send(fake_slack, {"C1": [message(1)]}))
+
+        assert posts == {"C1": 1}
+        assert fake_slack.rejected == 2
+        assert len(fake_slack.posts["C1"]) == 1
+
+    def test_it_gives_up_when_still_failing(self, fake_slack, monkeypatch):
+        monkeypatch.setattr("slack_annotations.slack.DEFAULT_RETRY_AFTER", 0.01)
+        fake_slack.server_errors = 100
+
+        posts = asyncio.run(send(fake_slack, {"C1": [message(1)]}, max_attempts=2))
+
+        assert isinstance(posts["C1"], SlackError)
+        assert fake_slack.rejected == 2
+
+    def test_it_raises_slack_errors(self, fake_slack):
+        posts = asyncio.run(send(fake_slack, {"unknown": [message(1)]}))
+
+        assert str(posts["unknown"]) == "Posting to unknown failed: channel_not_found"
+
+    def test_one_failing_channel_doesnt_affect_the_others(self, fake_slack):
+        posts = asyncio.run(
+            send(fake_slack, {"unknown": [message(1)], "C1": [message(1)]})
+        )
+
+        assert isinstance(posts["unknown"], SlackError)
+        assert posts["C1"] == 1
+
+    def test_a_burst_of_annotations_causes_no_429s(self, fake_slack):
+        # 500 annotations' worth of messages to each of three channels.
+        deliveries = {channel: [message(1)] * 500 for channel in ("C1", "C2", "C3")}
+
+        posts = asyncio.run(send(fake_slack, deliveries))
+
+        # 24 annotations fit in a post.
+        assert posts == {"C1": 21, "C2": 21, "C3": 21}
+        assert not fake_slack.rejected
+
+    @pytest.fixture
+    def fake_slack(self):
+        return FakeSlack()
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [
+        ({"Retry-After": "30"}, 30.0),
+        ({}, DEFAULT_RETRY_AFTER),
+        ({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}, DEFAULT_RETRY_AFTER),
+    ],
+)
+def test_retry_after(headers, expected):
+    assert _retry_after(httpx.Response(429, headers=headers)) == expected
+
+
+class FakeSlack:
+    """A fake chat.postMessage that enforces a per-channel rate limit."""
+
+    CHANNELS = {"C1", "C2", "C3"}
+    # The fake's rate limit: the sender under test is configured to stay
+    # within it.
+    RATE = 50
+    WINDOW = 0.2
+    RETRY_AFTER = 0.05
+
+    def __init__(self):
+        self.posts = defaultdict(list)
+        self.request_times = defaultdict(list)
+        self.tokens = set()
+        self.rate_limited = 0
+        self.server_errors = 0
+        self.rejected = 0
+
+    def __call__(self, request):
+        body = json.loads(request.content)
+        channel = body["channel"]
+        now = time.monotonic()
+        times = self.request_times[channel]
+        times.append(now)
+        self.tokens.add(request.headers["Authorization"])
+
+        # Like Slack, tolerate some jitter but not sustained bursts: allow at
+        # most RATE requests per second (plus a couple) in a sliding window.
+        recent = [t for t in times if now - t < self.WINDOW]
+        too_fast = len(recent) > self.RATE * self.WINDOW + 2
+        if self.rate_limited or too_fast:
+            self.rate_limited = max(self.rate_limited - 1, 0)
+            self.rejected += 1
+            return httpx.Response(429, headers={"Retry-After": str(self.RETRY_AFTER)})
+
+        if self.server_errors:
+            self.server_errors -= 1
+            self.rejected += 1
+            return httpx.Response(503)
+
+        if channel not in self.CHANNELS:
+            return httpx.Response(200, json={"ok": False, "error": "channel_not_found"})
+
+        self.posts[channel].append(body)
+        return httpx.Response(200, json={"ok": True})
+
+
+class FakeClock:
+    """A clock that only moves when the code under test sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.acquired = []
+
+    def __call__(self):
+        return self.now
+
+    async def run(self, bucket, count):
+        async def sleep(delay):
+            self.now += delay
+
+        original_sleep = asyncio.sleep
+        asyncio.sleep = sleep
+        try:
+            for _ in range(count):
+                await bucket.acquire()
+                self.acquired.append(self.now)
+        finally:
+            asyncio.sleep = original_sleep
+
+
+async def send(fake_slack, deliveries, **kwargs):
+    async with httpx.AsyncClient(transport=httpx.MockTransport(fake_slack)) as client:
+        sender = SlackSender(
+            "xoxb-test", client, rate=FakeSlack.RATE, burst=1, **kwargs
+        )
+        return await sender.send_many(deliveries)
+
+
+def message(annotations):
+    blocks = []
+    for i in range(annotations):
+        blocks += [
+            {"type": "section", "text": {"type": "mrkdwn", "text": str(i)}},
+            {"type": "divider"},
+        ]
+    blocks[-1] = {"type": "context", "elements": []}
+    return {"text": f"{annotations} new annotations", "blocks": blocks}
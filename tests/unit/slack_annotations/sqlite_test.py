@@ -0,0 +1,36 @@
+import pytest
+
+from slack_annotations.sqlite import connect, transaction
+
+
+def test_connect(connection):
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert connection.isolation_level is None
+
+
+class TestTransaction:
+    def test_it_commits(self, connection, tmp_path):
+        with transaction(connection):
+            connection.execute("INSERT INTO things VALUES (1)")
+
+        reader = connect(str(tmp_path / "test.db"))
+        try:
+            assert reader.execute("SELECT * FROM things").fetchall() == [(1,)]
+        finally:
+            reader.close()
+
+    def test_it_rolls_back_if_the_body_raises(self, connection):
+        with pytest.raises(RuntimeError), transaction(connection):
+            connection.execute("INSERT INTO things VALUES (1)")
+            raise RuntimeError()
+
+        assert not connection.in_transaction
+        assert not connection.execute("SELECT * FROM things").fetchall()
+
+
+@pytest.fixture
+def connection(tmp_path):
+    connection = connect(str(tmp_path / "test.db"))
+    connection.execute("CREATE TABLE things (thing INTEGER)")
+    yield connection
+    connection.close()
@@ -0,0 +1,149 @@
+import json
+import multiprocessing
+
+import pytest
+
+from slack_annotations.state import JSONFileStore, MemoryStore, SQLiteStore, open_store
+
+STATE = {"search_after": "2024-12-01T00:30:00+00:00", "id": "id_1"}
+
+
+class TestMemoryStore:
+    def test_it(self):
+        store = MemoryStore()
+
+        store.save("eng", STATE, ["id_1"])
+
+        assert store.load("eng") == STATE
+        assert not store.load("website")
+        assert store.deliveries["eng"] == ["id_1"]
+
+
+class TestJSONFileStore:
+    def test_it(self, tmp_path):
+        path = tmp_path / "cache.json"
+        store = JSONFileStore(str(path))
+
+        store.save("eng", STATE)
+
+        assert json.loads(path.read_text()) == STATE
+        assert store.load("eng") == STATE
+
+    def test_when_the_file_doesnt_exist(self, tmp_path):
+        assert JSONFileStore(str(tmp_path / "cache.json")).load("eng") == {}
+
+    def test_when_the_file_is_corrupt(self, tmp_path, caplog):
+        path = tmp_path / "cache.json"
+        path.write_text('{"search_after": "2024-')
+
+        assert JSONFileStore(str(path)).load("eng") == {}
+        assert "Ignoring unreadable state file" in caplog.text
+
+    def test_a_failed_write_leaves_the_file_intact(self, tmp_path, mocker):
+        path = tmp_path / "cache.json"
+        path.write_text(json.dumps(STATE))
+        mocker.patch("slack_annotations.state.dumps", side_effect=OSError)
+
+        with pytest.raises(OSError):
+            JSONFileStore(str(path)).save("eng", {"search_after": "new"})
+
+        assert json.loads(path.read_text()) == STATE
+        assert [p.name for p in tmp_path.iterdir()] == ["cache.json"]
+
+
+class TestSQLiteStore:
+    def test_it(self, store):
+        store.save("eng", STATE, ["id_1"])
+        store.save("website", {"search_after": "2024-12-01T00:40:00+00:00"})
+
+        assert store.load("eng") == STATE
+        assert store.load("website") == {"search_after": "2024-12-01T00:40:00+00:00"}
+        assert store.load("unknown") == {}
+        assert store.deliveries("eng") == ["id_1"]
+        assert store.deliveries("website") == []
+
+    def test_save_replaces_the_state_and_appends_to_the_log(self, store):
+        store.save("eng", STATE, ["id_1"])
+        store.save("eng", {"search_after": "2024-12-01T00:40:00+00:00"}, ["id_2"])
+
+        assert store.load("eng") == {"search_after": "2024-12-01T00:40:00+00:00"}
+        assert store.deliveries("eng") == ["id_1", "id_2"]
+
+    def test_it_uses_wal_mode(self, store):
+        assert (
+            store._connection.execute(  # pylint:disable=protected-access
+                "PRAGMA journal_mode"
+            ).fetchone()[0]
+            == "wal"
+        )
+
+    def test_a_failed_save_is_rolled_back(self, store):
+        store.save("eng", STATE, ["id_1"])
+
+        with pytest.raises(TypeError):
+            store.save("eng", {"search_after": object()}, ["id_2"])
+
+        assert store.load("eng") == STATE
+        assert store.deliveries("eng") == ["id_1"]
+
+    def test_concurrent_workers(self, tmp_path):
+        path = str(tmp_path / "state.sqlite")
+        SQLiteStore(path).close()
+
+        with multiprocessing.get_context("spawn").Pool(4) as pool:
+            pool.starmap(save_feeds, [(path, worker) for worker in range(4)])
+
+        store = SQLiteStore(path)
+        for worker in range(4):
+            for feed in range(25):
+                key = f"feed_{worker}_{feed}"
+                assert store.load(key) == {"search_after": str(feed)}
+                assert store.deliveries(key) == [f"id_{worker}_{feed}"]
+        store.close()
+
+    @pytest.fixture
+    def store(self, tmp_path):
+        store = SQLiteStore(str(tmp_path / "state.sqlite"))
+        yield store
+        store.close()
+
+
+class TestOpenStore:
+    @pytest.mark.parametrize(
+        "path,store_class",
+        [
+            (None, MemoryStore),
+            ("cache.json", JSONFileStore),
+            ("state.sqlite", SQLiteStore),
+            ("state.db", SQLiteStore),
+        ],
+    )
+    def test_it(self, tmp_path, path, store_class):
+        if path:
+            path = str(tmp_path / path)
+
+        store = open_store(path)
+
+        assert isinstance(store, store_class)
+        if isinstance(store, SQLiteStore):
+            store.close()
+
+    def test_it_shares_sqlite_stores(self, tmp_path):
+        path = str(tmp_path / "state.sqlite")
+
+        store = open_store(path)
+
+        assert open_store(path) is store
+        store.close()
+
+
+# This runs in the Pool's worker processes, which coverage doesn't measure.
+def save_feeds(path, worker):  # pragma: no cover
+    store = SQLiteStore(path)
+    for feed in range(25):
+        store.save(
+            f"feed_{worker}_{feed}",
+            {"search_after": str(feed)},
+            [f"id_{worker}_{feed}"],
+        )
+    store.close()